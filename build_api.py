@@ -0,0 +1,589 @@
+# build_api.py
+# 可重入的記憶體內建置 API：以設定物件與已載入的字體/映射建置字體，返回各格式的位元組。
+#   - 不修改傳入的字體與映射 (輸出字體從基礎字體的原始資料複製，char_mapping 使用副本)
+#   - 不寫入暫存檔；只在需要子集化時才匯入 fontTools.subset
+#   - verbose=False 時丟棄本線程在建置期間的輸出，其他線程不受影響
+#
+# 用法:
+#   config = BuildConfig(anno_scale=0.13, auto_height=True, flavors=("woff2",), verbose=False)
+#   fonts = build_font_bytes(config, base_font, anno_font, word_mapping, char_mapping)
+#   fonts["woff2"] -> bytes
+
+import hashlib
+import io
+import string
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from fontTools.ttLib import TTFont
+from chain_context_handler import buildChainSub
+from liga_handler import buildLiga
+from build_glyph import generate_glyphs
+from glyph_source import GLYPH_SOURCE_SIZE
+from pipeline import build_pipelined
+from shard_queue import build_sharded, SHARD_SIZE
+from mark_attachment import generate_mark_glyphs, buildMarkSub, buildMarkPos
+from schemes import buildSchemeSub, set_scheme_names, scheme_feature_tag, MAX_SCHEMES
+from build_profile import PhaseTimer
+from rule_analysis import PRUNE_SAFE
+from cff_source import is_cff_font, convert_cff_to_glyf, DEFAULT_CU2QU_MAX_ERR
+from variant_index import variant_index_files
+from checkpoint import checkpoint_key, source_digest, load_checkpoint, save_checkpoint, font_state, restore_font, GLYPH_MODULES, GSUB_MODULES
+from utils import get_glyph_name_by_char
+import build_log
+
+# ... (語言 ID 常量) ...
+WINDOWS_ENGLISH_IDS = (3, 1, 0x0409)
+MAC_ROMAN_IDS = (1, 0, 0)
+WINDOWS_CHINESE_SIMPLIFIED_IDS = (3, 1, 0x0804)
+WINDOWS_CHINESE_TAIWAN_IDS = (3, 1, 0x0404)
+WINDOWS_CHINESE_HONGKONG_IDS = (3, 1, 0x0C04)
+
+# build_log 的彙總訊息 (每個名稱記錄只計數)
+FAMILY_NAME_RECORDS = "Set the family name in {count} name records"
+
+# 可輸出的格式；woff/woff2 由編碼好的 TTF 產生
+FLAVORS = ("ttf", "woff", "woff2")
+
+# 子集化時額外保留的標點與字母
+CHARS_TO_KEEP_ADDITIONALLY = string.punctuation + string.ascii_letters + '丅，。！？《》（）「」『』｛｝〖〗【】［］、……——＠＃￥％＆＊+-/“”：；‘’／０１２３４５６７８９ａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ'
+
+
+@dataclass
+class BuildConfig:
+    """建置參數，欄位與 main() 的同名參數相同"""
+    en_name: str = None
+    cn_name: str = None
+    tw_name: str = None
+    hk_name: str = None
+    base_scale: float = 0.60
+    anno_scale: float = 0.35
+    anno_y_offset: float = 0.70
+    base_y_offset: float = 0.0
+    base_rotate: float = 0.0
+    anno_rotate: float = 0.0
+    min_lsb: int = None
+    optimize: bool = False
+    clear_layout: bool = False
+    invert: bool = False
+    fit: bool = False
+    fit_padding: float = 0.03
+    anno_spacing: float = -0.03
+    auto_width: bool = False
+    auto_height: bool = False
+    top_padding_percent: float = None
+    bottom_padding_percent: float = None
+    prune_word_rules: str = PRUNE_SAFE
+    jobs: int = 1
+    cu2qu_max_err: float = DEFAULT_CU2QU_MAX_ERR
+    simplify_tolerance: float = None
+    mark_attachment: bool = False
+    group_variants: bool = False
+    glyph_source_size: int = GLYPH_SOURCE_SIZE
+    max_word_rules: int = None
+    max_word_rule_bytes: int = None
+    scheme_label: str = None
+    top_chars: int = None
+    shard_queue: str = None
+    shard_size: int = SHARD_SIZE
+    checkpoint_dir: str = None
+    qa: bool = False
+    qa_report: str = None
+    variant_index: bool = False
+    flavors: tuple = ("ttf", "woff")
+    verbose: bool = True
+
+    def layout_options(self):
+        """generate_glyphs / build_pipelined 的排版參數"""
+        options = asdict(self)
+        for key in ("en_name", "cn_name", "tw_name", "hk_name", "optimize", "clear_layout",
+                    "prune_word_rules", "jobs", "cu2qu_max_err", "mark_attachment", "group_variants",
+                    "max_word_rules", "max_word_rule_bytes", "scheme_label", "top_chars", "shard_queue", "shard_size", "checkpoint_dir", "qa", "qa_report", "variant_index", "flavors", "verbose"):
+            del options[key]
+        return options
+
+
+class _ThreadQuietStream:
+    """包裝 sys.stdout：設定為安靜的線程寫入的內容被丟棄，其他線程照常輸出"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        if getattr(self.local, "quiet", False):
+            return len(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_quiet_lock = threading.Lock()
+
+# 建置時讀取的輸入字體表格；TTFont 的延遲載入不是線程安全的，共用的輸入字體在建置前先在鎖內載入
+# (glyf 中的字形保持未解碼，繪製時由每次建置各自的 GlyphSource 解碼副本)
+INPUT_TABLES = ('head', 'hhea', 'maxp', 'OS/2', 'post', 'cmap', 'glyf', 'hmtx', 'vmtx')
+
+_input_lock = threading.Lock()
+
+
+@contextmanager
+def _quiet(enabled):
+    if not enabled:
+        yield
+        return
+    with _quiet_lock:
+        if not isinstance(sys.stdout, _ThreadQuietStream):
+            sys.stdout = _ThreadQuietStream(sys.stdout)
+        stream = sys.stdout
+    previous = getattr(stream.local, "quiet", False)
+    stream.local.quiet = True
+    try:
+        yield
+    finally:
+        stream.local.quiet = previous
+
+
+def set_family_names(font, name_map):
+    table = font["name"]
+    name_ids = (1, 4, 6, 16)
+
+    for (plat_id, enc_id, lang_id), new_family_name in name_map.items():
+        if new_family_name is None:
+            continue
+
+        for name_id in name_ids:
+            old_name_rec = table.getName(
+                nameID=name_id,
+                platformID=plat_id,
+                platEncID=enc_id,
+                langID=lang_id,
+            )
+
+            lang_str = f"P:{plat_id}/E:{enc_id}/L:{hex(lang_id)}"
+            old_name = old_name_rec.toUnicode() if old_name_rec else "N/A"
+            build_log.count(FAMILY_NAME_RECORDS, record=lang_str, name_id=name_id, old=old_name, new=new_family_name)
+
+            table.setName(
+                new_family_name,
+                nameID=name_id,
+                platformID=plat_id,
+                platEncID=enc_id,
+                langID=lang_id,
+            )
+    build_log.summarize()
+
+
+def family_name_map(config):
+    # 創建名稱映射字典
+    name_map = {}
+    if config.en_name is not None:
+        name_map[WINDOWS_ENGLISH_IDS] = config.en_name
+        name_map[MAC_ROMAN_IDS] = config.en_name
+    if config.cn_name is not None:
+        name_map[WINDOWS_CHINESE_SIMPLIFIED_IDS] = config.cn_name
+    if config.tw_name is not None:
+        name_map[WINDOWS_CHINESE_TAIWAN_IDS] = config.tw_name
+    if config.hk_name is not None:
+        name_map[WINDOWS_CHINESE_HONGKONG_IDS] = config.hk_name
+    return name_map
+
+
+def _font_data(font):
+    """返回字體的原始檔案資料；沒有原始檔案 (在記憶體中建立) 時編碼一份，不重新計算原字體的邊界與時間戳"""
+    reader = font.reader
+    if reader is not None and not reader.file.closed:
+        with _input_lock:
+            pos = reader.file.tell()
+            reader.file.seek(0)
+            data = reader.file.read()
+            reader.file.seek(pos)
+        return data
+    flags = (font.recalcBBoxes, font.recalcTimestamp)
+    font.recalcBBoxes = font.recalcTimestamp = False
+    try:
+        buf = io.BytesIO()
+        font.save(buf)
+    finally:
+        font.recalcBBoxes, font.recalcTimestamp = flags
+    return buf.getvalue()
+
+
+def _load_input_tables(font):
+    with _input_lock:
+        font.getGlyphOrder()
+        for tag in INPUT_TABLES:
+            if tag in font:
+                font[tag]
+        font.getReverseGlyphMap()
+        font.getBestCmap()
+
+
+def copy_font(font, cu2qu_max_err=DEFAULT_CU2QU_MAX_ERR):
+    """從原始資料重新載入字體作為輸出字體；CFF 字體以相同的快取轉換為 glyf"""
+    data = _font_data(font)
+    output_font = TTFont(io.BytesIO(data))
+    if is_cff_font(output_font):
+        convert_cff_to_glyf(output_font, None, cu2qu_max_err, verbose=False, digest=hashlib.sha1(data).hexdigest())
+    return output_font
+
+
+def copy_char_mapping(char_mapping):
+    # generate_glyphs 會把 {註音: None} 填為 (字形名稱, 索引)，每次建置使用新的副本
+    return {char: dict.fromkeys(annos) for char, annos in char_mapping.items()}
+
+
+def subset_font(output_font, base_font, char_mapping, clear_layout=False, scheme_char_mappings=()):
+    """
+    只保留數字、註音字形與常用標點字母；scheme_char_mappings 為附加方案的 char_mapping。
+    在繪製前呼叫時 (char_mapping 的值尚未填入) 只保留相應的基礎字形 (--top-chars)。
+    """
+    from fontTools import subset
+
+    build_log.info("Optimizing font size by subsetting...")
+    glyphs_to_be_kept = [get_glyph_name_by_char(base_font, str(i)) for i in range(0, 10)]
+
+    for char, value in char_mapping.items():
+        # --marks 模式中 char_mapping 的值是標記字形，基礎字形另外保留
+        glyphs_to_be_kept.append(get_glyph_name_by_char(base_font, char))
+        for glyph_name, idx in filter(None, value.values()):
+            glyphs_to_be_kept.append(glyph_name)
+    for scheme_chars in scheme_char_mappings:
+        for value in scheme_chars.values():
+            glyphs_to_be_kept.extend(glyph_name for glyph_name, idx in filter(None, value.values()))
+
+    build_log.debug(f"Keeping additional {len(CHARS_TO_KEEP_ADDITIONALLY)} punctuation and letter glyphs...")
+    for char in CHARS_TO_KEEP_ADDITIONALLY:
+        glyph_name = get_glyph_name_by_char(base_font, char)
+        if glyph_name:
+            glyphs_to_be_kept.append(glyph_name)
+
+    options = subset.Options()
+    if scheme_char_mappings:
+        options.layout_features += [scheme_feature_tag(index) for index in range(len(scheme_char_mappings) + 1)]
+
+    if clear_layout:
+        build_log.warning("Clearing layout features to resolve potential FeatureParams error.")
+        options.layout_features = []
+
+    subsetter = subset.Subsetter(options=options)
+
+    valid_glyphs_to_keep = list(set(g for g in glyphs_to_be_kept if g is not None))
+    build_log.info(f"Total unique glyphs to keep: {len(valid_glyphs_to_keep)}")
+
+    subsetter.populate(glyphs=valid_glyphs_to_keep)
+    subsetter.subset(output_font)
+
+
+def encode_flavors(output_font, flavors):
+    """只編碼一次 TTF，WOFF/WOFF2 直接從編碼好的表格資料產生，不再重新編譯表格；返回 {flavor: bytes}"""
+    buf = io.BytesIO()
+    output_font.save(buf)
+    ttf_data = buf.getvalue()
+
+    fonts = {}
+    for flavor in flavors:
+        if flavor == "ttf":
+            fonts[flavor] = ttf_data
+            continue
+        flavored_font = TTFont(io.BytesIO(ttf_data), recalcBBoxes=False, recalcTimestamp=False)
+        flavored_font.flavor = flavor
+        buf = io.BytesIO()
+        flavored_font.save(buf)
+        flavored_font.close()
+        fonts[flavor] = buf.getvalue()
+    return fonts
+
+
+def write_outputs(fonts, output_prefix):
+    for flavor, data in fonts.items():
+        with open(f"{output_prefix}.{flavor}", 'wb') as f:
+            f.write(data)
+        if flavor in FLAVORS:
+            build_log.info(f"New font saved as {output_prefix}.{flavor}")
+        else:
+            build_log.info(f"Variant index saved as {output_prefix}.{flavor}")
+
+
+def _checkpoint_keys(config, base_font, anno_font, word_mapping, char_mapping, word_weights, schemes):
+    """返回 (glyphs 檢查點的鍵, gsub 檢查點的鍵)；char_mapping 與 schemes 為尚未填入字形名稱的副本"""
+    glyph_key = checkpoint_key(
+        "glyphs",
+        hashlib.sha1(_font_data(base_font)).hexdigest(),
+        hashlib.sha1(_font_data(anno_font)).hexdigest(),
+        config.layout_options(),
+        sorted(family_name_map(config).items()),
+        config.cu2qu_max_err,
+        config.mark_attachment,
+        config.group_variants,
+        config.top_chars,
+        config.clear_layout if config.top_chars else None,
+        # 註音的順序決定變體編號，以列表而不是 dict 序列化
+        [(char, list(annos)) for char, annos in char_mapping.items()],
+        [(feature_tag, [(char, list(annos)) for char, annos in scheme_chars.items()])
+         for feature_tag, _, scheme_chars in schemes],
+        source_digest(GLYPH_MODULES),
+    )
+    gsub_key = checkpoint_key(
+        "gsub",
+        glyph_key,
+        list(word_mapping.items()),
+        sorted((word_weights or {}).items()),
+        config.prune_word_rules,
+        config.max_word_rules,
+        config.max_word_rule_bytes,
+        build_log.wants_detail(),  # 列出詞組規則 (--debug) 時不沿用沒有列出規則的檢查點
+        [list(scheme_words.items()) for _, scheme_words, _ in schemes],
+        source_digest(GSUB_MODULES),
+    )
+    return glyph_key, gsub_key
+
+
+def _save_checkpoint(checkpoint_dir, phase, key, output_font, char_mapping, schemes, marks=None, tables=None):
+    state = font_state(output_font, tables)
+    state.update(
+        char_mapping=char_mapping,
+        scheme_chars=[scheme_chars for _, _, scheme_chars in schemes],
+        marks=marks,
+    )
+    save_checkpoint(checkpoint_dir, phase, key, state)
+
+
+def _build_layout(config, output_font, word_mapping, char_mapping, schemes, word_rule_options, marks=None):
+    """在繪製後的字體中加入 GSUB (--marks 時還有 GPOS)；marks 為 generate_mark_glyphs 的結果"""
+    if config.mark_attachment:
+        _, mark_glyphs, anchors = marks
+        buildMarkSub(output_font, word_mapping, char_mapping, prune_word_rules=config.prune_word_rules,
+                     **word_rule_options)
+        buildMarkPos(output_font, mark_glyphs, anchors)
+        return
+
+    # 附加方案的 lookups 須位於主映射之前
+    for feature_tag, scheme_words, scheme_chars in schemes:
+        buildSchemeSub(output_font, feature_tag, scheme_words, scheme_chars,
+                       prune_word_rules=config.prune_word_rules, **word_rule_options)
+
+    # Build Chain Contextual Substitution
+    buildChainSub(output_font, word_mapping, char_mapping, prune_word_rules=config.prune_word_rules,
+                  **word_rule_options)
+
+    # Replace glyph by new glyph using liga
+    buildLiga(output_font, char_mapping)
+
+
+def _draw_glyphs(config, base_font, anno_font, output_font, word_mapping, char_mapping, schemes,
+                 word_rule_options, timer, glyph_cache, font_files, checkpoint=None):
+    """
+    繪製輪廓並加入 GSUB (-j / --shard-queue 時兩者並行)。
+    checkpoint: (目錄, "glyphs", 鍵)，繪製完成後保存檢查點。
+    """
+    if config.mark_attachment:
+        if config.jobs > 1 or glyph_cache is not None or config.shard_queue:
+            build_log.info("--marks draws each base glyph and reading once in this process; -j, --shard-queue and the outline cache are not used.")
+        if config.group_variants:
+            build_log.info("--marks adds no per-character variants, --group-variants is not used.")
+        with timer.phase("generate_glyphs"):
+            marks = generate_mark_glyphs(
+                base_font,
+                anno_font,
+                output_font,
+                char_mapping,
+                **config.layout_options()
+            )
+        if checkpoint:
+            with timer.phase("checkpoint"):
+                _save_checkpoint(*checkpoint, output_font, char_mapping, schemes, marks=marks)
+
+        with timer.phase("gsub"):
+            _build_layout(config, output_font, word_mapping, char_mapping, schemes, word_rule_options, marks)
+        return
+
+    parallel_options = dict(
+        jobs=config.jobs,
+        prune_word_rules=config.prune_word_rules,
+        encode_gsub=not (config.optimize or config.top_chars),
+        cu2qu_max_err=config.cu2qu_max_err,
+        group_variants=config.group_variants,
+        word_rule_options=word_rule_options,
+    )
+    if glyph_cache is None and font_files is not None and not schemes and (config.shard_queue or config.jobs > 1):
+        # GSUB 與輪廓並行建立，glyphs 檢查點使用繪製前的 GSUB
+        original_gsub = output_font.getTableData("GSUB") if checkpoint and "GSUB" in output_font else None
+        if config.shard_queue:
+            # 輪廓由共用佇列中的分片任務繪製 (計時記為 "sharded")
+            with timer.phase("sharded"):
+                build_sharded(
+                    config.shard_queue,
+                    font_files[0],
+                    font_files[1],
+                    base_font,
+                    output_font,
+                    word_mapping,
+                    char_mapping,
+                    shard_size=config.shard_size,
+                    **parallel_options,
+                    **config.layout_options()
+                )
+        else:
+            # 輪廓繪製與 GSUB 並行 (計時記為 "pipeline"，不混入單線程的階段速率)
+            with timer.phase("pipeline"):
+                build_pipelined(
+                    font_files[0],
+                    font_files[1],
+                    base_font,
+                    output_font,
+                    word_mapping,
+                    char_mapping,
+                    **parallel_options,
+                    **config.layout_options()
+                )
+        if checkpoint:
+            with timer.phase("checkpoint"):
+                _save_checkpoint(*checkpoint, output_font, char_mapping, schemes, tables={"GSUB": original_gsub})
+        return
+
+    if schemes and (config.jobs > 1 or config.shard_queue):
+        build_log.info("Multiple mapping schemes are drawn in this process; -j only applies to CFF conversion and --shard-queue is not used.")
+    # Combine the glyphs and save the new font
+    with timer.phase("generate_glyphs"):
+        generate_glyphs(
+            base_font,
+            anno_font,
+            output_font,
+            char_mapping,
+            glyph_cache=glyph_cache,
+            group_variants=config.group_variants,
+            extra_schemes=[(feature_tag, scheme_chars) for feature_tag, _, scheme_chars in schemes],
+            **config.layout_options()
+        )
+    if checkpoint:
+        with timer.phase("checkpoint"):
+            _save_checkpoint(*checkpoint, output_font, char_mapping, schemes)
+
+    with timer.phase("gsub"):
+        _build_layout(config, output_font, word_mapping, char_mapping, schemes, word_rule_options)
+
+
+def build_font_bytes(config, base_font, anno_font, word_mapping, char_mapping,
+                     timer=None, glyph_cache=None, font_files=None, word_weights=None, extra_schemes=None):
+    """
+    以已載入的字體與映射建置字體，返回 {flavor: bytes} (按 config.flavors 的順序)；
+    config.variant_index 時另外包含讀音選擇索引 {"variants.bin": bytes, "variants.json": bytes, "ss02.variants.bin": ...}。
+    傳入的字體與映射不會被修改，可在同一組輸入上重複呼叫或在多個線程中同時呼叫。
+    glyph_cache: 跨次建置沿用的輪廓快取 (見 generate_glyphs)，在本線程繪製。
+    font_files: (base_font_file, anno_font_file)；config.jobs > 1 或 config.shard_queue 且沒有 glyph_cache 時，繪製進程從這兩個檔案載入字體。
+    word_weights: {詞組: 權重} (load_mapping 填入)，用於 config.max_word_rules / max_word_rule_bytes 的排序；沒有時權重均為 1。
+    extra_schemes: [(名稱, word_mapping, char_mapping), ...] 附加的映射方案，以 ss02.. 切換 (主映射為 ss01，名稱為 config.scheme_label)。
+    config.checkpoint_dir: 繪製與 GSUB 後保存檢查點，並從輸入相同的檢查點繼續 (見 checkpoint.py)；有 glyph_cache 時不使用。
+    config.qa / qa_report: 子集化前檢查字形的重疊、溢出與垂直度量 (見 glyph_qa.py)，qa_report 為完整報告的 CSV 檔案。
+    """
+    unknown = [flavor for flavor in config.flavors if flavor not in FLAVORS]
+    if unknown:
+        raise ValueError(f"Unknown output flavors {unknown}, expected some of {FLAVORS}")
+    for font in (base_font, anno_font):
+        if is_cff_font(font):
+            raise ValueError("CFF fonts must be converted first, load them with cff_source.load_font()")
+    if extra_schemes:
+        if config.mark_attachment:
+            raise ValueError("Extra mapping schemes are not supported in mark attachment mode")
+        if len(extra_schemes) + 1 > MAX_SCHEMES:
+            raise ValueError(f"At most {MAX_SCHEMES} mapping schemes (ss01-ss{MAX_SCHEMES:02d}) are supported")
+
+    if timer is None:
+        timer = PhaseTimer()
+    _load_input_tables(base_font)
+    _load_input_tables(anno_font)
+
+    with _quiet(not config.verbose):
+        char_mapping = copy_char_mapping(char_mapping)
+        schemes = [(scheme_feature_tag(index), scheme_words, copy_char_mapping(scheme_chars))
+                   for index, (_, scheme_words, scheme_chars) in enumerate(extra_schemes or (), 1)]
+
+        word_rule_options = dict(
+            word_weights=word_weights,
+            max_word_rules=config.max_word_rules,
+            max_word_rule_bytes=config.max_word_rule_bytes
+        )
+
+        # 從輸入仍然相同的最後一個檢查點繼續 (見 checkpoint.py)；沿用輪廓快取時不使用檢查點
+        checkpoint_dir = config.checkpoint_dir if glyph_cache is None else None
+        resumed, state = None, None
+        if checkpoint_dir:
+            glyph_key, gsub_key = _checkpoint_keys(config, base_font, anno_font, word_mapping, char_mapping,
+                                                   word_weights, schemes)
+            for phase, key in (("gsub", gsub_key), ("glyphs", glyph_key)):
+                state = load_checkpoint(checkpoint_dir, phase, key)
+                if state is not None:
+                    resumed = phase
+                    break
+
+        if state is not None:
+            build_log.info(f"Resuming from the {resumed} checkpoint in {checkpoint_dir}.")
+            with timer.phase("resume"):
+                output_font = restore_font(state)
+            char_mapping = state["char_mapping"]
+            schemes = [(feature_tag, scheme_words, scheme_chars) for (feature_tag, scheme_words, _), scheme_chars
+                       in zip(schemes, state["scheme_chars"])]
+            if resumed == "glyphs":
+                with timer.phase("gsub"):
+                    _build_layout(config, output_font, word_mapping, char_mapping, schemes, word_rule_options,
+                                  state["marks"])
+        else:
+            with timer.phase("load_fonts"):
+                output_font = copy_font(base_font, config.cu2qu_max_err)
+
+            name_map = family_name_map(config)
+            if name_map:
+                set_family_names(output_font, name_map)
+
+            if config.top_chars:
+                # 映射已限制為最常用的字：先子集化，沒有註音的字形也只繪製保留的部分
+                with timer.phase("subset"):
+                    subset_font(output_font, base_font, char_mapping, config.clear_layout,
+                                [scheme_chars for _, _, scheme_chars in schemes])
+
+            _draw_glyphs(config, base_font, anno_font, output_font, word_mapping, char_mapping, schemes,
+                         word_rule_options, timer, glyph_cache, font_files,
+                         (checkpoint_dir, "glyphs", glyph_key) if checkpoint_dir else None)
+
+        if checkpoint_dir and resumed != "gsub":
+            with timer.phase("checkpoint"):
+                _save_checkpoint(checkpoint_dir, "gsub", gsub_key, output_font, char_mapping, schemes)
+
+        if config.qa or config.qa_report:
+            if config.mark_attachment:
+                build_log.info("--qa checks the merged annotated glyphs and is skipped with --marks.")
+            else:
+                # 只在需要時才匯入 NumPy
+                from glyph_qa import run_qa
+                with timer.phase("qa"):
+                    run_qa(base_font, anno_font, output_font,
+                           [char_mapping] + [scheme_chars for _, _, scheme_chars in schemes],
+                           config.layout_options(), config.qa_report)
+
+        # 讀音選擇索引 (見 variant_index.py)，與 buildLiga 使用相同的 char_mapping
+        index_files = {}
+        if config.variant_index:
+            index_files = variant_index_files(output_font, [(None, char_mapping)] +
+                                              [(feature_tag, scheme_chars) for feature_tag, _, scheme_chars in schemes])
+
+        # if size optimization is required
+        if config.optimize or config.top_chars:
+            with timer.phase("subset"):
+                subset_font(output_font, base_font, char_mapping, config.clear_layout,
+                            [scheme_chars for _, _, scheme_chars in schemes])
+
+        # 在子集化之後加入，使沒有 lookup 的 ss01 與方案名稱不被移除
+        if schemes:
+            set_scheme_names(output_font, [config.scheme_label or "Default"] + [label for label, _, _ in extra_schemes])
+
+        with timer.phase("save"):
+            fonts = encode_flavors(output_font, config.flavors)
+        fonts.update(index_files)
+        output_font.close()
+    return fonts
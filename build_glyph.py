@@ -3,7 +3,11 @@ from fontTools.pens.ttGlyphPen import TTGlyphPen
 from fontTools.pens.transformPen import TransformPen
 from fontTools.pens.boundsPen import BoundsPen
 from utils import get_glyph_name_by_char
+from outline_simplify import simplify_glyph, simplifying_pen
+from glyph_source import GlyphSource, GLYPH_SOURCE_SIZE, glyph_source_report
 import math
+import pickle
+import build_log
 
 GLYPH_PREFIX = "wingfont"
 
@@ -53,8 +57,50 @@ def _get_string_relative_bounds(font, glyph_set, glyph_order, text, scale, cos,
         return bounds[1], bounds[3] 
     return 0, 0 
 
-def generate_glyphs(
-    base_font, anno_font, output_font, mapping, 
+def measure_anno_string(anno_font, anno_glyph_set, anno_glyph_order, anno_str, anno_scale, anno_cos, anno_sin, spacing_in_units, anno_bPen):
+    """模擬繪製註音字串 (未壓縮、未平移)，返回其相對邊界 (xMin, yMin, xMax, yMax) 或 None"""
+    anno_bPen.bounds = None
+    x_pos_rel_local, y_pos_rel_local = 0, 0
+    
+    for idx, char in enumerate(anno_str):
+        anno_glyph_name = get_glyph_name_by_char(anno_font, char)
+        if isinstance(anno_glyph_name, str) and anno_glyph_name in anno_glyph_set:
+            transform_rel_local = (
+                anno_scale * anno_cos, anno_scale * anno_sin,
+                -anno_scale * anno_sin, anno_scale * anno_cos,
+                x_pos_rel_local, y_pos_rel_local
+            )
+            anno_glyph_set[anno_glyph_name].draw(TransformPen(anno_bPen, transform_rel_local))
+            
+            if anno_glyph_name in anno_glyph_order:
+                advance_width_scaled = round(anno_font['hmtx'][anno_glyph_name][0] * anno_scale)
+                x_pos_rel_local += advance_width_scaled * anno_cos
+                y_pos_rel_local += advance_width_scaled * anno_sin
+                if idx < len(anno_str) - 1:
+                    x_pos_rel_local += (spacing_in_units * anno_scale) * anno_cos
+                    y_pos_rel_local += (spacing_in_units * anno_scale) * anno_sin
+
+    return anno_bPen.bounds
+
+def compute_final_dy(y_offset_anno_orig, y_offset_base_orig, invert,
+                     anno_bottom_rel, anno_top_rel, base_bottom_rel, base_top_rel):
+    """根據全局參考邊界計算基礎字形與註音的最終 DY 偏移量，返回 (final_base_dy, final_anno_dy)"""
+    anno_was_above = y_offset_anno_orig > y_offset_base_orig
+    final_base_dy = y_offset_base_orig
+    final_anno_dy = y_offset_anno_orig
+    
+    if invert:
+        if anno_was_above:
+            final_anno_dy = y_offset_base_orig + base_bottom_rel - anno_bottom_rel
+            final_base_dy = y_offset_anno_orig + anno_top_rel - base_top_rel
+        else:
+            final_anno_dy = y_offset_base_orig + base_top_rel - anno_top_rel
+            final_base_dy = y_offset_anno_orig + anno_bottom_rel - base_bottom_rel
+    
+    return final_base_dy, final_anno_dy
+
+def prepare_layout(
+    base_font, anno_font, output_glyph_set,
     anno_scale=0.35, base_scale=0.60, 
     anno_y_offset=0.70, base_y_offset=0.0,
     base_rotate=0.0, anno_rotate=0.0,
@@ -65,24 +111,22 @@ def generate_glyphs(
     anno_spacing=-0.03,
     auto_width=False,
     auto_height=False,
-    top_padding_percent=None,
-    bottom_padding_percent=None
+    simplify_tolerance=None,
+    glyph_source_size=GLYPH_SOURCE_SIZE,
+    verbose=True
 ):
-    output_glyph_name_used = {}
-    
-    base_glyph_set = base_font.getGlyphSet()
-    anno_glyph_set = anno_font.getGlyphSet()
-    output_glyph_set = output_font.getGlyphSet()
+    """
+    步驟 A-E：計算所有字形共用的排版參數，返回供 draw_* 函數使用的 layout 字典。
+    輸入字體的字形經由 GlyphSource 讀取，最多保留 glyph_source_size 個已解碼字形。
+    """
+    base_glyph_set = GlyphSource(base_font, glyph_source_size)
+    anno_glyph_set = GlyphSource(anno_font, glyph_source_size)
 
     anno_glyph_order = anno_font.getGlyphOrder()
     base_glyph_order = base_font.getGlyphOrder()
     
     base_units_per_em = base_font['head'].unitsPerEm
     anno_units_per_em = anno_font['head'].unitsPerEm
-    
-    # 追蹤整套字體的最高點與最低點 (用於 auto_height)
-    global_max_y = -99999
-    global_min_y = 99999
 
     # --- 步驟 A: 計算原始偏移量 (單位) ---
     y_offset_anno_orig = round(base_units_per_em * anno_y_offset) 
@@ -91,16 +135,19 @@ def generate_glyphs(
     # 字符間距 (單位)
     spacing_in_units = anno_units_per_em * anno_spacing
 
-    if invert:
-        print("[INFO] Inverting annotation and base glyph vertical positions.")
-    if fit:
-        print(f"[INFO] Horizontal fitting ENABLED with {fit_padding*100:.0f}% padding.")
-    if auto_width:
-        print(f"[INFO] Auto-width ENABLED: Base width will expand if annotation is too long.")
-    if auto_height:
-        print(f"[INFO] Auto-height ENABLED: Font vertical metrics will be adjusted if glyphs exceed bounds.")
-    if anno_spacing != 0:
-        print(f"[INFO] Spacing between annotation characters: {anno_spacing*100:.0f}%.")
+    if verbose:
+        if invert:
+            build_log.info("Inverting annotation and base glyph vertical positions.")
+        if fit:
+            build_log.info(f"Horizontal fitting ENABLED with {fit_padding*100:.0f}% padding.")
+        if auto_width:
+            build_log.info(f"Auto-width ENABLED: Base width will expand if annotation is too long.")
+        if auto_height:
+            build_log.info(f"Auto-height ENABLED: Font vertical metrics will be adjusted if glyphs exceed bounds.")
+        if anno_spacing != 0:
+            build_log.info(f"Spacing between annotation characters: {anno_spacing*100:.0f}%.")
+        if simplify_tolerance:
+            build_log.info(f"Outline simplification ENABLED with {simplify_tolerance:g} units tolerance.")
 
     # --- 步驟 B: 計算旋轉和縮放矩陣 ---
     base_rad = math.radians(base_rotate)
@@ -132,35 +179,117 @@ def generate_glyphs(
         REF_BASE_CHAR = "一" # U+4E00
         ref_base_glyph_name = get_glyph_name_by_char(base_font, REF_BASE_CHAR)
         if not isinstance(ref_base_glyph_name, str):
-             print(f"[ERROR] Cannot find reference glyph. Using (0,0) bounds.")
+             if verbose:
+                 build_log.error(f"Cannot find reference glyph. Using (0,0) bounds.")
              ref_base_glyph_name = None 
     
-    print(f"[INFO] Global Refs: Anno='{REF_ANNO_STR}', Base='{REF_BASE_CHAR}'")
+    if verbose:
+        build_log.info(f"Global Refs: Anno='{REF_ANNO_STR}', Base='{REF_BASE_CHAR}'")
     GLOBAL_BASE_BOTTOM_REL, GLOBAL_BASE_TOP_REL = _get_relative_bounds(
         base_glyph_set, ref_base_glyph_name, base_transform_rel
     )
 
     # --- 步驟 E: 計算最終 DY 偏移量 ---
-    anno_was_above = y_offset_anno_orig > y_offset_base_orig
-    final_base_dy = y_offset_base_orig
-    final_anno_dy = y_offset_anno_orig
-    
-    if invert:
-        if anno_was_above:
-            final_anno_dy = y_offset_base_orig + GLOBAL_BASE_BOTTOM_REL - GLOBAL_ANNO_BOTTOM_REL
-            final_base_dy = y_offset_anno_orig + GLOBAL_ANNO_TOP_REL - GLOBAL_BASE_TOP_REL
+    final_base_dy, final_anno_dy = compute_final_dy(
+        y_offset_anno_orig, y_offset_base_orig, invert,
+        GLOBAL_ANNO_BOTTOM_REL, GLOBAL_ANNO_TOP_REL,
+        GLOBAL_BASE_BOTTOM_REL, GLOBAL_BASE_TOP_REL
+    )
+
+    return {
+        "base_font": base_font,
+        "anno_font": anno_font,
+        "base_glyph_set": base_glyph_set,
+        "anno_glyph_set": anno_glyph_set,
+        "output_glyph_set": output_glyph_set,
+        "anno_glyph_order": set(anno_glyph_order),
+        "base_scale": base_scale,
+        "anno_scale": anno_scale,
+        "base_cos": base_cos,
+        "base_sin": base_sin,
+        "anno_cos": anno_cos,
+        "anno_sin": anno_sin,
+        "base_transform_rel": base_transform_rel,
+        "spacing_in_units": spacing_in_units,
+        "final_base_dy": final_base_dy,
+        "final_anno_dy": final_anno_dy,
+        "final_unannotated_dy": final_base_dy,
+        "min_lsb": min_lsb,
+        "fit": fit,
+        "fit_padding": fit_padding,
+        "auto_width": auto_width,
+        "simplify_tolerance": simplify_tolerance,
+        "base_bPen": base_bPen,
+        "anno_bPen": anno_bPen,
+    }
+
+def find_cmap_aliases(base_font, mapping):
+    """
+    cmap 中多個碼位可能指向同一個字形 (例如相容漢字)。按基礎字形與有序的讀音分組映射中的字，返回 (aliases, conflicts)：
+      aliases:   {char: 代表字}，讀音與之前某個指向同一字形的字完全相同，直接共用其變體字形
+      conflicts: {glyph_name: [char, ...]}，指向同一字形但讀音不同的字，每組讀音各自生成變體
+    """
+    first_char = {}
+    chars_by_glyph = {}
+    aliases = {}
+    for char, anno_strs in mapping.items():
+        glyph_name = get_glyph_name_by_char(base_font, char)
+        if not isinstance(glyph_name, str):
+            continue
+        key = (glyph_name, tuple(anno_strs))
+        if key in first_char:
+            aliases[char] = first_char[key]
         else:
-            final_anno_dy = y_offset_base_orig + GLOBAL_BASE_TOP_REL - GLOBAL_ANNO_TOP_REL
-            final_base_dy = y_offset_anno_orig + GLOBAL_ANNO_BOTTOM_REL - GLOBAL_BASE_BOTTOM_REL
-    
-    final_unannotated_dy = final_base_dy
+            first_char[key] = char
+            chars_by_glyph.setdefault(glyph_name, []).append(char)
+    conflicts = {glyph_name: chars for glyph_name, chars in chars_by_glyph.items() if len(chars) > 1}
+    return aliases, conflicts
 
-    # --- 第一部分：處理有註音的字形 ---
-    processed_chars = set(mapping.keys())
+def report_cmap_aliases(mapping, aliases, conflicts, limit=5):
+    if aliases:
+        build_log.info(f"{len(aliases)} code points share a glyph and readings with another mapped character, reusing its variants.")
+    if conflicts:
+        build_log.info(f"{len(conflicts)} glyphs are shared by code points with different readings, each reading set gets its own variants:")
+        for glyph_name, chars in list(conflicts.items())[:limit]:
+            readings = " / ".join(f"U+{ord(char):04X} {char} ({', '.join(mapping[char])})" for char in chars)
+            build_log.info(f"  {glyph_name}: {readings}")
+        if len(conflicts) > limit:
+            build_log.info(f"  ... and {len(conflicts) - limit} more")
+
+def assign_glyph_names(base_font, output_font, mapping, group_variants=False):
+    """
+    為每個 (字, 註音) 分配輸出字形名稱，不繪製任何輪廓。
+    mapping 的值會被填為 (glyph_name, variant_index)，cmap 指向 variant 0，
+    新名稱按順序加入輸出字體的 glyph order (與逐個寫入 glyf 時的順序相同)。
+    group_variants: 新名稱改為緊接在其基礎字形之後，每個字的變體佔一段連續的 GID。
+    指向同一字形、讀音也相同的字 (cmap 別名) 共用代表字的變體，不另外繪製。
+    返回 (plan, processed_glyph_names)；plan 為 [(base_char, glyph_name, [(anno_str, new_glyph_name, i), ...]), ...]
+    """
+    output_glyph_name_used = {}
+    base_glyph_set = base_font.getGlyphSet()
+    base_glyph_order = set(base_font.getGlyphOrder())
+    output_glyph_order = output_font.getGlyphOrder()
+    output_glyph_order_set = set(output_glyph_order)
+    output_font['glyf']  # glyf 的 glyph order 與字體共用，須在加入新名稱前載入
+    original_glyph_count = len(output_glyph_order)
+    if group_variants:
+        # 以 GID 儲存的資料 (組合字形的元件、各表格) 須在重排 glyph order 前以原順序解碼
+        output_font.ensureDecompiled()
+
+    plan = []
     processed_glyph_names = set() 
     cnt = 0
+
+    aliases, conflicts = find_cmap_aliases(base_font, mapping)
+    report_cmap_aliases(mapping, aliases, conflicts)
     
     for base_char, anno_strs_dict in mapping.items():
+        if base_char in aliases:
+            anno_strs_dict.update(mapping[aliases[base_char]])
+            first_variant = next(iter(anno_strs_dict.values()), None)
+            if first_variant is not None:
+                output_font.getBestCmap()[ord(base_char)] = first_variant[0]
+            continue
         glyph_name_raw = get_glyph_name_by_char(base_font, base_char)
         if not isinstance(glyph_name_raw, str) or glyph_name_raw not in base_glyph_order:
             continue
@@ -168,20 +297,8 @@ def generate_glyphs(
         processed_glyph_names.add(glyph_name) 
         if glyph_name not in base_glyph_set:
             continue
-            
-        original_base_width = base_font['hmtx'][glyph_name][0]
-        
-        # 步驟 1: 計算基礎字形原始視覺中心 (僅用於 X 軸)
-        base_bPen.bounds = None 
-        base_glyph_set[glyph_name].draw(base_bPen)
-        glyph_bounds = base_bPen.bounds
-        if glyph_bounds is None: 
-            x_visual_center_orig = original_base_width / 2
-            y_visual_center_orig = 0
-        else:
-            x_visual_center_orig = (glyph_bounds[0] + glyph_bounds[2]) / 2
-            y_visual_center_orig = (glyph_bounds[1] + glyph_bounds[3]) / 2
 
+        variants = []
         for i, anno_str in enumerate(anno_strs_dict.keys()):
             if i == 0:
                 new_glyph_name = glyph_name
@@ -190,254 +307,506 @@ def generate_glyphs(
             while new_glyph_name in output_glyph_name_used or (i > 0 and new_glyph_name == glyph_name):
                 new_glyph_name = GLYPH_PREFIX+str(cnt).zfill(6)
                 cnt += 1
-            
-            # --- Pass 1: 測量註音寬度 ---
-            anno_bPen.bounds = None
-            x_pos_rel_local, y_pos_rel_local = 0, 0
-            
-            # 模擬繪製以計算寬度
-            for idx, char in enumerate(anno_str):
-                anno_glyph_name = get_glyph_name_by_char(anno_font, char)
-                if isinstance(anno_glyph_name, str) and anno_glyph_name in anno_glyph_set:
-                    transform_rel_local = (
-                        anno_scale * anno_cos, anno_scale * anno_sin,
-                        -anno_scale * anno_sin, anno_scale * anno_cos,
-                        x_pos_rel_local, y_pos_rel_local
-                    )
-                    anno_glyph_set[anno_glyph_name].draw(TransformPen(anno_bPen, transform_rel_local))
-                    
-                    if anno_glyph_name in anno_glyph_order:
-                        advance_width_scaled = round(anno_font['hmtx'][anno_glyph_name][0] * anno_scale)
-                        x_pos_rel_local += advance_width_scaled * anno_cos
-                        y_pos_rel_local += advance_width_scaled * anno_sin
-                        if idx < len(anno_str) - 1:
-                            x_pos_rel_local += (spacing_in_units * anno_scale) * anno_cos
-                            y_pos_rel_local += (spacing_in_units * anno_scale) * anno_sin
-
-            anno_bounds_rel_local = anno_bPen.bounds 
-            anno_visual_width = 0
-            x_visual_center_anno_rel = 0
-            if anno_bounds_rel_local:
-                anno_visual_width = anno_bounds_rel_local[2] - anno_bounds_rel_local[0]
-                x_visual_center_anno_rel = (anno_bounds_rel_local[0] + anno_bounds_rel_local[2]) / 2.0
-
-            # --- 決定最終容器寬度 ---
-            final_advance_width = original_base_width
-            safe_width_factor = (1.0 - fit_padding)
-            if safe_width_factor <= 0: safe_width_factor = 1.0
-            
-            if auto_width and (anno_visual_width > original_base_width * safe_width_factor):
-                final_advance_width = math.ceil(anno_visual_width / safe_width_factor)
 
-            target_center_x = final_advance_width / 2
+            output_glyph_name_used[new_glyph_name] = True
+            mapping[base_char][anno_str] = (new_glyph_name, i)
+            if i == 0:
+                output_font.getBestCmap()[ord(base_char)] = new_glyph_name
+            if new_glyph_name not in output_glyph_order_set:
+                output_glyph_order.append(new_glyph_name)
+                output_glyph_order_set.add(new_glyph_name)
+            variants.append((anno_str, new_glyph_name, i))
 
-            pen = TTGlyphPen(output_glyph_set)
-            composite_bPen = BoundsPen(output_glyph_set)
-            
-            # --- Pass 2: 繪製基礎字形 (居中) ---
-            x_transformed_center = (
-                x_visual_center_orig * (base_scale * base_cos) + 
-                y_visual_center_orig * (-base_scale * base_sin)
-            )
-            x_offset_base = target_center_x - x_transformed_center
-            
-            base_transform = (
-                base_transform_rel[0], base_transform_rel[1], 
-                base_transform_rel[2], base_transform_rel[3],
-                x_offset_base,           
-                final_base_dy            
+        plan.append((base_char, glyph_name, variants))
+
+    if group_variants:
+        group_variant_glyphs(output_font, plan, original_glyph_count)
+
+    return plan, processed_glyph_names
+
+def group_variant_glyphs(output_font, plan, original_glyph_count):
+    """將新加入的字形移到其基礎字形之後 (原有字形的相對順序不變)"""
+    glyph_order = output_font.getGlyphOrder()
+    original = glyph_order[:original_glyph_count]
+    original_set = set(original)
+    followers = {}
+    for _, glyph_name, variants in plan:
+        followers.setdefault(glyph_name, []).extend(
+            new_glyph_name for _, new_glyph_name, _ in variants if new_glyph_name not in original_set)
+    new_order = []
+    for glyph_name in original:
+        new_order.append(glyph_name)
+        new_order.extend(followers.pop(glyph_name, ()))
+    for names in followers.values():
+        new_order.extend(names)
+    placed = set(new_order)
+    new_order.extend(name for name in glyph_order[original_glyph_count:] if name not in placed)
+    output_font.setGlyphOrder(new_order)
+
+def assign_scheme_glyph_names(base_font, output_font, mapping, feature_tag):
+    """
+    [多方案] 為附加方案的每個 (字, 註音) 分配新字形名稱 (包括變體 0)，不改變 cmap；
+    mapping 的值會被填為 (glyph_name, variant_index)，返回與 assign_glyph_names 相同格式的 plan。
+    """
+    base_glyph_set = base_font.getGlyphSet()
+    output_glyph_order = output_font.getGlyphOrder()
+    output_glyph_order_set = set(output_glyph_order)
+    prefix = f"{GLYPH_PREFIX}_{feature_tag}_"
+
+    plan = []
+    cnt = 0
+    for base_char, anno_strs_dict in mapping.items():
+        glyph_name = get_glyph_name_by_char(base_font, base_char)
+        if not isinstance(glyph_name, str) or glyph_name not in base_glyph_set:
+            continue
+        variants = []
+        for i, anno_str in enumerate(anno_strs_dict.keys()):
+            new_glyph_name = prefix + str(cnt).zfill(6)
+            while new_glyph_name in output_glyph_order_set:
+                cnt += 1
+                new_glyph_name = prefix + str(cnt).zfill(6)
+            mapping[base_char][anno_str] = (new_glyph_name, i)
+            output_glyph_order.append(new_glyph_name)
+            output_glyph_order_set.add(new_glyph_name)
+            variants.append((anno_str, new_glyph_name, i))
+        plan.append((base_char, glyph_name, variants))
+    return plan
+
+def merge_scheme_plan(plan, scheme_plan):
+    """把附加方案的變體併入同一基礎字形的第一個項目，使每個基礎字形只測量、解碼一次"""
+    entries = {}
+    for base_char, glyph_name, variants in plan:
+        entries.setdefault(glyph_name, variants)
+    for base_char, glyph_name, variants in scheme_plan:
+        if glyph_name in entries:
+            entries[glyph_name].extend(variants)
+        else:
+            plan.append((base_char, glyph_name, variants))
+            entries[glyph_name] = variants
+    return plan
+
+def measure_base_glyph(layout, glyph_name):
+    """步驟 1: 計算基礎字形原始視覺中心 (僅用於 X 軸)，返回 (glyph_bounds, x_center, y_center)"""
+    base_bPen = layout["base_bPen"]
+    original_base_width = layout["base_font"]['hmtx'][glyph_name][0]
+
+    base_bPen.bounds = None 
+    layout["base_glyph_set"][glyph_name].draw(base_bPen)
+    glyph_bounds = base_bPen.bounds
+    if glyph_bounds is None: 
+        x_visual_center_orig = original_base_width / 2
+        y_visual_center_orig = 0
+    else:
+        x_visual_center_orig = (glyph_bounds[0] + glyph_bounds[2]) / 2
+        y_visual_center_orig = (glyph_bounds[1] + glyph_bounds[3]) / 2
+    return glyph_bounds, x_visual_center_orig, y_visual_center_orig
+
+def _final_lsb(layout, final_bounds):
+    calculated_lsb = final_bounds[0] if final_bounds else 0.0
+    if layout["min_lsb"] is not None:
+        return round(max(layout["min_lsb"], calculated_lsb))
+    return round(calculated_lsb)
+
+def draw_anno_string(layout, anno_str, anno_visual_width, x_visual_center_anno_rel, safe_anno_width, target_center_x, pens):
+    """以 target_center_x 為中心、在 final_anno_dy 高度繪製註音字串到每個 pen；fit 時壓縮到 safe_anno_width 以內"""
+    anno_font = layout["anno_font"]
+    anno_glyph_set = layout["anno_glyph_set"]
+    anno_glyph_order = layout["anno_glyph_order"]
+    anno_scale = layout["anno_scale"]
+    anno_cos, anno_sin = layout["anno_cos"], layout["anno_sin"]
+    spacing_in_units = layout["spacing_in_units"]
+
+    x_compression_ratio = 1.0 
+    current_anno_scale_x = anno_scale
+    current_anno_scale_y = anno_scale
+    
+    if layout["fit"] and (anno_visual_width > safe_anno_width):
+        if safe_anno_width <= 0: safe_anno_width = anno_visual_width
+        x_compression_ratio = safe_anno_width / anno_visual_width 
+        current_anno_scale_x = anno_scale * x_compression_ratio
+    
+    final_anno_xx = current_anno_scale_x * anno_cos
+    final_anno_xy = current_anno_scale_x * anno_sin
+    final_anno_yx = -current_anno_scale_y * anno_sin
+    final_anno_yy = current_anno_scale_y * anno_cos
+    
+    x_visual_center_anno_compressed = x_visual_center_anno_rel * x_compression_ratio
+    x_start = target_center_x - x_visual_center_anno_compressed
+    y_start = layout["final_anno_dy"]
+    
+    x_position = x_start
+    y_position = y_start
+    
+    for idx, char in enumerate(anno_str):
+        anno_glyph_name = get_glyph_name_by_char(anno_font, char)
+        if isinstance(anno_glyph_name, str) and anno_glyph_name in anno_glyph_set:
+            transform = (
+                final_anno_xx, final_anno_xy, 
+                final_anno_yx, final_anno_yy,
+                x_position, y_position
             )
-            if glyph_bounds is not None:
-                base_glyph_set[glyph_name].draw(TransformPen(pen, base_transform))
-                base_glyph_set[glyph_name].draw(TransformPen(composite_bPen, base_transform))
             
-            # --- Pass 3: 繪製註音 (居中，可能壓縮) ---
-            x_compression_ratio = 1.0 
-            current_anno_scale_x = anno_scale
-            current_anno_scale_y = anno_scale
+            for pen in pens:
+                anno_glyph_set[anno_glyph_name].draw(TransformPen(pen, transform))
             
-            safe_anno_width = final_advance_width * safe_width_factor
-            
-            if fit and (anno_visual_width > safe_anno_width):
-                if safe_anno_width <= 0: safe_anno_width = anno_visual_width
-                x_compression_ratio = safe_anno_width / anno_visual_width 
-                current_anno_scale_x = anno_scale * x_compression_ratio
-            
-            final_anno_xx = current_anno_scale_x * anno_cos
-            final_anno_xy = current_anno_scale_x * anno_sin
-            final_anno_yx = -current_anno_scale_y * anno_sin
-            final_anno_yy = current_anno_scale_y * anno_cos
-            
-            x_visual_center_anno_compressed = x_visual_center_anno_rel * x_compression_ratio
-            x_start = target_center_x - x_visual_center_anno_compressed
-            y_start = final_anno_dy 
-            
-            x_position = x_start
-            y_position = y_start
-            
-            for idx, char in enumerate(anno_str):
-                anno_glyph_name = get_glyph_name_by_char(anno_font, char)
-                if isinstance(anno_glyph_name, str) and anno_glyph_name in anno_glyph_set:
-                    transform = (
-                        final_anno_xx, final_anno_xy, 
-                        final_anno_yx, final_anno_yy,
-                        x_position, y_position
-                    )
-                    
-                    anno_glyph_set[anno_glyph_name].draw(TransformPen(pen, transform))
-                    anno_glyph_set[anno_glyph_name].draw(TransformPen(composite_bPen, transform))
-                    
-                    if anno_glyph_name in anno_glyph_order:
-                        advance_width_scaled = round(anno_font['hmtx'][anno_glyph_name][0] * anno_scale)
-                        x_position += (advance_width_scaled * x_compression_ratio) * anno_cos
-                        y_position += (advance_width_scaled * x_compression_ratio) * anno_sin
-                        
-                        if idx < len(anno_str) - 1:
-                            x_position += (spacing_in_units * current_anno_scale_x) * anno_cos
-                            y_position += (spacing_in_units * current_anno_scale_x) * anno_sin
+            if anno_glyph_name in anno_glyph_order:
+                advance_width_scaled = round(anno_font['hmtx'][anno_glyph_name][0] * anno_scale)
+                x_position += (advance_width_scaled * x_compression_ratio) * anno_cos
+                y_position += (advance_width_scaled * x_compression_ratio) * anno_sin
+                
+                if idx < len(anno_str) - 1:
+                    x_position += (spacing_in_units * current_anno_scale_x) * anno_cos
+                    y_position += (spacing_in_units * current_anno_scale_x) * anno_sin
+
+def draw_annotated_glyph(layout, glyph_name, anno_str, base_info):
+    """繪製一個 (基礎字形 + 註音) 字形，返回 (glyph, advance_width, lsb, bounds)"""
+    base_font = layout["base_font"]
+    anno_font = layout["anno_font"]
+    base_glyph_set = layout["base_glyph_set"]
+    anno_glyph_set = layout["anno_glyph_set"]
+    anno_glyph_order = layout["anno_glyph_order"]
+    output_glyph_set = layout["output_glyph_set"]
+    base_scale = layout["base_scale"]
+    anno_scale = layout["anno_scale"]
+    base_cos, base_sin = layout["base_cos"], layout["base_sin"]
+    anno_cos, anno_sin = layout["anno_cos"], layout["anno_sin"]
+    base_transform_rel = layout["base_transform_rel"]
+    spacing_in_units = layout["spacing_in_units"]
+    fit_padding = layout["fit_padding"]
+
+    glyph_bounds, x_visual_center_orig, y_visual_center_orig = base_info
+    original_base_width = base_font['hmtx'][glyph_name][0]
+
+    # --- Pass 1: 測量註音寬度 ---
+    anno_bounds_rel_local = measure_anno_string(
+        anno_font, anno_glyph_set, anno_glyph_order, anno_str,
+        anno_scale, anno_cos, anno_sin, spacing_in_units, layout["anno_bPen"]
+    )
+    anno_visual_width = 0
+    x_visual_center_anno_rel = 0
+    if anno_bounds_rel_local:
+        anno_visual_width = anno_bounds_rel_local[2] - anno_bounds_rel_local[0]
+        x_visual_center_anno_rel = (anno_bounds_rel_local[0] + anno_bounds_rel_local[2]) / 2.0
+
+    # --- 決定最終容器寬度 ---
+    final_advance_width = original_base_width
+    safe_width_factor = (1.0 - fit_padding)
+    if safe_width_factor <= 0: safe_width_factor = 1.0
+    
+    if layout["auto_width"] and (anno_visual_width > original_base_width * safe_width_factor):
+        final_advance_width = math.ceil(anno_visual_width / safe_width_factor)
+
+    target_center_x = final_advance_width / 2
+
+    pen = TTGlyphPen(output_glyph_set)
+    draw_pen = simplifying_pen(pen, layout["simplify_tolerance"])
+    composite_bPen = BoundsPen(output_glyph_set)
+    
+    # --- Pass 2: 繪製基礎字形 (居中) ---
+    x_transformed_center = (
+        x_visual_center_orig * (base_scale * base_cos) + 
+        y_visual_center_orig * (-base_scale * base_sin)
+    )
+    x_offset_base = target_center_x - x_transformed_center
+    
+    base_transform = (
+        base_transform_rel[0], base_transform_rel[1], 
+        base_transform_rel[2], base_transform_rel[3],
+        x_offset_base,           
+        layout["final_base_dy"]
+    )
+    if glyph_bounds is not None:
+        base_glyph_set[glyph_name].draw(TransformPen(draw_pen, base_transform))
+        base_glyph_set[glyph_name].draw(TransformPen(composite_bPen, base_transform))
+    
+    # --- Pass 3: 繪製註音 (居中，可能壓縮) ---
+    safe_anno_width = final_advance_width * safe_width_factor
+    draw_anno_string(layout, anno_str, anno_visual_width, x_visual_center_anno_rel, safe_anno_width, target_center_x,
+                     (draw_pen, composite_bPen))
+
+    final_bounds = composite_bPen.bounds
+    glyph = pen.glyph()
+    simplify_glyph(glyph, layout["simplify_tolerance"])
+    return glyph, int(final_advance_width), _final_lsb(layout, final_bounds), final_bounds
+
+def draw_unannotated_glyph(layout, glyph_name):
+    """縮放並居中一個沒有註音的基礎字形，返回 (glyph, advance_width, lsb, bounds)"""
+    base_font = layout["base_font"]
+    base_glyph_set = layout["base_glyph_set"]
+    output_glyph_set = layout["output_glyph_set"]
+    base_scale = layout["base_scale"]
+    base_cos, base_sin = layout["base_cos"], layout["base_sin"]
+    base_transform_rel = layout["base_transform_rel"]
+    base_bPen = layout["base_bPen"]
+
+    base_advance_width, base_lsb = base_font['hmtx'][glyph_name]
+    target_center_x = base_advance_width / 2
+    
+    pen = TTGlyphPen(output_glyph_set)
+    draw_pen = simplifying_pen(pen, layout["simplify_tolerance"])
+    composite_bPen = BoundsPen(output_glyph_set)
+    
+    base_bPen.bounds = None 
+    base_glyph_set[glyph_name].draw(base_bPen)
+    glyph_bounds = base_bPen.bounds
+    
+    if glyph_bounds is None: 
+        x_visual_center_orig = base_advance_width / 2
+        y_visual_center_orig = 0
+    else:
+        x_visual_center_orig = (glyph_bounds[0] + glyph_bounds[2]) / 2
+        y_visual_center_orig = (glyph_bounds[1] + glyph_bounds[3]) / 2
+    
+    x_transformed_center = (
+        x_visual_center_orig * (base_scale * base_cos) + 
+        y_visual_center_orig * (-base_scale * base_sin)
+    )
+    x_offset = target_center_x - x_transformed_center
+    
+    transform = (
+        base_transform_rel[0], base_transform_rel[1],
+        base_transform_rel[2], base_transform_rel[3],
+        x_offset,                  
+        layout["final_unannotated_dy"]
+    )
+    
+    if glyph_bounds is not None:
+        base_glyph_set[glyph_name].draw(TransformPen(draw_pen, transform))
+        base_glyph_set[glyph_name].draw(TransformPen(composite_bPen, transform))
+
+    final_bounds = composite_bPen.bounds
+    glyph = pen.glyph()
+    simplify_glyph(glyph, layout["simplify_tolerance"])
+    return glyph, base_advance_width, _final_lsb(layout, final_bounds), final_bounds
+
+def draw_mark_glyph(layout, anno_str, reference_width):
+    """
+    [--marks] 繪製只含註音字串的零寬度標記字形，以原點 (標記錨點) 為中心。
+    所有讀音相同的字共用一個標記字形，fit 以 reference_width (基礎字形的常見寬度) 計算壓縮。
+    返回 (glyph, 0, lsb, bounds)
+    """
+    anno_bounds_rel_local = measure_anno_string(
+        layout["anno_font"], layout["anno_glyph_set"], layout["anno_glyph_order"], anno_str,
+        layout["anno_scale"], layout["anno_cos"], layout["anno_sin"], layout["spacing_in_units"], layout["anno_bPen"]
+    )
+    anno_visual_width = 0
+    x_visual_center_anno_rel = 0
+    if anno_bounds_rel_local:
+        anno_visual_width = anno_bounds_rel_local[2] - anno_bounds_rel_local[0]
+        x_visual_center_anno_rel = (anno_bounds_rel_local[0] + anno_bounds_rel_local[2]) / 2.0
+
+    safe_width_factor = (1.0 - layout["fit_padding"])
+    if safe_width_factor <= 0: safe_width_factor = 1.0
+
+    pen = TTGlyphPen(layout["output_glyph_set"])
+    draw_pen = simplifying_pen(pen, layout["simplify_tolerance"])
+    composite_bPen = BoundsPen(layout["output_glyph_set"])
+    draw_anno_string(layout, anno_str, anno_visual_width, x_visual_center_anno_rel,
+                     reference_width * safe_width_factor, 0, (draw_pen, composite_bPen))
+
+    final_bounds = composite_bPen.bounds
+    glyph = pen.glyph()
+    simplify_glyph(glyph, layout["simplify_tolerance"])
+    return glyph, 0, round(final_bounds[0]) if final_bounds else 0, final_bounds
+
+def store_annotated_glyph(base_font, output_font, glyph_name, new_glyph_name, result):
+    """將 draw_annotated_glyph 的結果寫入輸出字體"""
+    glyph, advance_width, lsb, _ = result
+    if 'vmtx' in output_font.keys():
+        output_font['vmtx'][new_glyph_name] = base_font['vmtx'][glyph_name]
+    if 'hmtx' in output_font:
+        output_font['hmtx'][new_glyph_name] = (advance_width, lsb)
+    output_font['glyf'][new_glyph_name] = glyph
+
+def store_unannotated_glyph(output_font, glyph_name, result):
+    """將 draw_unannotated_glyph 的結果寫入輸出字體"""
+    glyph, advance_width, lsb, _ = result
+    output_font['glyf'][glyph_name] = glyph
+    output_font['hmtx'][glyph_name] = (advance_width, lsb)
+
+def unannotated_glyph_names(base_font, processed_glyph_names, output_font=None):
+    """
+    返回需要在第二部分處理的字形名稱，以及沒有輪廓而略過的字形。
+    output_font: 輸出字體已預先子集化 (--top-chars) 時，只處理其中保留的字形
+    """
+    base_glyph_set = base_font.getGlyphSet()
+    output_glyph_names = set(output_font.getGlyphOrder()) if output_font is not None else None
+    names, skipped_no_outline = [], []
+    for glyph_name in base_font.getGlyphOrder():
+        if glyph_name in processed_glyph_names:
+            continue
+        if output_glyph_names is not None and glyph_name not in output_glyph_names:
+            continue
+        if glyph_name not in base_glyph_set:
+            skipped_no_outline.append(glyph_name)
+            continue
+        names.append(glyph_name)
+    return names, skipped_no_outline
+
+def apply_auto_height(output_font, global_min_y, global_max_y, invert=False,
+                      top_padding_percent=None, bottom_padding_percent=None):
+    """[Auto-Height] 應用全局垂直度量調整"""
+    hhea = output_font['hhea']
+    os2  = output_font['OS/2']
+    upm  = output_font['head'].unitsPerEm
+
+    # --- 若 CLI 有輸入 -tp / -bp，則完全以使用者指定為主 ---
+    if top_padding_percent is not None and bottom_padding_percent is not None:
+        tp = top_padding_percent
+        bp = bottom_padding_percent
+    else:
+        # --- 否則使用你原本指定的邏輯（含 invert） ---
+        if invert:
+            tp = -0.60   # invert 時，上留白 -60%
+            bp =  0.10   # invert 時，下留白 10%
+        else:
+            tp =  0.10   # 默认 上留白 10%
+            bp = -0.60   # 默认 下留白 -60%
+
+    # 轉成 units
+    top_padding  = int(upm * tp)
+    bottom_pad   = int(upm * bp)
+
+    # 真實字形的上下邊界
+    glyph_top    = round(global_max_y)
+    glyph_bottom = round(global_min_y)
+
+    # 設定 font metrics
+    new_ascent  = glyph_top + top_padding
+    new_descent = glyph_bottom - bottom_pad  # 注意：descent 是負值
+
+    # 寫入 hhea
+    hhea.ascent  = new_ascent
+    hhea.descent = new_descent
+
+    # 寫入 OS/2
+    os2.sTypoAscender  = new_ascent
+    os2.sTypoDescender = new_descent
+    os2.usWinAscent    = new_ascent
+    os2.usWinDescent   = abs(new_descent)
+
+    build_log.info(f"Auto-height: top={tp*100:.1f}%, bottom={bp*100:.1f}%")
+
+def draw_cached(glyph_cache, key, draw):
+    """
+    glyph_cache: {(glyph_name, anno_str 或 None): (序列化的字形, advance_width, lsb, bounds)}，由呼叫者在排版參數改變時清空。
+    組合字形的 lsb 與邊界取決於輸出字體中已處理的組件，不快取。
+    快取的是未編譯的字形 (沒有 xMin 等欄位)，與剛繪製的字形在字形集合中的位置完全相同。
+    """
+    if glyph_cache is not None and key in glyph_cache:
+        data, advance_width, lsb, bounds = glyph_cache[key]
+        return pickle.loads(data), advance_width, lsb, bounds
+    result = draw()
+    if glyph_cache is not None and not result[0].isComposite():
+        glyph_cache[key] = (pickle.dumps(result[0]), result[1], result[2], result[3])
+    return result
+
+def generate_glyphs(
+    base_font, anno_font, output_font, mapping, 
+    anno_scale=0.35, base_scale=0.60, 
+    anno_y_offset=0.70, base_y_offset=0.0,
+    base_rotate=0.0, anno_rotate=0.0,
+    min_lsb=None,
+    invert=False,
+    fit=False,
+    fit_padding=0.03,
+    anno_spacing=-0.03,
+    auto_width=False,
+    auto_height=False,
+    top_padding_percent=None,
+    bottom_padding_percent=None,
+    simplify_tolerance=None,
+    glyph_source_size=GLYPH_SOURCE_SIZE,
+    glyph_cache=None,
+    group_variants=False,
+    extra_schemes=None
+):
+    """
+    extra_schemes: [多方案] [(feature_tag, char_mapping), ...]，每個附加方案的變體 (包括變體 0) 都是新字形，
+    與主映射共用基礎字形的測量；cmap 與未註音字形只由主映射 (mapping) 決定。
+    """
+    layout = prepare_layout(
+        base_font, anno_font, output_font.getGlyphSet(),
+        anno_scale=anno_scale, base_scale=base_scale,
+        anno_y_offset=anno_y_offset, base_y_offset=base_y_offset,
+        base_rotate=base_rotate, anno_rotate=anno_rotate,
+        min_lsb=min_lsb,
+        invert=invert,
+        fit=fit,
+        fit_padding=fit_padding,
+        anno_spacing=anno_spacing,
+        auto_width=auto_width,
+        auto_height=auto_height,
+        simplify_tolerance=simplify_tolerance,
+        glyph_source_size=glyph_source_size
+    )
+    
+    # 追蹤整套字體的最高點與最低點 (用於 auto_height)
+    global_max_y = -99999
+    global_min_y = 99999
+
+    # --- 第一部分：處理有註音的字形 ---
+    plan, processed_glyph_names = assign_glyph_names(base_font, output_font, mapping, group_variants)
+    for feature_tag, scheme_mapping in extra_schemes or ():
+        plan = merge_scheme_plan(plan, assign_scheme_glyph_names(base_font, output_font, scheme_mapping, feature_tag))
+    
+    cached_before = len(glyph_cache) if glyph_cache is not None else 0
+    reused = 0
+    
+    for base_char, glyph_name, variants in plan:
+        base_info = None
+
+        for anno_str, new_glyph_name, i in variants:
+            if glyph_cache is not None and (glyph_name, anno_str) in glyph_cache:
+                reused += 1
+            elif base_info is None:
+                base_info = measure_base_glyph(layout, glyph_name)
+            result = draw_cached(glyph_cache, (glyph_name, anno_str),
+                                 lambda: draw_annotated_glyph(layout, glyph_name, anno_str, base_info))
 
             # --- [Auto-Height] 追蹤邊界 ---
             if auto_height:
-                final_bounds = composite_bPen.bounds
+                final_bounds = result[3]
                 if final_bounds:
                     # (xMin, yMin, xMax, yMax)
                     if final_bounds[1] < global_min_y: global_min_y = final_bounds[1]
                     if final_bounds[3] > global_max_y: global_max_y = final_bounds[3]
 
-            if 'vmtx' in output_font.keys():
-                if glyph_name in base_glyph_order: 
-                    output_font['vmtx'][new_glyph_name] = base_font['vmtx'][glyph_name]
-            
-            if 'hmtx' in output_font:
-                final_bounds = composite_bPen.bounds
-                calculated_lsb = final_bounds[0] if final_bounds else 0.0
-                
-                if min_lsb is not None:
-                    final_lsb = round(max(min_lsb, calculated_lsb))
-                else:
-                    final_lsb = round(calculated_lsb) 
-                
-                output_font['hmtx'][new_glyph_name] = (int(final_advance_width), final_lsb)
-                
-            output_font['glyf'][new_glyph_name] = pen.glyph()
-            output_glyph_name_used[new_glyph_name] = True
-            mapping[base_char][anno_str] = (new_glyph_name, i)
-            if i == 0:
-                output_font.getBestCmap()[ord(base_char)] = new_glyph_name
+            store_annotated_glyph(base_font, output_font, glyph_name, new_glyph_name, result)
+        layout["base_glyph_set"].release(glyph_name)
 
     # --- 第二部分：處理沒有註音的字形 ---
-    print("\nProcessing un-annotated glyphs...")
-    print("="*40)
+    build_log.info("Processing un-annotated glyphs...")
             
-    skipped_no_outline = []
+    glyph_names, skipped_no_outline = unannotated_glyph_names(base_font, processed_glyph_names, output_font)
     
-    for glyph_name in base_glyph_order:
-        if glyph_name in processed_glyph_names:
-            continue
-
-        if glyph_name not in base_glyph_set:
-            skipped_no_outline.append(glyph_name)
-            continue
-        
-        base_advance_width, base_lsb = base_font['hmtx'][glyph_name]
-        target_center_x = base_advance_width / 2
-        
-        pen = TTGlyphPen(output_glyph_set)
-        composite_bPen = BoundsPen(output_glyph_set)
-        
-        base_bPen.bounds = None 
-        base_glyph_set[glyph_name].draw(base_bPen)
-        glyph_bounds = base_bPen.bounds
-        
-        if glyph_bounds is None: 
-            x_visual_center_orig = base_advance_width / 2
-            y_visual_center_orig = 0
-        else:
-            x_visual_center_orig = (glyph_bounds[0] + glyph_bounds[2]) / 2
-            y_visual_center_orig = (glyph_bounds[1] + glyph_bounds[3]) / 2
-        
-        x_transformed_center = (
-            x_visual_center_orig * (base_scale * base_cos) + 
-            y_visual_center_orig * (-base_scale * base_sin)
-        )
-        x_offset = target_center_x - x_transformed_center
-        
-        transform = (
-            base_transform_rel[0], base_transform_rel[1],
-            base_transform_rel[2], base_transform_rel[3],
-            x_offset,                  
-            final_unannotated_dy       
-        )
-        
-        if glyph_bounds is not None:
-            base_glyph_set[glyph_name].draw(TransformPen(pen, transform))
-            base_glyph_set[glyph_name].draw(TransformPen(composite_bPen, transform))
+    for glyph_name in glyph_names:
+        if glyph_cache is not None and (glyph_name, None) in glyph_cache:
+            reused += 1
+        result = draw_cached(glyph_cache, (glyph_name, None),
+                             lambda: draw_unannotated_glyph(layout, glyph_name))
         
         # --- [Auto-Height] 追蹤邊界 ---
         if auto_height:
-            final_bounds = composite_bPen.bounds
+            final_bounds = result[3]
             if final_bounds:
                 if final_bounds[1] < global_min_y: global_min_y = final_bounds[1]
                 if final_bounds[3] > global_max_y: global_max_y = final_bounds[3]
 
-        output_font['glyf'][glyph_name] = pen.glyph()
-        
-        final_bounds = composite_bPen.bounds
-        calculated_lsb = final_bounds[0] if final_bounds else 0.0
-        
-        if min_lsb is not None:
-            final_lsb = round(max(min_lsb, calculated_lsb))
-        else:
-            final_lsb = round(calculated_lsb)
-            
-        output_font['hmtx'][glyph_name] = (base_advance_width, final_lsb)
+        store_unannotated_glyph(output_font, glyph_name, result)
+        layout["base_glyph_set"].release(glyph_name)
     
     if skipped_no_outline:
-        print(f"\n[INFO] Skipped {len(skipped_no_outline)} empty glyphs.")
+        build_log.info(f"Skipped {len(skipped_no_outline)} empty glyphs.")
+    if glyph_cache is not None:
+        build_log.info(f"Reused {reused} cached outlines, cached {len(glyph_cache) - cached_before} new ones.")
+    glyph_source_report("Base font", layout["base_glyph_set"])
+    glyph_source_report("Annotation font", layout["anno_glyph_set"])
 
     # --- [Auto-Height] 應用全局垂直度量調整 ---
     # --- [Custom Auto-Height with CLI padding control] ---
     if auto_height and global_max_y != -99999:
+        apply_auto_height(output_font, global_min_y, global_max_y, invert,
+                          top_padding_percent, bottom_padding_percent)
 
-        hhea = output_font['hhea']
-        os2  = output_font['OS/2']
-        upm  = output_font['head'].unitsPerEm
-
-        # --- 若 CLI 有輸入 -tp / -bp，則完全以使用者指定為主 ---
-        if top_padding_percent is not None and bottom_padding_percent is not None:
-            tp = top_padding_percent
-            bp = bottom_padding_percent
-        else:
-            # --- 否則使用你原本指定的邏輯（含 invert） ---
-            if invert:
-                tp = -0.60   # invert 時，上留白 -60%
-                bp =  0.10   # invert 時，下留白 10%
-            else:
-                tp =  0.10   # 默认 上留白 10%
-                bp = -0.60   # 默认 下留白 -60%
-
-        # 轉成 units
-        top_padding  = int(upm * tp)
-        bottom_pad   = int(upm * bp)
-
-        # 真實字形的上下邊界
-        glyph_top    = round(global_max_y)
-        glyph_bottom = round(global_min_y)
-
-        # 設定 font metrics
-        new_ascent  = glyph_top + top_padding
-        new_descent = glyph_bottom - bottom_pad  # 注意：descent 是負值
-
-        # 寫入 hhea
-        hhea.ascent  = new_ascent
-        hhea.descent = new_descent
-
-        # 寫入 OS/2
-        os2.sTypoAscender  = new_ascent
-        os2.sTypoDescender = new_descent
-        os2.usWinAscent    = new_ascent
-        os2.usWinDescent   = abs(new_descent)
-
-        print(f"[Auto-Height] top={tp*100:.1f}%, bottom={bp*100:.1f}%")
-
-    print("\nDone scaling un-annotated glyphs.")
\ No newline at end of file
+    build_log.info("Done scaling un-annotated glyphs.")
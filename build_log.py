@@ -0,0 +1,116 @@
+# build_log.py
+# 分等級的建置輸出，取代逐行 print
+#   - debug/info/warning/error 輸出為 "[INFO] ..." 等；低於設定等級的訊息不輸出 (-q 只輸出警告與錯誤)
+#   - count(): 逐行/逐字形的事件 (例如略過的映射行) 只累加計數，summarize() 時每類輸出一行彙總，
+#     例如 "Skipped 2,341 mapping rows: characters not in the base font"
+#   - --log-detail FILE: 所有訊息與每一筆計數事件另外寫為 JSON Lines (每行一個事件)
+#   - 計數按線程分開 (build_api 可在多個線程同時建置)；訊息仍經由 sys.stdout，verbose=False 的線程照常被丟棄
+
+import json
+import os
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+_LABELS = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+_level = INFO
+_detail = None
+_detail_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(level=INFO, detail_log=None):
+    """設定輸出等級 (LEVELS 的名稱或數值) 與 JSON Lines 詳細記錄檔 (None 時不寫入)"""
+    global _level, _detail
+    close()
+    _level = LEVELS[level] if isinstance(level, str) else level
+    if detail_log:
+        _detail = open(detail_log, 'w', encoding='utf-8')
+
+
+def close():
+    global _detail
+    if _detail is not None:
+        _detail.close()
+        _detail = None
+
+
+def _flush_detail():
+    # 繪製進程 fork 前寫出緩衝，子進程不會複製並重複寫入未寫出的內容
+    with _detail_lock:
+        if _detail is not None:
+            _detail.flush()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_flush_detail)
+
+
+def wants_detail(level=DEBUG):
+    """level 的事件會被輸出或寫入詳細記錄時返回 True，用於略過只為記錄而做的計算"""
+    return level >= _level or _detail is not None
+
+
+def _write_detail(record):
+    record["time"] = round(time.time(), 3)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _detail_lock:
+        if _detail is not None:
+            _detail.write(line)
+
+
+def log(level, message, **fields):
+    if level >= _level:
+        print(f"[{_LABELS[level]}] {message}")
+    if _detail is not None:
+        _write_detail({"level": _LABELS[level], "message": message, **fields})
+
+
+def debug(message, **fields):
+    log(DEBUG, message, **fields)
+
+
+def info(message, **fields):
+    log(INFO, message, **fields)
+
+
+def warning(message, **fields):
+    log(WARNING, message, **fields)
+
+
+def error(message, **fields):
+    log(ERROR, message, **fields)
+
+
+def _counts():
+    counts = getattr(_local, "counts", None)
+    if counts is None:
+        counts = _local.counts = {}
+    return counts
+
+
+def count(summary, **fields):
+    """
+    記錄一筆事件：summary 為彙總訊息，以 {count} 代入次數 (例如 "Skipped {count:,} rows: ...")。
+    fields 只在 debug 等級輸出或寫入詳細記錄時使用。
+    """
+    counts = _counts()
+    counts[summary] = counts.get(summary, 0) + 1
+    if DEBUG >= _level:
+        print(f"[DEBUG] {summary.format(count=1)}: " + ", ".join(f"{key}={value}" for key, value in fields.items()))
+    if _detail is not None:
+        _write_detail({"level": _LABELS[DEBUG], "summary": summary, **fields})
+
+
+def summarize(level=INFO):
+    """輸出並清除本線程累加的計數，每類一行"""
+    counts = _counts()
+    for summary, n in counts.items():
+        log(level, summary.format(count=n), count=n)
+    counts.clear()
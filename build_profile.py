@@ -0,0 +1,103 @@
+# build_profile.py
+# 記錄每次建置的耗時、表格大小與計數，供 --dry-run 估算時校準使用
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from fontTools.ttLib.sfnt import SFNTReader
+from utils import CACHE_DIR
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+# 預設的建置記錄位置 (JSON Lines，每次建置一行)
+PROFILE_LOG = os.path.join(CACHE_DIR, "profile.jsonl")
+
+
+class PhaseTimer:
+    """簡單的分段計時器，用法: with timer.phase("generate_glyphs"): ..."""
+
+    def __init__(self):
+        self.phases = {}
+        self._start = time.perf_counter()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def total(self):
+        return time.perf_counter() - self._start
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.timer.phases[self.name] = self.timer.phases.get(self.name, 0.0) + elapsed
+        return False
+
+
+def get_table_sizes(font_file):
+    """讀取已儲存字體的表格目錄，返回 {tag: 位元組數} (不解壓任何表格)"""
+    with open(font_file, 'rb') as f:
+        reader = SFNTReader(f)
+        return {tag: reader.tables[tag].length for tag in reader.keys()}
+
+
+def get_peak_rss_kb():
+    """返回本進程的峰值常駐記憶體 (KB)，無法取得時返回 None"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def record_profile(profile_log, base_font_file, mapping, counts, timer, output_files):
+    """將一次完整建置的記錄追加到 profile_log"""
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "base_font": os.path.basename(base_font_file),
+        "mapping": os.path.basename(mapping),
+        "counts": counts,
+        "phases": {name: round(seconds, 3) for name, seconds in timer.phases.items()},
+        "total_seconds": round(timer.total(), 3),
+        "peak_rss_kb": get_peak_rss_kb(),
+        "outputs": {},
+    }
+    for flavor, path in output_files.items():
+        record["outputs"][flavor] = {
+            "size": os.path.getsize(path),
+            "tables": get_table_sizes(path),
+        }
+
+    directory = os.path.dirname(profile_log)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(profile_log, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+
+def load_profiles(profile_log):
+    """讀取所有建置記錄；檔案不存在或某行損壞時略過"""
+    profiles = []
+    if not profile_log or not os.path.exists(profile_log):
+        return profiles
+    with open(profile_log, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                profiles.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return profiles
@@ -0,0 +1,247 @@
+# calibrate.py
+# 自動搜尋排版參數 (縮放、Y 偏移、註音間距)，只使用快取的字形邊界與 generate_glyphs 的排版公式，不繪製完整字體
+
+import math
+import os
+from fontTools.pens.boundsPen import BoundsPen
+from utils import get_glyph_name_by_char, file_digest, load_json_cache, save_json_cache, CACHE_DIR
+from build_glyph import compute_final_dy
+import build_log
+
+BOUNDS_CACHE_DIR = os.path.join(CACHE_DIR, "bounds")
+
+# 與 generate_glyphs 步驟 D 相同的全局參考
+REF_ANNO_STR = "kwaang3"
+REF_BASE_CHARS = ("逛", "一")
+
+# 預設搜尋範圍
+DEFAULT_ANNO_SCALES = [round(0.40 - i * 0.01, 2) for i in range(33)]       # 0.40 -> 0.08
+DEFAULT_ANNO_SPACINGS = [round(-0.08 + i * 0.01, 2) for i in range(11)]    # -0.08 -> 0.02
+DEFAULT_ANNO_Y_OFFSETS = [round(-1.0 + i * 0.01, 2) for i in range(221)]   # -1.00 -> 1.20
+DEFAULT_BASE_Y_OFFSETS = [round(-0.5 + i * 0.05, 2) for i in range(21)]    # -0.50 -> 0.50
+
+
+def load_glyph_bounds(font, font_file, glyph_names):
+    """
+    返回 {glyph_name: (xMin, yMin, xMax, yMax) | None, advance_width}。
+    邊界按字體內容的雜湊值快取到磁碟，之後的校準不需要再繪製字形。
+    """
+    cache_file = os.path.join(BOUNDS_CACHE_DIR, file_digest(font_file) + ".json")
+    cache = load_json_cache(cache_file)
+
+    glyph_set = font.getGlyphSet()
+    hmtx = font['hmtx']
+    missing = [g for g in glyph_names if g not in cache and g in glyph_set]
+    for glyph_name in missing:
+        bPen = BoundsPen(glyph_set)
+        glyph_set[glyph_name].draw(bPen)
+        cache[glyph_name] = [bPen.bounds, hmtx[glyph_name][0]]
+
+    if missing:
+        save_json_cache(cache_file, cache)
+
+    return {g: (tuple(cache[g][0]) if cache[g][0] else None, cache[g][1]) for g in glyph_names if g in cache}
+
+
+def _transformed_box(bounds, scale, cos, sin, dx=0.0, dy=0.0):
+    """按 generate_glyphs 的 (縮放, 旋轉) 矩陣變換邊界框的四角，返回新的邊界框"""
+    x0, y0, x1, y1 = bounds
+    xs, ys = [], []
+    for x, y in ((x0, y0), (x0, y1), (x1, y0), (x1, y1)):
+        xs.append(scale * cos * x - scale * sin * y + dx)
+        ys.append(scale * sin * x + scale * cos * y + dy)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _string_box(anno_font, anno_bounds, text, scale, cos, sin, spacing_in_units):
+    """與 measure_anno_string 相同的排版公式，但使用快取的字形邊界"""
+    box = None
+    x_pos, y_pos = 0.0, 0.0
+    for idx, char in enumerate(text):
+        glyph_name = get_glyph_name_by_char(anno_font, char)
+        if glyph_name not in anno_bounds:
+            continue
+        bounds, advance = anno_bounds[glyph_name]
+        if bounds:
+            b = _transformed_box(bounds, scale, cos, sin, x_pos, y_pos)
+            box = b if box is None else (min(box[0], b[0]), min(box[1], b[1]), max(box[2], b[2]), max(box[3], b[3]))
+        advance_width_scaled = round(advance * scale)
+        x_pos += advance_width_scaled * cos
+        y_pos += advance_width_scaled * sin
+        if idx < len(text) - 1:
+            x_pos += (spacing_in_units * scale) * cos
+            y_pos += (spacing_in_units * scale) * sin
+    return box
+
+
+def calibrate_layout(
+    base_font, anno_font, char_mapping, base_font_file, anno_font_file,
+    base_scale=0.60,
+    base_rotate=0.0, anno_rotate=0.0,
+    invert=False,
+    fit_padding=0.03,
+    anno_spacing=-0.03,
+    target_ascender=None,
+    target_descender=None,
+    min_gap=0.02,
+    anno_scales=None,
+    anno_spacings=None,
+    anno_y_offsets=None,
+    base_y_offsets=None
+):
+    """
+    搜尋滿足以下目標的參數，優先選擇最大的註音縮放：
+      1. 每個註音 (未壓縮) 的寬度不超過該字的 advance width * (1 - fit_padding)
+      2. 基礎字形與註音之間至少有 min_gap (UPM 比例) 的垂直間隙，不重疊
+      3. 所有字形位於 target_ascender / target_descender (UPM 比例) 之內
+    返回參數字典 (鍵名與 main() 的參數相同)；找不到時返回 None。
+    """
+    upm = base_font['head'].unitsPerEm
+    anno_upm = anno_font['head'].unitsPerEm
+    if target_ascender is None:
+        target_ascender = base_font['hhea'].ascent / upm
+    if target_descender is None:
+        target_descender = base_font['hhea'].descent / upm
+    asc_units = target_ascender * upm
+    desc_units = target_descender * upm
+    gap_units = min_gap * upm
+
+    anno_scales = anno_scales or DEFAULT_ANNO_SCALES
+    anno_spacings = sorted(anno_spacings or set(DEFAULT_ANNO_SPACINGS) | {anno_spacing}, key=lambda sp: abs(sp - anno_spacing))
+    anno_y_offsets = anno_y_offsets or DEFAULT_ANNO_Y_OFFSETS
+    base_y_offsets = base_y_offsets or DEFAULT_BASE_Y_OFFSETS
+
+    # --- 收集所需字形的邊界 (只計算一次) ---
+    pairs = []  # (base_glyph_name, anno_str)
+    for base_char, annos in char_mapping.items():
+        glyph_name = get_glyph_name_by_char(base_font, base_char)
+        if isinstance(glyph_name, str):
+            for anno_str in annos:
+                pairs.append((glyph_name, anno_str))
+    if not pairs:
+        build_log.error("No mapped character found in the base font, nothing to calibrate.")
+        return None
+
+    ref_base_glyph = None
+    for ref_char in REF_BASE_CHARS:
+        ref_base_glyph = get_glyph_name_by_char(base_font, ref_char)
+        if isinstance(ref_base_glyph, str):
+            break
+
+    base_glyph_names = {g for g, _ in pairs}
+    if ref_base_glyph:
+        base_glyph_names.add(ref_base_glyph)
+    anno_text = set(REF_ANNO_STR)
+    for _, anno_str in pairs:
+        anno_text.update(anno_str)
+    anno_glyph_names = {get_glyph_name_by_char(anno_font, c) for c in anno_text if ord(c) in anno_font.getBestCmap()}
+
+    base_bounds = load_glyph_bounds(base_font, base_font_file, sorted(base_glyph_names))
+    anno_bounds = load_glyph_bounds(anno_font, anno_font_file, sorted(anno_glyph_names))
+    pairs = [(g, a) for g, a in pairs if g in base_bounds]
+    syllables = {a for _, a in pairs}
+    build_log.info(f"Calibrating with {len(pairs)} glyph/annotation pairs, {len(base_bounds)} base and {len(anno_bounds)} annotation glyph bounds.")
+
+    base_cos, base_sin = math.cos(math.radians(base_rotate)), math.sin(math.radians(base_rotate))
+    anno_cos, anno_sin = math.cos(math.radians(anno_rotate)), math.sin(math.radians(anno_rotate))
+
+    # 基礎字形在 base_scale 下的相對邊界 (與註音縮放無關，只計算一次)
+    base_boxes = {}
+    for glyph_name in base_glyph_names:
+        if glyph_name in base_bounds and base_bounds[glyph_name][0]:
+            base_boxes[glyph_name] = _transformed_box(base_bounds[glyph_name][0], base_scale, base_cos, base_sin)
+    if ref_base_glyph in base_boxes:
+        base_ref_bottom, base_ref_top = base_boxes[ref_base_glyph][1], base_boxes[ref_base_glyph][3]
+    else:
+        base_ref_bottom, base_ref_top = 0, 0
+
+    best = None
+    for anno_scale in anno_scales:
+        for spacing in anno_spacings:
+            spacing_in_units = anno_upm * spacing
+            syllable_boxes = {}
+            for anno_str in syllables:
+                syllable_boxes[anno_str] = _string_box(anno_font, anno_bounds, anno_str, anno_scale, anno_cos, anno_sin, spacing_in_units)
+
+            # 目標 1: 寬度
+            safe_width_factor = (1.0 - fit_padding) if fit_padding < 1.0 else 1.0
+            too_wide = 0
+            for glyph_name, anno_str in pairs:
+                box = syllable_boxes[anno_str]
+                if box and (box[2] - box[0]) > base_bounds[glyph_name][1] * safe_width_factor:
+                    too_wide += 1
+            if too_wide:
+                continue
+
+            # 目標 2/3 所需的極值：每對字形中基礎與註音的最大交疊量，以及整體上下邊界
+            above_clearance = below_clearance = -math.inf
+            anno_top = base_top = -math.inf
+            anno_bottom = base_bottom = math.inf
+            for glyph_name, anno_str in pairs:
+                box = syllable_boxes[anno_str]
+                base_box = base_boxes.get(glyph_name)
+                if box:
+                    anno_top = max(anno_top, box[3])
+                    anno_bottom = min(anno_bottom, box[1])
+                if base_box:
+                    base_top = max(base_top, base_box[3])
+                    base_bottom = min(base_bottom, base_box[1])
+                if box and base_box:
+                    above_clearance = max(above_clearance, base_box[3] - box[1])
+                    below_clearance = max(below_clearance, box[3] - base_box[1])
+
+            ref_box = _string_box(anno_font, anno_bounds, REF_ANNO_STR, anno_scale, anno_cos, anno_sin, spacing_in_units)
+            anno_ref_bottom, anno_ref_top = (ref_box[1], ref_box[3]) if ref_box else (0, 0)
+
+            for base_y_offset in base_y_offsets:
+                for anno_y_offset in anno_y_offsets:
+                    final_base_dy, final_anno_dy = compute_final_dy(
+                        round(upm * anno_y_offset), round(upm * base_y_offset), invert,
+                        anno_ref_bottom, anno_ref_top, base_ref_bottom, base_ref_top
+                    )
+                    if invert:
+                        gap = final_base_dy - final_anno_dy - below_clearance
+                    else:
+                        gap = final_anno_dy - final_base_dy - above_clearance
+                    top = max(final_base_dy + base_top, final_anno_dy + anno_top)
+                    bottom = min(final_base_dy + base_bottom, final_anno_dy + anno_bottom)
+                    margin = min(gap - gap_units, asc_units - top, bottom - desc_units)
+                    if margin < 0:
+                        continue
+                    if best is None or margin > best["margin"]:
+                        best = {
+                            "margin": margin,
+                            "gap": gap,
+                            "top": top,
+                            "bottom": bottom,
+                            "params": {
+                                "base_scale": base_scale,
+                                "anno_scale": anno_scale,
+                                "anno_spacing": spacing,
+                                "anno_y_offset": anno_y_offset,
+                                "base_y_offset": base_y_offset,
+                                "invert": invert,
+                            },
+                        }
+            if best is not None:
+                break
+        if best is not None:
+            break
+
+    if best is None:
+        build_log.error("No parameter set satisfies the layout goals; try a larger target ascender/descender or a smaller min gap.")
+        return None
+
+    build_log.info(f"Calibrated: gap={best['gap']/upm:.3f}, top={best['top']/upm:.3f}, bottom={best['bottom']/upm:.3f} (UPM)")
+    return best["params"]
+
+
+def format_cli_args(params):
+    """將參數字典轉為 wing-font.py 的命令列參數"""
+    args = (
+        f"-bs {params['base_scale']:.2f} -as {params['anno_scale']:.2f} "
+        f"-asp {params['anno_spacing']:.2f} -ay {params['anno_y_offset']:.2f} -by {params['base_y_offset']:.2f}"
+    )
+    if params.get("invert"):
+        args += " -v"
+    return args
@@ -0,0 +1,107 @@
+# cff_source.py
+# CFF/OTF 字體輸入：在載入時將三次曲線輪廓轉換為二次曲線並寫入 glyf 表，
+# 之後的建置流程 (繪製、GSUB、子集化、儲存) 與 TrueType 字體完全相同。
+# 轉換結果按字體內容雜湊值與最大誤差快取到磁碟，每個來源字形一筆，重複建置不會再次轉換同一字形。
+
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables._g_l_y_f import Glyph
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from utils import file_digest, chunk, load_json_cache, save_json_cache, CACHE_DIR
+import build_log
+
+CU2QU_CACHE_DIR = os.path.join(CACHE_DIR, "cu2qu")
+
+# 所有字形共用的最大轉換誤差 (UPM 比例，與 fontmake 的預設值相同)
+DEFAULT_CU2QU_MAX_ERR = 0.001
+
+# 每批轉換的字形數；-j > 1 時各批在不同進程中轉換
+CU2QU_BATCH_SIZE = 500
+
+CFF_TABLES = ('CFF ', 'CFF2')
+
+
+def is_cff_font(font):
+    return any(tag in font for tag in CFF_TABLES)
+
+
+def _convert_glyph_set(glyph_set, glyph_names, max_err_units):
+    """返回 {glyph_name: base64 編碼的 glyf 字形資料}"""
+    converted = {}
+    for glyph_name in glyph_names:
+        pen = TTGlyphPen(None)
+        # CFF 輪廓為逆時針，TrueType 為順時針
+        glyph_set[glyph_name].draw(Cu2QuPen(pen, max_err_units, reverse_direction=True))
+        converted[glyph_name] = base64.b64encode(pen.glyph().compile(None)).decode('ascii')
+    return converted
+
+
+def _convert_batch(font_file, glyph_names, max_err_units):
+    font = TTFont(font_file)
+    converted = _convert_glyph_set(font.getGlyphSet(), glyph_names, max_err_units)
+    font.close()
+    return converted
+
+
+def convert_cff_to_glyf(font, font_file, max_err=DEFAULT_CU2QU_MAX_ERR, jobs=1, verbose=True, digest=None):
+    """
+    將已載入的 CFF 字體就地轉換為 glyf 字體 (只在記憶體中，不修改原檔)。
+    從記憶體載入的字體 font_file 為 None，以 digest (原始位元組的 SHA-1) 作為快取鍵，並在本進程轉換。
+    """
+    max_err_units = max_err * font['head'].unitsPerEm
+    if digest is None:
+        digest = file_digest(font_file)
+    cache_file = os.path.join(CU2QU_CACHE_DIR, f"{digest}-{max_err_units:g}.json")
+    cache = load_json_cache(cache_file)
+
+    glyph_order = font.getGlyphOrder()
+    missing = [g for g in glyph_order if g not in cache]
+    if missing:
+        batches = list(chunk(missing, CU2QU_BATCH_SIZE))
+        build_log.info(f"Converting {len(missing)} CFF glyphs to quadratic (max error {max_err_units:g} units, {len(batches)} batches)...")
+        if jobs > 1 and len(batches) > 1 and font_file is not None:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for converted in executor.map(_convert_batch, [font_file] * len(batches), batches, [max_err_units] * len(batches)):
+                    cache.update(converted)
+        else:
+            glyph_set = font.getGlyphSet()
+            for batch in batches:
+                cache.update(_convert_glyph_set(glyph_set, batch, max_err_units))
+
+        save_json_cache(cache_file, cache)
+    elif verbose:
+        build_log.info(f"Using {len(glyph_order)} cached quadratic outlines for {os.path.basename(font_file) if font_file else 'font'}.")
+
+    glyf = newTable('glyf')
+    glyf.glyphOrder = glyph_order
+    glyf.glyphs = {g: Glyph(base64.b64decode(cache[g])) for g in glyph_order}
+    font['glyf'] = glyf
+    font['loca'] = newTable('loca')
+
+    for tag in CFF_TABLES + ('VORG',):
+        if tag in font:
+            del font[tag]
+
+    # maxp 0.5 (CFF) -> 1.0 (TrueType)；maxPoints 等欄位在儲存時重新計算
+    maxp = font['maxp']
+    maxp.tableVersion = 0x00010000
+    maxp.maxZones = 1
+    for attr in ('maxTwilightPoints', 'maxStorage', 'maxFunctionDefs', 'maxInstructionDefs',
+                 'maxStackElements', 'maxSizeOfInstructions', 'maxComponentElements',
+                 'maxPoints', 'maxContours', 'maxCompositePoints', 'maxCompositeContours',
+                 'maxComponentDepth'):
+        setattr(maxp, attr, 0)
+
+    font['head'].glyphDataFormat = 0
+    font.sfntVersion = "\x00\x01\x00\x00"
+
+
+def load_font(font_file, max_err=DEFAULT_CU2QU_MAX_ERR, jobs=1, verbose=True):
+    """載入字體；CFF 字體會轉換為 glyf"""
+    font = TTFont(font_file)
+    if is_cff_font(font):
+        convert_cff_to_glyf(font, font_file, max_err=max_err, jobs=jobs, verbose=verbose)
+    return font
@@ -1,6 +1,9 @@
+from itertools import groupby
 from fontTools.ttLib.tables import otTables
 from fontTools.otlLib import builder
-from utils import get_glyph_name_by_char, buildChainSubRuleSet, buildCoverage, chunk, buildDefaultLangSys
+from utils import get_glyph_name_by_char, buildChainSubRuleSet, buildCoverage, buildDefaultLangSys
+from rule_analysis import WordRule, analyze_rules, limit_rules, rule_bytes, PRUNE_OFF, PRUNE_SAFE
+import build_log
 
 # 設定變體上限為 256 (0-255) 根據實際情況調整
 MAX_VARIANT_LOOKUPS = 10
@@ -9,81 +12,99 @@ MAX_VARIANT_LOOKUPS = 10
 MAX_chainSets_chunk = 10
 
 # --- 請將這整個函數複製並替換掉你文件中的舊版本 ---
-def buildChainSub(output_font, word_mapping, char_mapping):
+def buildChainSub(output_font, word_mapping, char_mapping, prune_word_rules=PRUNE_SAFE, variant_lookups=None,
+                  word_weights=None, max_word_rules=None, max_word_rule_bytes=None,
+                  base_glyphs=None, feature_tag='calt'):
+    """
+    base_glyphs: [多方案] {字: 規則匹配的預設字形}，取代 cmap 中的字形 (不在其中的字仍使用 cmap)；
+    feature_tag: 規則 lookup 所屬的 feature。
+    word_weights: {詞組: 權重}；max_word_rules / max_word_rule_bytes 為詞組規則的預算 (修剪後)，
+    超出時按權重與改變的位置數保留價值最高的規則 (見 rule_analysis.limit_rules)。
+    variant_lookups: [--marks] {變體索引: 已加入 GSUB 的 MultipleSubst lookup 索引 (基礎字形 -> 基礎字形 + 標記)}。
+    此時不建立 SingleSubst lookups；變體 0 的標記由之後的預設 lookup 插入，詞組規則中不需要替換 (--prune-word-rules off 時仍寫入)；
+    插入字形會使之後的位置後移，因此 SubstLookupRecord 按位置降序寫入。
+    """
     gsub = output_font["GSUB"].table
+    glyph_order = output_font.getGlyphOrder()
+    glyph_ids = {glyph_name: gid for gid, glyph_name in enumerate(glyph_order)}
+
+    char_glyphs = dict(base_glyphs) if base_glyphs else {}
+
+    def glyph_of(char):
+        if char not in char_glyphs:
+            char_glyphs[char] = get_glyph_name_by_char(output_font, char)
+        return char_glyphs[char]
     
     # 1. 準備 Lookup Builders (Type 1)
     singleSubBuilders = []
     for i in range(0, MAX_VARIANT_LOOKUPS):
         singleSubBuilders.append(builder.SingleSubstBuilder(output_font, None))
 
-    # 初始化一個字典，按詞組長度儲存規則集
-    # 預先整理 char_mapping 以便快速查找字元的所有變體註音
-    char_all_annos = {}
-    for char, anno_map in char_mapping.items():
-        # anno_map 的結構: {'註音A': (glyph_name, variant_index), '註音B': ...}
-        char_all_annos[char] = list(anno_map.keys())
-        
-    chainSets_by_length = {}
-    
     # --- [核心修改] ---
     # 不再需要內部排序函數，因為 word_mapping 已經在 load_mapping 中被正確排序。
     # 我們直接使用 word_mapping 的順序來構建規則。
     # 這確保了 GSUB 規則的順序與 word_mapping 的排序標準完全一致。
-    
-    # 將字典項目轉為列表，以保持順序
-    sorted_words = list(word_mapping.items())
+    rules = []
     
     # 遍歷排序後的詞組映射
-    for word, anno_strs in sorted_words:
+    for word, anno_strs in word_mapping.items():
         if len(word) <= 1:
             continue
             
-        lookup_builders = []
+        variants = []
+        gids = []
         
         for i, char in enumerate(word):
+            original_glyph_name = glyph_of(char)
+            gid = glyph_ids.get(original_glyph_name) if isinstance(original_glyph_name, str) else None
+            gids.append(gid)
+
             anno_str = anno_strs[i]
             if char not in char_mapping or anno_str not in char_mapping[char]:
-                lookup_builders.append(None)
+                variants.append(None)
                 continue
             
             # 假設 char_mapping 的結構是 ('glyph_name', variant_index)
             target_glyph_name, variant = char_mapping[char][anno_str]
             
-            original_glyph_name = get_glyph_name_by_char(output_font, char)
-            
-            if not isinstance(original_glyph_name, str) or original_glyph_name not in output_font.getGlyphOrder():
-                lookup_builders.append(None)
+            if gid is None:
+                variants.append(None)
                 continue
                 
-            # 即使 variant 是 0，也填充替換信息
-            singleSubBuilders[variant].mapping[original_glyph_name] = target_glyph_name
-            lookup_builders.append(variant)
+            # 替換為自身 (預設讀音的 variant 0) 不會改變任何字形，不需要 SubstLookupRecord；
+            # --prune-word-rules off 時保持原來的輸出，仍寫入這些替換
+            if prune_word_rules != PRUNE_OFF and target_glyph_name == original_glyph_name:
+                variants.append(None)
+                continue
+
+            if variant_lookups is not None:
+                if (variant == 0 and prune_word_rules != PRUNE_OFF) or variant not in variant_lookups:
+                    variants.append(None)
+                    continue
+            else:
+                singleSubBuilders[variant].mapping[original_glyph_name] = target_glyph_name
+            variants.append(variant)
             
-        initial_glyph = get_glyph_name_by_char(output_font, word[0])
-        if initial_glyph is None or not isinstance(initial_glyph, str):
+        if None in gids:
             continue
-        
-        if len(word) not in chainSets_by_length:
-            chainSets_by_length[len(word)] = {}
 
-        current_chainSets = chainSets_by_length[len(word)]
+        rules.append(WordRule(word, anno_strs, gids, variants, word_weights.get(word, 1) if word_weights else 1))
 
-        if initial_glyph not in current_chainSets:
-            current_chainSets[initial_glyph] = []
-        
-        input_glyphs = [get_glyph_name_by_char(output_font, char) for char in word[1:]]
-        input_glyphs = [g for g in input_glyphs if isinstance(g, str)]
-        
-        if len(input_glyphs) != len(word) - 1:
-            continue
+    # 以字典樹分析規則：移除重複、無法到達、只選擇預設讀音或被前綴規則涵蓋的詞組規則
+    total_rules = len(rules)
+    rules, stats = analyze_rules(rules, prune_word_rules)
+    if total_rules != len(rules) or stats["kept_for_blocking"]:
+        build_log.info(f"Word rules: kept {len(rules)} of {total_rules}; removed {stats['default_only']} default-only, "
+                       f"{stats['shadowed']} covered by a prefix rule, {stats['duplicates_merged']} merged duplicates, "
+                       f"{stats['unreachable']} unreachable ({stats['kept_for_blocking']} default-only kept because they block overlapping words).")
+
+    if max_word_rules is not None or max_word_rule_bytes is not None:
+        rules, cut = limit_rules(rules, max_word_rules, max_word_rule_bytes)
+        if cut:
+            build_log.info(f"Word rule budget: kept {len(rules)} rules (~{sum(rule_bytes(rule) for rule in rules)} bytes), "
+                           f"cut {len(cut)} lower-value rules (weight {cut[-1].weight}-{cut[0].weight}), "
+                           f"e.g. {', '.join(rule.label for rule in cut[:5])}")
 
-        current_chainSets[initial_glyph].append({
-            "_debug": word + " " + " ".join(anno_strs),
-            "input": input_glyphs,
-            "variantIndex": lookup_builders
-        })
-            
     # 建立 Type 1 Lookups 的實際 GSUB 索引映射
     single_sub_lookup_indices = {}
     
@@ -91,6 +112,8 @@ def buildChainSub(output_font, word_mapping, char_mapping):
     
     # 循環從 0 開始，以包含 variant 0 (默認發音) 的 lookup
     for i in range(0, MAX_VARIANT_LOOKUPS):
+        if variant_lookups is not None:
+            break
         if len(singleSubBuilders[i].mapping) > 0:
             lookup = singleSubBuilders[i].build()
             lookup.LookupFlag = 1
@@ -99,108 +122,109 @@ def buildChainSub(output_font, word_mapping, char_mapping):
             single_sub_lookup_indices[i] = current_lookup_index
             current_lookup_index += 1
 
+    if variant_lookups is not None:
+        single_sub_lookup_indices = variant_lookups
+
     gsub.LookupList.LookupCount = len(gsub.LookupList.Lookup)
     
-    # 調整 Chain Contextual 規則中的索引
-    rule_groups_to_write = []
-    
-    for length, chainSets in chainSets_by_length.items():
-        for initial_glyph, chainSet in chainSets.items():
-            for chain in chainSet:
-                new_lookup_indices = []
-                for variant_index in chain['variantIndex']:
-                    if variant_index is not None and variant_index in single_sub_lookup_indices:
-                        new_lookup_indices.append(single_sub_lookup_indices[variant_index])
-                    else:
-                        new_lookup_indices.append(None)
-                chain['lookupIndex'] = new_lookup_indices
-            
-            # [註] 此處的排序是為了優化 OpenType 表的內部結構，
-            # 而不是為了決定詞組的應用優先級。優先級已由 sorted_words 的全局順序決定。
-            chainSet.sort(key=lambda chain: (-len(chain['input']), chain['_debug']))
-
-
+    # 子表按詞組長度降序，同長度內按起始字形的 GID (相同時按首次出現的順序)，
+    # 同一起始字形的規則按 label 排序。[註] 後兩者只是 OpenType 表的內部結構，
+    # 詞組的應用優先級已由 word_mapping 的全局順序決定。
     reverseMap = output_font.getReverseGlyphMap()
-    
-    sorted_lengths = sorted(chainSets_by_length.keys(), reverse=True)
-    
-    for length in sorted_lengths:
-        chainSets = chainSets_by_length[length]
-        sorted_chainSets = list(sorted(chainSets.items(), key=lambda item: reverseMap.get(item[0], 0)))
-        rule_groups_to_write.append(sorted_chainSets)
-    
+    initial_order = {}
+    for rule in rules:
+        initial = rule.glyphs[0]
+        if initial not in initial_order:
+            initial_order[initial] = (reverseMap.get(glyph_order[initial], 0), len(initial_order))
+    rules.sort(key=lambda rule: (-len(rule.glyphs), initial_order[rule.glyphs[0]], rule.label))
+
     # 插入 Chain Contextual Lookup (Type 6)
     chain_lookup_index = len(gsub.LookupList.Lookup)
     
-    insert_chain_context_subst_into_gsub_logic(output_font, rule_groups_to_write, chain_lookup_index)
+    insert_chain_context_subst_into_gsub_logic(output_font, rules, single_sub_lookup_indices,
+                                               descending=variant_lookups is not None)
 
     # 更新 Features
     calt_lookups = [chain_lookup_index]
-    _update_or_create_feature(gsub, 'calt', calt_lookups)
+    _update_or_create_feature(gsub, feature_tag, calt_lookups)
     
-    print("Done ChainContextSubst")
+    build_log.info("Done ChainContextSubst")
 
 # --- 輔助函數 ---
 
-def insert_chain_context_subst_into_gsub_logic(output_font, rule_groups_to_write, chain_lookup_index):
+def _rule_sets(rules):
+    """逐個返回 (長度, 起始字形 GID, [規則, ...])；rules 已按長度與起始字形排序"""
+    for (length, initial), group in groupby(rules, key=lambda rule: (len(rule.glyphs), rule.glyphs[0])):
+        yield length, initial, list(group)
+
+def insert_chain_context_subst_into_gsub_logic(output_font, rules, single_sub_lookup_indices, descending=False):
+    """
+    把已排序的規則直接寫成 ChainContextSubst 子表：每個長度內每 MAX_chainSets_chunk 個起始字形一個子表，
+    子表寫完後不再保留中間結構。debug 等級 (--debug) 時列出寫入的每條規則 (詞組、讀音與替換的 lookup)。
+    """
     gsub = output_font["GSUB"].table
+    glyph_order = output_font.getGlyphOrder()
     chainSubStLookup = otTables.Lookup()
     chainSubStLookup.LookupType = 6
     chainSubStLookup.LookupFlag = 0
     chainSubStLookup.SubTable = []
     chainSubStLookup.SubTableCount = 0
-    
-    subtable_index = 0
-    
-    # 遍歷按長度降序排列的規則組
-    for all_chain_sets in rule_groups_to_write:
-        if not all_chain_sets:
-            continue
-            
-        # 遍歷 ChainSets 的塊 (每塊最多 50 個字形) 根據實際情況調整 
-        for chainSets_chunk in chunk(all_chain_sets, MAX_chainSets_chunk):
-            # 1. 創建新的 Subtable。
-            chainSubStLookup.SubTable.append(otTables.ChainContextSubst())
-            chainSubStLookup.SubTableCount += 1
-            subtable = chainSubStLookup.SubTable[subtable_index]
-            subtable_index += 1 
-
-            subtable.Format = 1
-            subtable.Coverage = buildCoverage(glyphs=[item[0] for item in chainSets_chunk])
-            subtable.ChainSubRuleSet = []
-            subtable.ChainSubRuleSetCount = 0
-            
-            # 2. 遍歷每個起始字形及其規則集
-            for initial_glyph, chainSet in chainSets_chunk:
-                chainSubRuleSet = buildChainSubRuleSet()
-                
-                # 3. 遍歷規則並寫入
-                for chain in chainSet:
-                    chainSubRule = otTables.ChainSubRule()
-                    chainSubRule.Backtrack = []
-                    chainSubRule.BacktrackGlyphCount = 0
-                    chainSubRule.Input = chain['input']
-                    chainSubRule.InputGlyphCount = len(chain["input"])
-                    chainSubRule.LookAhead = []
-                    chainSubRule.LookAheadGlyphCount = 0
-                    chainSubRule.SubstLookupRecord = []
-                    chainSubRule.SubstCount = 0
-                    
-                    # 遍歷需要替換的 Lookup 索引
-                    for word_index, lookupIndex in enumerate(chain['lookupIndex']):
-                        if lookupIndex is not None:
-                            substLookupRecord = otTables.SubstLookupRecord()
-                            substLookupRecord.SequenceIndex = word_index
-                            substLookupRecord.LookupListIndex = lookupIndex # 這是 Type 1 Lookup 的 GSUB 索引
-                            chainSubRule.SubstLookupRecord.append(substLookupRecord)
-                            chainSubRule.SubstCount += 1
-                            
-                    chainSubRuleSet.ChainSubRule.append(chainSubRule)
-                    
-                # 4. 將規則集添加到 Subtable
-                chainSubRuleSet.ChainSubRuleCount = len(chainSubRuleSet.ChainSubRule)
-                subtable.ChainSubRuleSet.append(chainSubRuleSet)
-                subtable.ChainSubRuleSetCount += 1
+    list_rules = build_log.wants_detail()
+
+    def write_subtable(chainSubRuleSets, coverage_glyphs):
+        subtable = otTables.ChainContextSubst()
+        subtable.Format = 1
+        subtable.Coverage = buildCoverage(glyphs=coverage_glyphs)
+        subtable.ChainSubRuleSet = chainSubRuleSets
+        subtable.ChainSubRuleSetCount = len(chainSubRuleSets)
+        chainSubStLookup.SubTable.append(subtable)
+        chainSubStLookup.SubTableCount += 1
+
+    # 遍歷按長度降序排列的規則集
+    current_length = None
+    chainSubRuleSets, coverage_glyphs = [], []
+    for length, initial, chainSet in _rule_sets(rules):
+        # 長度改變或已有 MAX_chainSets_chunk 個起始字形時開始新的子表
+        if chainSubRuleSets and (length != current_length or len(chainSubRuleSets) >= MAX_chainSets_chunk):
+            write_subtable(chainSubRuleSets, coverage_glyphs)
+            chainSubRuleSets, coverage_glyphs = [], []
+        current_length = length
+
+        chainSubRuleSet = buildChainSubRuleSet()
+        for rule in chainSet:
+            chainSubRule = otTables.ChainSubRule()
+            chainSubRule.Backtrack = []
+            chainSubRule.BacktrackGlyphCount = 0
+            chainSubRule.Input = [glyph_order[gid] for gid in rule.glyphs[1:]]
+            chainSubRule.InputGlyphCount = len(chainSubRule.Input)
+            chainSubRule.LookAhead = []
+            chainSubRule.LookAheadGlyphCount = 0
+            chainSubRule.SubstLookupRecord = []
+
+            # 遍歷需要替換的位置，寫入 Type 1 Lookup 的 GSUB 索引
+            records = list(enumerate(rule.variants))
+            if descending:
+                records.reverse()
+            for word_index, variant_index in records:
+                if variant_index is not None and variant_index in single_sub_lookup_indices:
+                    substLookupRecord = otTables.SubstLookupRecord()
+                    substLookupRecord.SequenceIndex = word_index
+                    substLookupRecord.LookupListIndex = single_sub_lookup_indices[variant_index]
+                    chainSubRule.SubstLookupRecord.append(substLookupRecord)
+            chainSubRule.SubstCount = len(chainSubRule.SubstLookupRecord)
+
+            if list_rules:
+                records = [(record.SequenceIndex, record.LookupListIndex) for record in chainSubRule.SubstLookupRecord]
+                build_log.debug(f"{rule.label} -> " + (", ".join(f"{i}:{lookup}" for i, lookup in records) or "default"),
+                                rule=rule.label, records=records)
+            chainSubRuleSet.ChainSubRule.append(chainSubRule)
+
+        chainSubRuleSet.ChainSubRuleCount = len(chainSubRuleSet.ChainSubRule)
+        chainSubRuleSets.append(chainSubRuleSet)
+        coverage_glyphs.append(glyph_order[initial])
+
+    if chainSubRuleSets:
+        write_subtable(chainSubRuleSets, coverage_glyphs)
 
     gsub.LookupList.Lookup.append(chainSubStLookup)
     gsub.LookupList.LookupCount += 1
@@ -212,6 +236,7 @@ def _update_or_create_feature(gsub, feature_tag, lookup_indices):
         # 創建新 Feature
         featureRecord = otTables.FeatureRecord()
         featureRecord.Feature = otTables.Feature()
+        featureRecord.Feature.FeatureParams = None  # 與解碼得到的 Feature 相同，子集化時需要此屬性
         featureRecord.FeatureTag = feature_tag
         featureRecord.Feature.LookupListIndex = lookup_indices 
         featureRecord.Feature.LookupCount = len(lookup_indices)
@@ -219,6 +244,9 @@ def _update_or_create_feature(gsub, feature_tag, lookup_indices):
         # 註冊 Feature 到 ScriptList/LangSys
         feature_index = len(gsub.FeatureList.FeatureRecord)
         for scriptRecord in gsub.ScriptList.ScriptRecord:
+            if scriptRecord.Script.DefaultLangSys is None and not scriptRecord.Script.LangSysRecord:
+                # 子集化會移除沒有 feature 的 LangSys
+                scriptRecord.Script.DefaultLangSys = buildDefaultLangSys()
             langSysList = [scriptRecord.Script.DefaultLangSys]
             if scriptRecord.Script.LangSysRecord:
                 langSysList.extend([l.LangSys for l in scriptRecord.Script.LangSysRecord])
@@ -0,0 +1,128 @@
+# checkpoint.py
+# 建置階段的檢查點 (--checkpoint-dir DIR)：每個耗時的階段完成後保存狀態，之後的建置從輸入仍然相同的最後一個檢查點繼續
+#   - mapping: load_mapping 的結果 (word_mapping, char_mapping, word_weights)
+#   - glyphs:  繪製後的輸出字體 (GSUB 為繪製前的版本) 與已填入字形名稱的 char_mapping
+#   - gsub:    加入 GSUB (--marks 時還有 GPOS) 後、子集化與儲存前的輸出字體
+#   - 檢查點的鍵為所有輸入的雜湊：字體與映射的內容、影響該階段的參數，以及該階段使用的程式碼檔案，
+#     修改 chain_context_handler.py 等檔案後相應的檢查點自動失效
+#   - 只修改 GSUB 參數 (--prune-word-rules、--max-word-rules 等) 時從 glyphs 繼續，
+#     只修改子集化或輸出參數 (-opt、-c、--flavors、--size-budget) 時從 gsub 繼續；儲存失敗後也從 gsub 繼續
+#   - 每個階段只保留最近 CHECKPOINT_KEEP 個檢查點
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+import socket
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables.DefaultTable import DefaultTable
+from utils import CACHE_DIR, file_digest
+
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, "checkpoints")
+
+# 檢查點格式改變時遞增，使舊的檢查點失效
+CHECKPOINT_VERSION = 1
+
+# 每個階段保留的檢查點數
+CHECKPOINT_KEEP = 3
+
+# 各階段使用的程式碼 (模組名稱)；這些檔案改變時檢查點失效
+MAPPING_MODULES = ("mappings.csv_parser",)
+GLYPH_MODULES = ("build_glyph", "glyph_source", "outline_simplify", "cff_source", "pipeline", "mark_attachment", "schemes")
+GSUB_MODULES = ("chain_context_handler", "liga_handler", "rule_analysis", "schemes", "mark_attachment", "utils")
+
+_source_digests = {}
+
+
+def source_digest(modules):
+    """返回模組原始碼檔案的雜湊"""
+    h = hashlib.sha1()
+    for name in modules:
+        if name not in _source_digests:
+            spec = importlib.util.find_spec(name)
+            _source_digests[name] = file_digest(spec.origin) if spec and spec.origin else ""
+        h.update(f"{name}:{_source_digests[name]}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def checkpoint_key(*parts):
+    """以 JSON 序列化 parts (dict 按鍵排序) 並返回雜湊"""
+    data = json.dumps([CHECKPOINT_VERSION, parts], sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def mapping_key(base_font_file, mapping_file, top_chars=None):
+    # load_mapping 只依賴基礎字體的 cmap，這裡以整個字體檔案的雜湊代替
+    return checkpoint_key("mapping", file_digest(base_font_file), file_digest(mapping_file), top_chars,
+                          source_digest(MAPPING_MODULES))
+
+
+def _checkpoint_file(checkpoint_dir, phase, key):
+    return os.path.join(checkpoint_dir, f"{phase}-{key}.pickle")
+
+
+def load_checkpoint(checkpoint_dir, phase, key):
+    """返回保存的狀態；沒有或無法讀取時返回 None"""
+    path = _checkpoint_file(checkpoint_dir, phase, key)
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path)  # 最近使用的檢查點不被清除
+    return state
+
+
+def save_checkpoint(checkpoint_dir, phase, key, state):
+    """原子地寫入檢查點，並清除同一階段較舊的檢查點"""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = _checkpoint_file(checkpoint_dir, phase, key)
+    tmp = f"{path}.tmp-{socket.gethostname()}-{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+    checkpoints = [os.path.join(checkpoint_dir, name) for name in os.listdir(checkpoint_dir)
+                   if name.startswith(phase + "-") and name.endswith(".pickle")]
+    checkpoints.sort(key=os.path.getmtime, reverse=True)
+    for old in checkpoints[CHECKPOINT_KEEP:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def font_state(font, tables=None):
+    """
+    返回可以保存的字體狀態 (編碼的字體與字形順序)。
+    tables: {tag: 原始資料 | None}，編碼時代替字體中的相應表格 (None 時不包含該表格)，字體本身不變。
+    """
+    previous = {}
+    for tag, data in (tables or {}).items():
+        previous[tag] = font.tables.get(tag)
+        if data is None:
+            # 原始字體沒有這個表格，只會在 font.tables 中
+            font.tables.pop(tag, None)
+        else:
+            table = DefaultTable(tag)
+            table.data = data
+            font.tables[tag] = table
+    try:
+        buf = io.BytesIO()
+        font.save(buf)
+    finally:
+        for tag, table in previous.items():
+            if table is None:
+                font.tables.pop(tag, None)
+            else:
+                font.tables[tag] = table
+    return {"font": buf.getvalue(), "glyph_order": font.getGlyphOrder()}
+
+
+def restore_font(state):
+    """從 font_state() 的結果載入字體；字形順序不依賴 post 表格中的名稱"""
+    font = TTFont(io.BytesIO(state["font"]))
+    font.setGlyphOrder(state["glyph_order"])
+    return font
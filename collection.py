@@ -0,0 +1,267 @@
+# collection.py
+# 把同一基礎字體的多個建置 (例如反轉與不反轉、各種拼音方案) 寫為一個 TrueType Collection (.ttc)
+#   - TTC 只能共用整個表格：內容完全相同的表格 (例如 OS/2、cvt、fpgm、prep、gasp 以及相同的 GSUB) 只存一份
+#   - 各建置的 glyf 通常只在注音字形上不同，整個表格不會相同；因此預設先合併字形：
+#     各建置中輪廓、組合方式與度量都相同的字形只保留一個，所有字體共用合併後的 glyf/loca/hmtx/vmtx/maxp，
+#     各字體的 cmap/GSUB/GPOS/GDEF 等改為引用合併後的字形
+#   - 合併後的字形順序保持每個字體中字形的相對順序 (按內容雜湊對齊各字體的字形序列)，字形名稱沿用第一個出現的字體，
+#     名稱重複時加上 ".N"；字形 0 (.notdef) 使用第一個字體的
+#   - head/hhea/vhea 的邊界與極值改為所有字體的聯集，maxp 取所有字體的最大值
+#   - hdmx/LTSH/VDMX/DSIG 等按字形索引的可選表格不保留；CFF 與可變字體只能以 --tables-only 合併
+#   - 合併後的字形數不能超過 65535 (例如同一 CJK 基礎字體的多個拼音方案，註音字形幾乎都不同)，此時也只能以 --tables-only 合併
+#
+# 用法: python3 collection.py -o outputs/bundle.ttc outputs/a.ttf outputs/b.ttf ...
+
+import argparse
+import copy
+import difflib
+import hashlib
+import os
+from fontTools.ttLib import TTFont, TTCollection, newTable
+from estimator import MAX_GLYPH_COUNT
+import build_log
+
+# 合併字形時不保留的表格 (按字形索引，合併後的字形沒有相應的資料)
+DROPPED_TABLES = ("hdmx", "LTSH", "VDMX", "DSIG")
+
+# 合併字形時不支援的表格
+UNSUPPORTED_TABLES = ("CFF ", "CFF2", "gvar", "fvar", "sbix", "CBDT", "EBDT")
+
+# 所有字體共用的表格
+SHARED_TABLES = ("glyf", "loca", "hmtx", "vmtx", "maxp")
+
+# 取所有字體聯集的欄位: (表格, 欄位, min/max)
+UNION_FIELDS = (
+    ("head", "xMin", min), ("head", "yMin", min), ("head", "xMax", max), ("head", "yMax", max),
+    ("hhea", "advanceWidthMax", max), ("hhea", "minLeftSideBearing", min),
+    ("hhea", "minRightSideBearing", min), ("hhea", "xMaxExtent", max),
+    ("vhea", "advanceHeightMax", max), ("vhea", "minTopSideBearing", min),
+    ("vhea", "minBottomSideBearing", min), ("vhea", "yMaxExtent", max),
+)
+
+
+def _glyph_digests(font):
+    """
+    返回 {字形名稱: 內容的雜湊}，兩個字形的雜湊相同時繪製結果與度量相同。
+    簡單字形比較編碼後的資料；組合字形比較組件的雜湊、位置與變換，以及字形的指令與邊界。
+    """
+    glyf = font["glyf"]
+    hmtx = font["hmtx"].metrics
+    vmtx = font["vmtx"].metrics if "vmtx" in font else {}
+    digests = {}
+
+    def digest(glyph_name, depth=0):
+        if glyph_name in digests:
+            return digests[glyph_name]
+        if depth > 64:
+            raise ValueError(f"Cyclic composite glyph '{glyph_name}'")
+        glyph = glyf.glyphs[glyph_name]
+        h = hashlib.sha1(repr((hmtx[glyph_name], vmtx.get(glyph_name))).encode('utf-8'))
+        if glyph.isComposite():
+            glyph.expand(glyf)
+            for component in glyph.components:
+                h.update(digest(component.glyphName, depth + 1))
+                h.update(repr((component.flags, getattr(component, "x", None), getattr(component, "y", None),
+                               getattr(component, "firstPt", None), getattr(component, "secondPt", None),
+                               getattr(component, "transform", None))).encode('utf-8'))
+            h.update(glyph.program.getBytecode() if hasattr(glyph, "program") else b"")
+            h.update(repr((glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax)).encode('utf-8'))
+        else:
+            h.update(b"simple:" + getattr(glyph, "data", b""))
+        digests[glyph_name] = h.digest()
+        return digests[glyph_name]
+
+    for glyph_name in font.getGlyphOrder():
+        digest(glyph_name)
+    return digests
+
+
+def _unique_name(name, names):
+    if name not in names:
+        return name
+    i = 1
+    while f"{name}.{i}" in names:
+        i += 1
+    return f"{name}.{i}"
+
+
+def merge_glyph_orders(font_files):
+    """
+    比較各字體的字形，返回 (合併後的字形順序, 每個字體的 {原名稱: 合併後的名稱}, {合併後的名稱: 來源字體的索引})。
+    合併後的順序保持每個字體中字形的相對順序 (Coverage 等表格要求字形 ID 遞增)，
+    因此只合併兩個字體中按相同順序出現的相同字形 (以 difflib 對齊兩個字體的字形序列)。
+    """
+    merged_order = []
+    merged_digests = []
+    merged_names = set()
+    origins = {}
+    renames = []
+
+    for index, font_file in enumerate(font_files):
+        font = TTFont(font_file)
+        for tag in UNSUPPORTED_TABLES:
+            if tag in font:
+                raise ValueError(f"{font_file}: glyphs of fonts with a '{tag}' table cannot be merged, use --tables-only")
+        glyph_order = font.getGlyphOrder()
+        digests = _glyph_digests(font)
+        font.close()
+        font_digests = [digests[glyph_name] for glyph_name in glyph_order]
+
+        rename = {}
+        order = []
+        order_digests = []
+
+        def add_new(glyph_name, glyph_digest):
+            merged = _unique_name(glyph_name, merged_names)
+            merged_names.add(merged)
+            origins[merged] = index
+            rename[glyph_name] = merged
+            order.append(merged)
+            order_digests.append(glyph_digest)
+
+        if merged_order:
+            # 字形 0 (.notdef) 在所有字體中共用
+            rename[glyph_order[0]] = merged_order[0]
+            order.append(merged_order[0])
+            order_digests.append(merged_digests[0])
+            if font_digests[0] != merged_digests[0]:
+                build_log.warning(f"{font_file}: glyph 0 differs from the first font; the first font's is used.")
+            matcher = difflib.SequenceMatcher(None, merged_digests[1:], font_digests[1:], autojunk=False)
+            for op, i1, i2, j1, j2 in matcher.get_opcodes():
+                if op == "equal":
+                    for i, j in zip(range(i1 + 1, i2 + 1), range(j1 + 1, j2 + 1)):
+                        rename[glyph_order[j]] = merged_order[i]
+                order.extend(merged_order[i1 + 1:i2 + 1])
+                order_digests.extend(merged_digests[i1 + 1:i2 + 1])
+                if op in ("replace", "insert"):
+                    for j in range(j1 + 1, j2 + 1):
+                        add_new(glyph_order[j], font_digests[j])
+        else:
+            for glyph_name, glyph_digest in zip(glyph_order, font_digests):
+                add_new(glyph_name, glyph_digest)
+
+        merged_order, merged_digests = order, order_digests
+        renames.append(rename)
+        if len(merged_order) > MAX_GLYPH_COUNT:
+            raise ValueError(f"Merging the glyphs of {index + 1} fonts (up to {font_file}) gives {len(merged_order):,} glyphs, "
+                             f"more than the {MAX_GLYPH_COUNT:,} a font can have; use --tables-only")
+
+    return merged_order, renames, origins
+
+
+def _load_renamed(font_file, glyph_order):
+    """載入字體，所有表格中的字形名稱為合併後的名稱"""
+    font = TTFont(font_file, recalcBBoxes=False, recalcTimestamp=False)
+    # 在載入任何表格前設定字形順序，各表格按字形 ID 解碼為合併後的名稱
+    font.setGlyphOrder(glyph_order)
+    for tag in font.keys():
+        if tag == "GlyphOrder":
+            continue
+        table = font[tag]
+        if tag != "glyf" and hasattr(table, "ensureDecompiled"):
+            table.ensureDecompiled()
+    return font
+
+
+def _shared_tables(fonts, merged_order, origins):
+    glyf = newTable("glyf")
+    glyf.glyphs = {}
+    glyf.glyphOrder = merged_order
+    hmtx = newTable("hmtx")
+    hmtx.metrics = {}
+    has_vmtx = all("vmtx" in font for font in fonts)
+    if has_vmtx:
+        vmtx = newTable("vmtx")
+        vmtx.metrics = {}
+
+    for glyph_name in merged_order:
+        source = fonts[origins[glyph_name]]
+        glyph = source["glyf"].glyphs[glyph_name]
+        if glyph.isComposite():
+            # 組件的字形 ID 按合併後的字形順序重新編碼
+            glyph.expand(source["glyf"])
+        glyf.glyphs[glyph_name] = glyph
+        hmtx.metrics[glyph_name] = source["hmtx"].metrics[glyph_name]
+        if has_vmtx:
+            vmtx.metrics[glyph_name] = source["vmtx"].metrics[glyph_name]
+
+    maxp = copy.copy(fonts[0]["maxp"])
+    for name, value in vars(maxp).items():
+        if name not in ("tableTag", "tableVersion", "numGlyphs") and isinstance(value, int):
+            setattr(maxp, name, max(getattr(font["maxp"], name, value) for font in fonts))
+
+    shared = {"glyf": glyf, "loca": newTable("loca"), "hmtx": hmtx, "maxp": maxp}
+    if has_vmtx:
+        shared["vmtx"] = vmtx
+    return shared
+
+
+def merge_fonts(font_files):
+    """返回共用合併字形的字體 (TTFont 列表)，可直接寫入 TTCollection"""
+    merged_order, renames, origins = merge_glyph_orders(font_files)
+
+    fonts = []
+    for font_file, rename in zip(font_files, renames):
+        glyph_order = TTFont(font_file, lazy=True).getGlyphOrder()
+        fonts.append(_load_renamed(font_file, [rename[name] for name in glyph_order]))
+    units_per_em = {font["head"].unitsPerEm for font in fonts}
+    if len(units_per_em) > 1:
+        raise ValueError(f"Fonts with different unitsPerEm {sorted(units_per_em)} cannot share glyphs, use --tables-only")
+
+    shared = _shared_tables(fonts, merged_order, origins)
+
+    members = []
+    for font in fonts:
+        member = TTFont(recalcBBoxes=False, recalcTimestamp=False)
+        member.sfntVersion = font.sfntVersion
+        member.setGlyphOrder(merged_order)
+        for tag in font.keys():
+            if tag == "GlyphOrder" or tag in DROPPED_TABLES:
+                continue
+            if tag in SHARED_TABLES:
+                if tag in shared:
+                    member[tag] = shared[tag]
+            elif tag == "vhea" and "vmtx" not in shared:
+                continue
+            else:
+                member[tag] = font[tag]
+        members.append(member)
+
+    # 每個字體包含所有合併後的字形，邊界與極值取聯集
+    for tag, name, union in UNION_FIELDS:
+        values = [member[tag] for member in members if tag in member]
+        if values:
+            value = union(getattr(table, name) for table in values)
+            for table in values:
+                setattr(table, name, value)
+
+    build_log.info(f"Merged {sum(len(rename) for rename in renames):,} glyphs of {len(font_files)} fonts "
+                   f"into {len(merged_order):,} shared glyphs.")
+    return members
+
+
+def build_collection(font_files, output_file, merge_glyphs=True):
+    """把 font_files 寫為 output_file (.ttc)，相同的表格只存一份；merge_glyphs 時先合併相同的字形"""
+    if merge_glyphs:
+        fonts = merge_fonts(font_files)
+    else:
+        fonts = [TTFont(font_file, lazy=True) for font_file in font_files]
+
+    collection = TTCollection()
+    collection.fonts = fonts
+    collection.save(output_file, shareTables=True)
+
+    input_size = sum(os.path.getsize(font_file) for font_file in font_files)
+    output_size = os.path.getsize(output_file)
+    build_log.info(f"Collection {output_file}: {len(fonts)} fonts, {input_size / 1024:,.0f} KiB -> "
+                   f"{output_size / 1024:,.0f} KiB ({output_size / input_size - 1:+.1%}).")
+    return output_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="collection.py", description="Write related wing-font.py builds into one TrueType Collection sharing identical tables and glyphs.")
+    parser.add_argument('fonts', nargs='+', help="Font files of the builds; the first keeps its glyph order and names.")
+    parser.add_argument('-o', '--output', required=True, help="Output .ttc file.")
+    parser.add_argument('--tables-only', action='store_true', help="Only share byte-identical tables without merging glyphs (also works for CFF and variable fonts).")
+    options = parser.parse_args()
+    build_collection(options.fonts, options.output, merge_glyphs=not options.tables_only)
@@ -0,0 +1,437 @@
+# estimator.py
+# --dry-run: 只執行 load_mapping 和簡單計數，估算字形數、GSUB 大小與建置時間
+
+import math
+import os
+import statistics
+from build_glyph import find_cmap_aliases
+from chain_context_handler import MAX_VARIANT_LOOKUPS, MAX_chainSets_chunk
+from rule_analysis import PRUNE_OFF, PRUNE_SAFE
+from liga_handler import chunk_size as LIGA_CHUNK_SIZE
+
+# TrueType 字形 ID 為 16 位，最多 65535 個字形
+MAX_GLYPH_COUNT = 65535
+
+# -opt 時除了註音字形外額外保留的字形 (數字、標點、英文字母等) 的粗略數量
+OPTIMIZE_EXTRA_GLYPHS = 250
+
+# 沒有建置記錄時使用的預設值
+DEFAULT_WOFF_RATIO = 0.55
+
+# GSUB 結構大小 (位元組)，與 buildChainSub / buildLiga 寫出的結構對應
+CHAIN_RULE_BASE_BYTES = 12      # 4 個計數欄位 + 規則偏移 + 規則集內的偏移
+CHAIN_INPUT_GLYPH_BYTES = 2
+SUBST_RECORD_BYTES = 4
+CHAIN_SUBTABLE_BYTES = 10       # Format + Coverage 偏移 + 計數 + Coverage 表頭
+CHAIN_SET_BYTES = 6             # Coverage 項 + 規則集偏移 + 規則集計數
+SINGLE_SUBST_ENTRY_BYTES = 4
+LIGATURE_BASE_BYTES = 6         # 連字字形 + 元件數 + 偏移
+LIGATURE_COMPONENT_BYTES = 2
+
+# --marks 的 GSUB/GPOS 結構大小 (位元組)，與 buildMarkSub / buildMarkPos 寫出的結構對應
+MULTIPLE_SUBST_ENTRY_BYTES = 10  # Coverage 項 + Sequence 偏移 + Sequence (計數 + 基礎字形 + 標記)
+DELETE_ENTRY_BYTES = 6           # Coverage 項 + Sequence 偏移 + 空的 Sequence
+MARK_CHAIN_SUBTABLE_BYTES = 24   # Format 3 表頭、各位置的 Coverage 偏移與 SubstLookupRecord
+COVERAGE_GLYPH_BYTES = 2
+MARK_RECORD_BYTES = 6            # Coverage 項 + MarkRecord (類別 + 錨點偏移)
+BASE_RECORD_BYTES = 10           # Coverage 項 + BaseRecord + 錨點
+
+
+def _font_table_length(font, tag):
+    if font.reader is not None and tag in font.reader.tables:
+        return font.reader.tables[tag].length
+    if tag == 'glyf' and tag in font.tables:
+        # 從 CFF 轉換、尚未寫入檔案的 glyf 表
+        glyf = font['glyf']
+        return sum(len(glyf[g].compile(glyf, recalcBBoxes=False)) for g in font.getGlyphOrder())
+    return 0
+
+
+def _count_word_rules(word_mapping, char_mapping, glyph_of, prune_word_rules, mark_attachment,
+                      max_word_rules, max_word_rule_bytes):
+    """
+    buildChainSub: 每個多字詞組一條規則，按長度分組，每 MAX_chainSets_chunk 個起始字形一個子表。
+    glyph_of(字) 返回規則匹配的字形 (不在字體中時為 None)。
+    """
+    chain_rules = 0
+    chain_inputs = 0
+    subst_records = 0
+    used_variants = set()
+    single_subst_entries = set()
+    initial_glyphs_by_length = {}
+    for word, anno_strs in word_mapping.items():
+        if len(word) <= 1:
+            continue
+        glyphs = [glyph_of(char) for char in word]
+        if None in glyphs:
+            continue
+        chain_rules += 1
+        chain_inputs += len(word) - 1
+        initial_glyphs_by_length.setdefault(len(word), set()).add(glyphs[0])
+        for char, anno_str, glyph in zip(word, anno_strs, glyphs):
+            annos = char_mapping.get(char)
+            if not annos or anno_str not in annos:
+                continue
+            variant = list(annos).index(anno_str)
+            if variant == 0 and prune_word_rules != PRUNE_OFF:
+                # 預設讀音替換為自身，buildChainSub 不會為它寫入 SubstLookupRecord (off 時仍寫入)
+                continue
+            if mark_attachment and variant >= MAX_VARIANT_LOOKUPS:
+                continue
+            subst_records += 1
+            used_variants.add(variant)
+            if not mark_attachment:
+                single_subst_entries.add((variant, glyph))
+
+    if chain_rules:
+        limit = chain_rules
+        if max_word_rules is not None:
+            limit = min(limit, max_word_rules)
+        if max_word_rule_bytes is not None:
+            # 與 rule_analysis.rule_bytes 相同的估算
+            average_bytes = 10 + 2 * chain_inputs / chain_rules + 4 * subst_records / chain_rules
+            limit = min(limit, int(max_word_rule_bytes / average_bytes))
+        if limit < chain_rules:
+            ratio = limit / chain_rules
+            chain_inputs = round(chain_inputs * ratio)
+            subst_records = round(subst_records * ratio)
+            chain_rules = limit
+
+    return {
+        "chain_rules": chain_rules,
+        "chain_inputs": chain_inputs,
+        "subst_records": subst_records,
+        "chain_sets": sum(len(initial) for initial in initial_glyphs_by_length.values()),
+        "chain_subtables": sum(math.ceil(len(initial) / MAX_chainSets_chunk) for initial in initial_glyphs_by_length.values()),
+        "single_subst_lookups": 0 if mark_attachment else min(len(used_variants), MAX_VARIANT_LOOKUPS),
+        "single_subst_entries": len(single_subst_entries),
+    }
+
+
+def _count_ligatures(char_mapping, glyph_of, selectors):
+    """buildLiga: 返回 (連字數, 元件數, lookup 數)；selectors 為 (可用的數字數, 可用的 丅+中文數字數)"""
+    digits, numerals = selectors
+    ligatures = 0
+    ligature_components = 0
+    for char, annos in char_mapping.items():
+        if glyph_of(char) is None:
+            continue
+        variants = len(annos)
+        # 數字 0 -> 預設字形，數字 N -> 第 N 個變體 (如存在)
+        targets_per_glyph = 1 + min(variants - 1, 9)
+        if digits:
+            ligatures += variants * min(targets_per_glyph, digits)
+            ligature_components += variants * min(targets_per_glyph, digits) * 2
+        if numerals:
+            ligatures += variants * min(targets_per_glyph, numerals)
+            ligature_components += variants * min(targets_per_glyph, numerals) * 3
+    return ligatures, ligature_components, math.ceil(len(char_mapping) / LIGA_CHUNK_SIZE)
+
+
+def count_build(base_font, anno_font, word_mapping, char_mapping, optimize=False,
+                max_word_rules=None, max_word_rule_bytes=None, prune_word_rules=PRUNE_SAFE, mark_attachment=False,
+                extra_schemes=None):
+    """
+    按照 generate_glyphs / buildChainSub / buildLiga 的邏輯計數，但不繪製任何字形。
+    char_mapping 的值此時仍為 None，只使用註音的順序 (即變體索引)。
+    有詞組規則預算時，規則、輸入與替換數按比例縮減 (不考慮修剪與排序)。
+    mark_attachment: 按照 --marks 的 generate_mark_glyphs / buildMarkSub / buildMarkPos 計數。
+    extra_schemes: [(名稱, word_mapping, char_mapping), ...] 附加的映射方案 (見 schemes.py)，字形與 lookup 計入總數。
+    """
+    base_glyph_order = base_font.getGlyphOrder()
+    base_glyph_set = set(base_glyph_order)
+    cmap = base_font.getBestCmap()
+
+    # --- generate_glyphs: 每個字的變體 1..n-1 會新增字形 ---
+    # cmap 別名共用變體不另外繪製；與之前的字共用字形但讀音不同時，變體 0 也是新字形
+    # --marks: 基礎字形不增加，每個讀音一個標記字形 (所有同音字共用)
+    aliases, _ = find_cmap_aliases(base_font, char_mapping)
+    annotated_chars = 0
+    new_glyphs = 0
+    syllable_chars = 0
+    seen_glyphs = set()
+    readings = set()
+    for char, annos in char_mapping.items():
+        glyph_name = cmap.get(ord(char))
+        if glyph_name not in base_glyph_set:
+            continue
+        if mark_attachment:
+            if glyph_name not in seen_glyphs:
+                annotated_chars += 1
+            seen_glyphs.add(glyph_name)
+            readings.update(annos)
+            continue
+        if char in aliases:
+            continue
+        annotated_chars += 1
+        new_glyphs += len(annos) - (0 if glyph_name in seen_glyphs else 1)
+        seen_glyphs.add(glyph_name)
+        syllable_chars += sum(len(anno) for anno in annos)
+    if mark_attachment:
+        new_glyphs = len(readings)
+        syllable_chars = sum(len(anno) for anno in readings)
+
+    def main_glyph(char):
+        glyph_name = cmap.get(ord(char))
+        return glyph_name if glyph_name in base_glyph_set else None
+
+    word_rules = _count_word_rules(word_mapping, char_mapping, main_glyph, prune_word_rules, mark_attachment,
+                                   max_word_rules, max_word_rule_bytes)
+
+    # --- buildLiga: 每個變體字形 + 數字 (或 丅 + 中文數字) ---
+    selectors = (
+        sum(1 for i in range(10) if ord(str(i)) in cmap),
+        sum(1 for ch in '零一二三四五六七八九' if ord(ch) in cmap) if ord('丅') in cmap else 0,
+    )
+    ligatures, ligature_components, liga_lookups = 0, 0, 0
+    if not mark_attachment:
+        ligatures, ligature_components, liga_lookups = _count_ligatures(char_mapping, main_glyph, selectors)
+
+    # --- 附加方案 (ss02..): 每個 (字, 註音) 都是新字形 (包括變體 0)；
+    #     切換用的 SingleSubst，以及以本方案預設字形為輸入的詞組規則與數字選擇 ---
+    scheme_glyphs = 0
+    for index, (_, scheme_words, scheme_chars) in enumerate(extra_schemes or (), 1):
+        scheme_chars = {char: annos for char, annos in scheme_chars.items() if annos and main_glyph(char)}
+        scheme_glyphs += sum(len(annos) for annos in scheme_chars.values())
+        syllable_chars += sum(len(anno) for annos in scheme_chars.values() for anno in annos)
+
+        def scheme_glyph(char, index=index, scheme_chars=scheme_chars):
+            # 本方案的字匹配本方案的預設字形 (以 (方案, 字) 代表)，其他字仍為 cmap 字形
+            return (index, char) if char in scheme_chars else main_glyph(char)
+
+        scheme_rules = _count_word_rules(scheme_words, scheme_chars, scheme_glyph, prune_word_rules, False,
+                                         max_word_rules, max_word_rule_bytes)
+        for key, value in scheme_rules.items():
+            word_rules[key] += value
+        word_rules["single_subst_lookups"] += 1
+        word_rules["single_subst_entries"] += len({main_glyph(char) for char in scheme_chars})
+        scheme_ligatures = _count_ligatures(scheme_chars, scheme_glyph, selectors)
+        ligatures += scheme_ligatures[0]
+        ligature_components += scheme_ligatures[1]
+        liga_lookups += scheme_ligatures[2]
+    new_glyphs += scheme_glyphs
+
+    total_glyphs = len(base_glyph_order) + new_glyphs
+    if optimize:
+        output_glyphs = annotated_chars + new_glyphs + OPTIMIZE_EXTRA_GLYPHS
+    else:
+        output_glyphs = total_glyphs
+
+    # --- buildMarkSub / buildMarkPos: 變體 k 的 MultipleSubst、刪除 lookup、
+    #     數字選擇讀音與插入預設讀音標記的 ChainContextSubst，以及 GPOS mark-to-base ---
+    multiple_subst_entries = 0
+    delete_entries = 0
+    mark_chain_subtables = 0
+    mark_coverage_glyphs = 0
+    if mark_attachment:
+        variant_bases = {}
+        for char, annos in char_mapping.items():
+            glyph_name = cmap.get(ord(char))
+            if glyph_name not in base_glyph_set:
+                continue
+            for variant in range(min(len(annos), MAX_VARIANT_LOOKUPS)):
+                variant_bases.setdefault(variant, set()).add(glyph_name)
+        digit_variants = {i for i in range(10) if ord(str(i)) in cmap}
+        numeral_variants = {i for i, ch in enumerate('零一二三四五六七八九') if ord(ch) in cmap} if ord('丅') in cmap else set()
+        multiple_subst_entries = sum(len(bases) for bases in variant_bases.values())
+        delete_entries = len(digit_variants) + len(numeral_variants) + len(readings) + (1 if numeral_variants else 0)
+        for variant, bases in variant_bases.items():
+            variant_selectors = (variant in digit_variants) + (variant in numeral_variants)
+            # 每個選擇器有已插入標記與沒有標記的兩個子表
+            mark_chain_subtables += 2 * variant_selectors
+            if variant_selectors:
+                mark_coverage_glyphs += len(bases)
+        if variant_bases:
+            liga_lookups = 1 if mark_chain_subtables else 0
+            mark_chain_subtables += 2
+            mark_coverage_glyphs += len(variant_bases[0]) + len(readings)
+
+    return {
+        "base_glyphs": len(base_glyph_order),
+        "annotated_chars": annotated_chars,
+        "new_glyphs": new_glyphs,
+        "total_glyphs": total_glyphs,
+        "output_glyphs": output_glyphs,
+        "drawn_glyphs": len(base_glyph_order) + new_glyphs,
+        "avg_syllable_len": (syllable_chars / (new_glyphs if mark_attachment else annotated_chars + new_glyphs)) if annotated_chars else 0,
+        "schemes": len(extra_schemes or ()),
+        "scheme_glyphs": scheme_glyphs,
+        "mark_attachment": mark_attachment,
+        "words": len(word_mapping),
+        **word_rules,
+        "ligatures": ligatures,
+        "ligature_components": ligature_components,
+        "liga_lookups": liga_lookups,
+        "multiple_subst_entries": multiple_subst_entries,
+        "delete_entries": delete_entries,
+        "mark_chain_subtables": mark_chain_subtables,
+        "mark_coverage_glyphs": mark_coverage_glyphs,
+        "mark_records": new_glyphs if mark_attachment else 0,
+        "base_records": annotated_chars if mark_attachment else 0,
+    }
+
+
+def predict_sizes(base_font, anno_font, counts):
+    """根據字體本身的平均字形大小與 GSUB 結構，預測輸出表格大小 (未校準)"""
+    base_glyf = _font_table_length(base_font, 'glyf')
+    base_glyph_bytes = base_glyf / max(1, counts["base_glyphs"])
+    anno_glyph_bytes = _font_table_length(anno_font, 'glyf') / max(1, len(anno_font.getGlyphOrder()))
+
+    if counts.get("mark_attachment"):
+        # 基礎字形只縮放，註音只在標記字形中繪製一次
+        plain_glyphs = max(0, counts["output_glyphs"] - counts["new_glyphs"])
+        glyf = (
+            plain_glyphs * base_glyph_bytes
+            + counts["new_glyphs"] * anno_glyph_bytes * counts["avg_syllable_len"]
+        )
+    else:
+        annotated_glyphs = counts["annotated_chars"] + counts["new_glyphs"]
+        plain_glyphs = max(0, counts["output_glyphs"] - annotated_glyphs)
+        glyf = (
+            plain_glyphs * base_glyph_bytes
+            + annotated_glyphs * (base_glyph_bytes + anno_glyph_bytes * counts["avg_syllable_len"])
+        )
+    # loca (long format) + hmtx
+    glyf += counts["output_glyphs"] * (4 + 4)
+
+    gsub = (
+        counts["chain_rules"] * CHAIN_RULE_BASE_BYTES
+        + counts["chain_inputs"] * CHAIN_INPUT_GLYPH_BYTES
+        + counts["subst_records"] * SUBST_RECORD_BYTES
+        + counts["chain_subtables"] * CHAIN_SUBTABLE_BYTES
+        + counts["chain_sets"] * CHAIN_SET_BYTES
+        + counts["single_subst_entries"] * SINGLE_SUBST_ENTRY_BYTES
+        + counts["ligatures"] * LIGATURE_BASE_BYTES
+        + counts["ligature_components"] * LIGATURE_COMPONENT_BYTES
+        + counts.get("multiple_subst_entries", 0) * MULTIPLE_SUBST_ENTRY_BYTES
+        + counts.get("delete_entries", 0) * DELETE_ENTRY_BYTES
+        + counts.get("mark_chain_subtables", 0) * MARK_CHAIN_SUBTABLE_BYTES
+        + counts.get("mark_coverage_glyphs", 0) * COVERAGE_GLYPH_BYTES
+    )
+    gsub += _font_table_length(base_font, 'GSUB')
+
+    other = 0
+    if base_font.reader is not None:
+        other = sum(
+            entry.length for tag, entry in base_font.reader.tables.items()
+            if tag not in ('glyf', 'loca', 'hmtx', 'GSUB')
+        )
+    # --marks: GPOS mark-to-base
+    other += (counts.get("mark_records", 0) * MARK_RECORD_BYTES
+              + counts.get("base_records", 0) * BASE_RECORD_BYTES)
+    return {"glyf": round(glyf), "GSUB": round(gsub), "other": other}
+
+
+def calibrate(profiles, base_font_file=None):
+    """
+    從之前的建置記錄計算校準係數。
+    優先使用同一個基礎字體的記錄，否則使用全部記錄。
+    """
+    if base_font_file is not None:
+        same_font = [p for p in profiles if p.get("base_font") == os.path.basename(base_font_file)]
+        if same_font:
+            profiles = same_font
+
+    glyf_ratios, gsub_ratios, woff_ratios = [], [], []
+    load_rates, glyph_rates, gsub_rates, save_rates = [], [], [], []
+
+    for p in profiles:
+        counts = p.get("counts", {})
+        phases = p.get("phases", {})
+        predicted = counts.get("predicted", {})
+        ttf = p.get("outputs", {}).get("ttf")
+        woff = p.get("outputs", {}).get("woff")
+
+        if ttf:
+            tables = ttf.get("tables", {})
+            measured_glyf = tables.get("glyf", 0) + tables.get("loca", 0) + tables.get("hmtx", 0)
+            if predicted.get("glyf"):
+                glyf_ratios.append(measured_glyf / predicted["glyf"])
+            if predicted.get("GSUB") and tables.get("GSUB"):
+                gsub_ratios.append(tables["GSUB"] / predicted["GSUB"])
+            if woff and ttf.get("size"):
+                woff_ratios.append(woff["size"] / ttf["size"])
+            if phases.get("save") and ttf.get("size"):
+                save_rates.append(phases["save"] / ttf["size"])
+
+        if phases.get("load_mapping") and counts.get("mapping_rows"):
+            load_rates.append(phases["load_mapping"] / counts["mapping_rows"])
+        if phases.get("generate_glyphs") and counts.get("drawn_glyphs"):
+            glyph_rates.append(phases["generate_glyphs"] / counts["drawn_glyphs"])
+        gsub_items = counts.get("chain_rules", 0) + counts.get("ligatures", 0)
+        if phases.get("gsub") and gsub_items:
+            gsub_rates.append(phases["gsub"] / gsub_items)
+
+    def median_or(values, default):
+        return statistics.median(values) if values else default
+
+    return {
+        "profiles": len(profiles),
+        "glyf_ratio": median_or(glyf_ratios, 1.0),
+        "gsub_ratio": median_or(gsub_ratios, 1.0),
+        "woff_ratio": median_or(woff_ratios, DEFAULT_WOFF_RATIO),
+        "seconds_per_row": median_or(load_rates, None),
+        "seconds_per_glyph": median_or(glyph_rates, None),
+        "seconds_per_gsub_item": median_or(gsub_rates, None),
+        "seconds_per_output_byte": median_or(save_rates, None),
+    }
+
+
+def estimate(counts, predicted, calibration):
+    """組合計數、結構預測與校準係數，得出輸出大小與建置時間估算"""
+    glyf = predicted["glyf"] * calibration["glyf_ratio"]
+    gsub = predicted["GSUB"] * calibration["gsub_ratio"]
+    ttf_size = glyf + gsub + predicted["other"]
+
+    seconds = None
+    rates = (
+        calibration["seconds_per_row"],
+        calibration["seconds_per_glyph"],
+        calibration["seconds_per_gsub_item"],
+        calibration["seconds_per_output_byte"],
+    )
+    if None not in rates:
+        seconds = (
+            counts.get("mapping_rows", 0) * rates[0]
+            + counts["drawn_glyphs"] * rates[1]
+            + (counts["chain_rules"] + counts["ligatures"]) * rates[2]
+            + ttf_size * rates[3]
+        )
+
+    return {
+        "glyf_bytes": round(glyf),
+        "gsub_bytes": round(gsub),
+        "ttf_bytes": round(ttf_size),
+        "woff_bytes": round(ttf_size * calibration["woff_ratio"]),
+        "seconds": seconds,
+    }
+
+
+def print_dry_run_report(counts, result, calibration):
+    print("="*40)
+    print("Dry run estimate")
+    print("="*40)
+    added = "reading marks" if counts.get("mark_attachment") else "variants"
+    if counts.get("schemes"):
+        added += f" ({counts['scheme_glyphs']} for {counts['schemes']} extra schemes)"
+    print(f"Glyphs: {counts['base_glyphs']} base + {counts['new_glyphs']} {added} = {counts['total_glyphs']} (limit {MAX_GLYPH_COUNT})")
+    if counts["total_glyphs"] > MAX_GLYPH_COUNT:
+        print(f"[ERROR] Glyph count exceeds {MAX_GLYPH_COUNT} by {counts['total_glyphs'] - MAX_GLYPH_COUNT}; the build cannot succeed.")
+    print(f"Annotated chars: {counts['annotated_chars']}, output glyphs: {counts['output_glyphs']}")
+    print(f"Chain rules: {counts['chain_rules']} in {counts['chain_subtables']} subtables ({counts['subst_records']} substitutions, {counts['single_subst_lookups']} single subst lookups)")
+    if counts.get("mark_attachment"):
+        print(f"Mark attachment: {counts['multiple_subst_entries']} base/mark substitutions, "
+              f"{counts['mark_chain_subtables']} mark selection subtables, {counts['mark_records']} marks on {counts['base_records']} bases (GPOS)")
+    else:
+        print(f"Ligatures: {counts['ligatures']} in {counts['liga_lookups']} lookups")
+    print(f"Estimated glyf+loca+hmtx: {result['glyf_bytes']/1024:.0f} KB, GSUB: {result['gsub_bytes']/1024:.0f} KB")
+    print(f"Estimated output: {result['ttf_bytes']/1024/1024:.1f} MB (.ttf), {result['woff_bytes']/1024/1024:.1f} MB (.woff)")
+    if result["seconds"] is not None:
+        print(f"Estimated build time: {result['seconds']/60:.1f} min (calibrated from {calibration['profiles']} previous builds)")
+    else:
+        print("Estimated build time: n/a (no previous build profiles to calibrate from)")
+
+
+def count_mapping_rows(csv_file):
+    with open(csv_file, 'rb') as f:
+        return sum(1 for _ in f)
@@ -0,0 +1,236 @@
+# glyph_qa.py
+# 建置後的字形 QA (--qa)：找出註音與基礎字形重疊、超出字寬或超出垂直度量的字形，不需要逐個目視檢查
+#   - 收集每個註音字形的最終邊界，以及按 generate_glyphs 的排版公式還原的基礎部分與註音部分的邊界，
+#     存為 NumPy 陣列後一次向量化檢查所有字形：
+#       overlap:  基礎部分與註音部分的邊界框交疊 (交疊的高度)
+#       overflow: 字形超出 [0, advance width] 的量
+#       fit:      註音寬於 advance width * (1 - fit_padding) 而被 --fit 壓縮 (未使用 --fit 時為會被壓縮) 的比例，
+#                 以及不壓縮時每側的溢出量
+#       vertical: 字形超出 hhea 與 OS/2 (usWin*) 上下度量的量 (會被裁切)；檢查所有字形
+#   - 最終邊界直接從輸出字形的座標計算；基礎部分使用基礎字體 glyf 標頭中的控制框 (不解碼輪廓)，
+#     註音部分以 measure_anno_string 每個讀音測量一次；旋轉時兩部分為旋轉後的外接框 (偏大)，旋轉且壓縮的註音為近似值
+#   - 每類按嚴重程度 (字體單位) 排序輸出前 QA_REPORT_LIMIT 項；--qa-report FILE 另外把所有問題寫為 CSV
+
+import csv
+import struct
+import time
+import numpy as np
+from build_glyph import prepare_layout, measure_anno_string
+from utils import get_glyph_name_by_char
+import build_log
+
+# 小於或等於此值 (字體單位) 的重疊與溢出視為取整誤差
+QA_TOLERANCE = 1
+
+# 每類問題輸出的項數
+QA_REPORT_LIMIT = 20
+
+QA_KINDS = {
+    "overlap": "base and annotation overlap",
+    "overflow": "outside the advance width",
+    "fit": "annotation wider than the safe width",
+    "vertical": "outside the vertical metrics",
+}
+
+# prepare_layout 不使用的排版參數
+_NON_LAYOUT_OPTIONS = ("top_padding_percent", "bottom_padding_percent")
+
+
+def glyph_boxes(glyf, glyph_names):
+    """
+    返回 (len(glyph_names), 4) 的陣列 (xMin, yMin, xMax, yMax)，空字形為 NaN。
+    未解碼的字形讀取 glyf 標頭，繪製後的字形以其座標一次計算 (np.minimum/maximum.reduceat)。
+    """
+    boxes = np.full((len(glyph_names), 4), np.nan)
+    coordinates, owners = [], []
+    for index, glyph_name in enumerate(glyph_names):
+        glyph = glyf.glyphs.get(glyph_name)
+        if glyph is None:
+            continue
+        if hasattr(glyph, "data"):
+            if len(glyph.data) >= 10:
+                boxes[index] = struct.unpack(">4h", glyph.data[2:10])
+        elif glyph.numberOfContours > 0:
+            coordinates.append(np.frombuffer(glyph.coordinates.array, dtype=np.float64))
+            owners.append(index)
+        elif glyph.numberOfContours < 0 and hasattr(glyph, "xMin"):
+            boxes[index] = (glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax)
+
+    owners = [(index, len(points)) for index, points in zip(owners, coordinates) if len(points)]
+    if owners:
+        points = np.concatenate(coordinates).reshape(-1, 2)
+        starts = np.cumsum([0] + [size // 2 for _, size in owners[:-1]])
+        rows = [index for index, _ in owners]
+        boxes[rows, 0:2] = np.minimum.reduceat(points, starts, axis=0)
+        boxes[rows, 2:4] = np.maximum.reduceat(points, starts, axis=0)
+    return boxes
+
+
+def collect_bounds(base_font, anno_font, output_font, char_mappings, layout_options):
+    """
+    收集所有註音字形的邊界，返回 dict：
+      glyphs/chars/readings: 字形名稱、字與讀音的列表
+      advance: advance width；final: 最終邊界；base/anno: 基礎部分與註音部分的邊界 (N, 4)
+      anno_width: 未壓縮的註音寬度；fit_ratio: --fit 的壓縮比例 (1 為不壓縮，未使用 --fit 時為會使用的比例)
+    char_mappings: 已填入字形名稱的 char_mapping 列表 (主映射與附加方案)
+    """
+    options = {key: value for key, value in layout_options.items() if key not in _NON_LAYOUT_OPTIONS}
+    layout = prepare_layout(base_font, anno_font, output_font.getGlyphSet(), verbose=False, **options)
+
+    glyphs, chars, readings, base_glyphs = [], [], [], []
+    seen = set()
+    for char_mapping in char_mappings:
+        for char, annos in char_mapping.items():
+            base_glyph = get_glyph_name_by_char(base_font, char)
+            for anno_str, value in annos.items():
+                # 不在基礎字體中的字沒有填入字形名稱；cmap 別名與代表字共用字形
+                if value is None or value[0] in seen:
+                    continue
+                seen.add(value[0])
+                glyphs.append(value[0])
+                chars.append(char)
+                readings.append(anno_str)
+                base_glyphs.append(base_glyph)
+
+    # 每個讀音只測量一次
+    syllables = {}
+    for anno_str in readings:
+        if anno_str not in syllables:
+            bounds = measure_anno_string(
+                layout["anno_font"], layout["anno_glyph_set"], layout["anno_glyph_order"], anno_str,
+                layout["anno_scale"], layout["anno_cos"], layout["anno_sin"], layout["spacing_in_units"],
+                layout["anno_bPen"]
+            )
+            syllables[anno_str] = bounds or (np.nan,) * 4
+    anno_rel = np.array([syllables[anno_str] for anno_str in readings], dtype=np.float64).reshape(-1, 4)
+
+    hmtx = output_font["hmtx"]
+    advance = np.array([hmtx[glyph_name][0] for glyph_name in glyphs], dtype=np.float64)
+    final = glyph_boxes(output_font["glyf"], glyphs)
+    base_rel = glyph_boxes(base_font["glyf"], base_glyphs)
+
+    # 基礎部分：與 draw_annotated_glyph 相同，以視覺中心對齊 advance width 的中心
+    xx, xy, yx, yy = layout["base_transform_rel"][:4]
+    corners_x = [xx * base_rel[:, i] + yx * base_rel[:, j] for i in (0, 2) for j in (1, 3)]
+    corners_y = [xy * base_rel[:, i] + yy * base_rel[:, j] for i in (0, 2) for j in (1, 3)]
+    center_x = (base_rel[:, 0] + base_rel[:, 2]) / 2
+    center_y = (base_rel[:, 1] + base_rel[:, 3]) / 2
+    dx = advance / 2 - (center_x * xx + center_y * yx)
+    base = np.stack([np.min(corners_x, axis=0) + dx, np.min(corners_y, axis=0) + layout["final_base_dy"],
+                     np.max(corners_x, axis=0) + dx, np.max(corners_y, axis=0) + layout["final_base_dy"]], axis=1)
+
+    # 註音部分：與 draw_anno_string 相同，寬於安全寬度時 (--fit) 水平壓縮
+    safe_width_factor = 1.0 - layout["fit_padding"]
+    if safe_width_factor <= 0:
+        safe_width_factor = 1.0
+    anno_width = anno_rel[:, 2] - anno_rel[:, 0]
+    safe_width = advance * safe_width_factor
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fit_ratio = np.where((anno_width > safe_width) & (safe_width > 0), safe_width / anno_width, 1.0)
+    ratio = fit_ratio if layout["fit"] else np.ones_like(fit_ratio)
+    anno_center = (anno_rel[:, 0] + anno_rel[:, 2]) / 2
+    anno = np.stack([advance / 2 + (anno_rel[:, 0] - anno_center) * ratio, anno_rel[:, 1] + layout["final_anno_dy"],
+                     advance / 2 + (anno_rel[:, 2] - anno_center) * ratio, anno_rel[:, 3] + layout["final_anno_dy"]], axis=1)
+
+    return {
+        "glyphs": glyphs, "chars": chars, "readings": readings,
+        "advance": advance, "final": final, "base": base, "anno": anno,
+        "anno_width": anno_width, "fit_ratio": fit_ratio, "fit": layout["fit"],
+    }
+
+
+def _issues(kind, severity, labels, details):
+    """返回嚴重程度大於 QA_TOLERANCE 的問題，按嚴重程度降序"""
+    severity = np.nan_to_num(severity, nan=0.0)
+    hits = np.flatnonzero(severity > (QA_TOLERANCE if kind != "fit" else 0))
+    hits = hits[np.argsort(-severity[hits], kind="stable")]
+    glyphs, chars, readings = labels
+    return [{"kind": kind, "severity": round(float(severity[i]), 2), "glyph": glyphs[i],
+             "char": chars[i], "reading": readings[i], "detail": details(i)} for i in hits]
+
+
+def check_glyphs(bounds, output_font):
+    """向量化檢查 collect_bounds() 的結果與輸出字體的所有字形，返回 {類別: [問題, ...]} (按嚴重程度降序)"""
+    labels = (bounds["glyphs"], bounds["chars"], bounds["readings"])
+    base, anno, final, advance = bounds["base"], bounds["anno"], bounds["final"], bounds["advance"]
+    issues = {}
+
+    with np.errstate(invalid="ignore"):
+        overlap_x = np.minimum(base[:, 2], anno[:, 2]) - np.maximum(base[:, 0], anno[:, 0])
+        overlap_y = np.minimum(base[:, 3], anno[:, 3]) - np.maximum(base[:, 1], anno[:, 1])
+        overlap = np.where((overlap_x > 0) & (overlap_y > 0), overlap_y, 0.0)
+        issues["overlap"] = _issues("overlap", overlap, labels,
+                                    lambda i: f"{overlap_x[i]:.0f} x {overlap_y[i]:.0f} units")
+
+        left, right = -final[:, 0], final[:, 2] - advance
+        overflow = np.fmax(np.fmax(left, right), 0.0)
+        issues["overflow"] = _issues("overflow", overflow, labels,
+                                     lambda i: f"left {max(left[i], 0):.0f}, right {max(right[i], 0):.0f}, advance {advance[i]:.0f}")
+
+        # 不壓縮時註音每側的溢出量；嚴重程度為壓縮的比例
+        spill = np.fmax((bounds["anno_width"] - advance) / 2, 0.0)
+        verb = "compressed" if bounds["fit"] else "would be compressed"
+        issues["fit"] = _issues("fit", (1.0 - bounds["fit_ratio"]) * 100, labels,
+                                lambda i: f"{verb} to {bounds['fit_ratio'][i]:.0%} by --fit; {spill[i]:.0f} units per side without it")
+
+    # 垂直度量：所有字形
+    glyph_order = output_font.getGlyphOrder()
+    boxes = glyph_boxes(output_font["glyf"], glyph_order)
+    top_limit, bottom_limit = output_font["hhea"].ascent, output_font["hhea"].descent
+    if "OS/2" in output_font:
+        top_limit = min(top_limit, output_font["OS/2"].usWinAscent)
+        bottom_limit = max(bottom_limit, -output_font["OS/2"].usWinDescent)
+    reverse_cmap = {}
+    for code, glyph_name in output_font.getBestCmap().items():
+        reverse_cmap.setdefault(glyph_name, chr(code))
+    readings = dict(zip(bounds["glyphs"], bounds["readings"]))
+    chars = dict(zip(bounds["glyphs"], bounds["chars"]))
+    vertical_labels = (glyph_order,
+                       [chars.get(glyph_name, reverse_cmap.get(glyph_name, "")) for glyph_name in glyph_order],
+                       [readings.get(glyph_name, "") for glyph_name in glyph_order])
+    with np.errstate(invalid="ignore"):
+        above, below = boxes[:, 3] - top_limit, bottom_limit - boxes[:, 1]
+        vertical = np.fmax(np.fmax(above, below), 0.0)
+    issues["vertical"] = _issues("vertical", vertical, vertical_labels,
+                                 lambda i: f"yMax {boxes[i, 3]:.0f} / yMin {boxes[i, 1]:.0f}, limits {top_limit} / {bottom_limit}")
+    return issues
+
+
+def print_qa_report(issues, limit=QA_REPORT_LIMIT):
+    """經由 build_log 以 INFO 等級輸出每類問題的數量與最嚴重的 limit 個 (-q 時不輸出，--log-detail 時一併記錄)"""
+    if not build_log.wants_detail(build_log.INFO):
+        return
+    for kind, kind_issues in issues.items():
+        if not kind_issues:
+            continue
+        unit = "%" if kind == "fit" else "units"
+        build_log.info(f"QA {kind}: {len(kind_issues):,} glyphs {QA_KINDS[kind]}" +
+                       (f" (top {limit})" if len(kind_issues) > limit else ""), kind=kind, count=len(kind_issues))
+        build_log.info(f"  {unit:>7}  {'glyph':<20} {'char':<4} {'reading':<12} detail")
+        for issue in kind_issues[:limit]:
+            build_log.info(f"  {issue['severity']:>7.1f}  {issue['glyph']:<20} {issue['char']:<4} {issue['reading']:<12} {issue['detail']}",
+                           **issue)
+
+
+def save_qa_report(report_file, issues):
+    """把所有問題寫為 CSV (每類按嚴重程度降序)"""
+    with open(report_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=("kind", "severity", "glyph", "char", "reading", "detail"))
+        writer.writeheader()
+        for kind_issues in issues.values():
+            writer.writerows(kind_issues)
+
+
+def run_qa(base_font, anno_font, output_font, char_mappings, layout_options, report_file=None):
+    """檢查輸出字體並輸出排序的報告，返回 {類別: [問題, ...]}"""
+    start = time.perf_counter()
+    bounds = collect_bounds(base_font, anno_font, output_font, char_mappings, layout_options)
+    issues = check_glyphs(bounds, output_font)
+    build_log.info(f"Glyph QA: checked {len(bounds['glyphs']):,} annotated and {len(output_font.getGlyphOrder()):,} total glyphs "
+                   f"in {time.perf_counter() - start:.2f} s; " +
+                   ", ".join(f"{len(kind_issues):,} {kind}" for kind, kind_issues in issues.items()) + ".")
+    print_qa_report(issues)
+    if report_file:
+        save_qa_report(report_file, issues)
+        build_log.info(f"Glyph QA report saved as {report_file}")
+    return issues
@@ -0,0 +1,110 @@
+# glyph_source.py
+# 有界的字形來源：取代 TTFont.getGlyphSet() 用於繪製輸入字體的字形
+#   - getGlyphSet() 繪製時會就地解碼 glyf 表中的字形，解碼後的字形在字體關閉前一直留在記憶體中
+#   - GlyphSource 從 glyf 表中未解碼的原始資料解碼出獨立的字形物件，最多保留 size 個 (LRU)，
+#     glyf 表本身保持未解碼；處理完的字形可以用 release() 立即釋放
+#   - 已經解碼 (或已被替換) 的字形直接使用，不佔快取
+#   - 只讀取 glyf 表，多個線程可以各自用一個 GlyphSource 讀取同一個字體
+
+from collections import OrderedDict
+from fontTools.ttLib.tables._g_l_y_f import Glyph
+import build_log
+
+# 預設最多保留的已解碼字形數 (組合字形的組件也會經過快取，數百個已足夠讓常用組件常駐)
+GLYPH_SOURCE_SIZE = 512
+
+
+class _SourceGlyph:
+    """與 getGlyphSet() 返回的字形相同的繪製介面"""
+
+    __slots__ = ("source", "name", "width", "lsb")
+
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+        self.width, self.lsb = source.metrics.get(name, (0, 0))
+
+    def draw(self, pen):
+        source = self.source
+        glyph = source.glyph(self.name)
+        # 與 fontTools 相同：hmtx 的 lsb 與 xMin 不同時平移，只用於最外層 (組件不平移)
+        offset = self.lsb - glyph.xMin if source.depth == 0 and hasattr(glyph, "xMin") else 0
+        source.depth += 1
+        try:
+            glyph.draw(pen, source.glyf, offset)
+        finally:
+            source.depth -= 1
+
+
+class GlyphSource:
+    """以字形名稱索引的字形集合 (可傳給 BoundsPen / TTGlyphPen 解析組件)，附帶命中與未命中計數"""
+
+    def __init__(self, font, size=GLYPH_SOURCE_SIZE):
+        self.glyf = font['glyf']
+        self.metrics = font['hmtx'].metrics if 'hmtx' in font else {}
+        self.size = size
+        self.cache = OrderedDict()
+        self.depth = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.peak = 0
+
+    def __contains__(self, glyph_name):
+        return glyph_name in self.glyf.glyphs
+
+    def __iter__(self):
+        return iter(self.glyf.glyphs)
+
+    def __len__(self):
+        return len(self.glyf.glyphs)
+
+    def keys(self):
+        return self.glyf.glyphs.keys()
+
+    def __getitem__(self, glyph_name):
+        if glyph_name not in self.glyf.glyphs:
+            raise KeyError(glyph_name)
+        return _SourceGlyph(self, glyph_name)
+
+    def get(self, glyph_name, default=None):
+        return self[glyph_name] if glyph_name in self else default
+
+    def glyph(self, glyph_name):
+        """返回已解碼的字形 (fontTools Glyph)"""
+        stored = self.glyf.glyphs[glyph_name]
+        if not hasattr(stored, "data"):
+            # 已解碼的字形由 glyf 表持有，不需要快取
+            return stored
+        glyph = self.cache.get(glyph_name)
+        if glyph is not None:
+            self.hits += 1
+            self.cache.move_to_end(glyph_name)
+            return glyph
+        self.misses += 1
+        glyph = Glyph(stored.data)
+        glyph.expand(self.glyf)
+        self.cache[glyph_name] = glyph
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        self.peak = max(self.peak, len(self.cache))
+        return glyph
+
+    def release(self, glyph_name):
+        """字形已處理完畢，從快取中移除"""
+        self.cache.pop(glyph_name, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "peak": self.peak, "size": self.size}
+
+
+def glyph_source_report(name, source):
+    stats = source.stats()
+    lookups = stats["hits"] + stats["misses"]
+    if not lookups:
+        return
+    build_log.info(f"{name} glyph source: {stats['hits']} hits, {stats['misses']} misses "
+                   f"({stats['hits'] / lookups:.0%} hit rate), {stats['evictions']} evicted, "
+                   f"at most {stats['peak']} of {stats['size']} decompiled glyphs held.")
@@ -4,10 +4,13 @@ from fontTools.ttLib.tables import otTables
 from fontTools.otlLib import builder
 from utils import get_glyph_name_by_char, chunk, buildDefaultLangSys
 from typing import Dict, Tuple, Any
+import build_log
 
 chunk_size = 5000
 
-def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
+def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]],
+              base_glyphs: Dict[str, str] = None, featureTag: str = 'liga'):
+    # base_glyphs: [多方案] {字: 數字 0 選擇的預設字形}，取代 cmap 中的字形；featureTag: lookup 所屬的 feature
     gsub = output_font["GSUB"].table
 
     # 1. 建立數字 0-9 的字形名稱映射
@@ -19,13 +22,13 @@ def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
             number_glyph_names[i] = glyph_name
             
     if not number_glyph_names:
-        print("Warning: Cannot find glyphs for numbers 0-9 in the font. Number-based liga rules will be skipped if absent.")
+        build_log.warning("Cannot find glyphs for numbers 0-9 in the font. Number-based liga rules will be skipped if absent.")
 
     # 1b. 獲取 '丅' 字元的字形名稱（單個丅作為 trigger）
     hen_char = '丅'
     hen_glyph_name = get_glyph_name_by_char(output_font, hen_char)
     if not hen_glyph_name:
-        print("Warning: Cannot find glyph for '丅' in the font. '丅'+chinese-numeral fallback rules will be skipped if absent.")
+        build_log.warning("Cannot find glyph for '丅' in the font. '丅'+chinese-numeral fallback rules will be skipped if absent.")
 
     # 1c. 獲取中文數字字元的字形名稱映射 (零 一 二 三 四 五 六 七 八 九)
     chinese_numerals = ['零','一','二','三','四','五','六','七','八','九']
@@ -36,11 +39,11 @@ def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
             chinese_numeral_glyphs[idx] = glyph
 
     if not chinese_numeral_glyphs:
-        print("Warning: Cannot find any Chinese numeral glyphs (零-九) in the font. '丅'+chinese-numeral fallback rules will be skipped if absent.")
+        build_log.warning("Cannot find any Chinese numeral glyphs (零-九) in the font. '丅'+chinese-numeral fallback rules will be skipped if absent.")
 
     # 如果既沒有阿拉伯數字，也沒有丅+中文數字可用，則提前返回
     if not number_glyph_names and (not hen_glyph_name or not chinese_numeral_glyphs):
-        print("Error: No trigger glyphs found for either direct numbers or '丅'+chinese numerals. Skipping buildLiga.")
+        build_log.error("No trigger glyphs found for either direct numbers or '丅'+chinese numerals. Skipping buildLiga.")
         return
 
     # 2. 遍歷數據塊，為每個塊建立一個 Lookup Subtable
@@ -53,7 +56,10 @@ def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
             # --- 高效的規則建立邏輯 ---
 
             # a. 獲取該字的原始預設字形
-            default_glyph_name = get_glyph_name_by_char(output_font, original_char)
+            if base_glyphs and original_char in base_glyphs:
+                default_glyph_name = base_glyphs[original_char]
+            else:
+                default_glyph_name = get_glyph_name_by_char(output_font, original_char)
             if not default_glyph_name:
                 continue
 
@@ -102,7 +108,6 @@ def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
         # --- 後續的 GSUB 表寫入邏輯 (與之前版本相同) ---
         if len(ligaBuilder.ligatures) > 0:
             # 檢查 'liga/rlig/dlig/calt/ccmp' feature 是否存在
-            featureTag = 'liga'
             ligaFeatureIndexes = [i for i, featureRecord in enumerate(gsub.FeatureList.FeatureRecord) if featureRecord.FeatureTag == featureTag]
             
             new_lookup_index = len(gsub.LookupList.Lookup)
@@ -110,6 +115,7 @@ def buildLiga(output_font, char_mapping: Dict[str, Dict[str, Tuple[str, int]]]):
             if not ligaFeatureIndexes:
                 featureRecord = otTables.FeatureRecord()
                 featureRecord.Feature = otTables.Feature()
+                featureRecord.Feature.FeatureParams = None  # 與解碼得到的 Feature 相同，子集化時需要此屬性
                 featureRecord.FeatureTag = featureTag
                 featureRecord.Feature.LookupListIndex = [new_lookup_index]
                 featureRecord.Feature.LookupCount = 1
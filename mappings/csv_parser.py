@@ -3,12 +3,18 @@
 import csv
 from collections import defaultdict
 import re
+import build_log
 
 # 只保留長度 <= 7 的詞組 根據實際情況調整
 MAX_base_chars = 7
 # 每個單字的最大註音變體數量限制
 MAX_CHAR_VARIANTS = 10
 
+# build_log 的彙總訊息 (逐行事件只計數)
+SKIPPED_MISSING_CHAR = "Skipped {count:,} mapping rows: characters not in the base font"
+SKIPPED_LONG_WORD = f"Skipped {{count:,}} words longer than {MAX_base_chars} characters"
+TRUNCATED_VARIANTS = f"Kept only the {MAX_CHAR_VARIANTS} heaviest readings of {{count:,}} characters"
+
 # --- 輔助函數：從註音字串中提取聲調 ---
 def get_tone(anno_str):
     """
@@ -21,7 +27,30 @@ def get_tone(anno_str):
         return int(match.group(1))
     return 5 # 輕聲或無聲調，給予預設值以便排序
 
-def load_mapping(font, csv_file):
+def read_mapping_rows(csv_file):
+    """只讀取 CSV 行 (不需要字體)，可以在載入字體的同時在另一個線程執行"""
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+def select_top_chars(char_cnt, top_chars):
+    """返回總權重最高的 top_chars 個字 (同權重時按首次出現的順序)"""
+    totals = {char: sum(cnts.values()) for char, cnts in char_cnt.items()}
+    ranked = sorted(totals, key=lambda char: -totals[char])
+    kept = set(ranked[:top_chars])
+    total_weight = sum(totals.values())
+    kept_weight = sum(totals[char] for char in kept)
+    build_log.info(f"--top-chars: kept {len(kept)} of {len(totals)} characters "
+                   f"({kept_weight / total_weight:.1%} of the total weight)." if total_weight else
+                   f"--top-chars: kept {len(kept)} of {len(totals)} characters.")
+    return kept
+
+def load_mapping(font, csv_file, rows=None, word_weights=None, top_chars=None):
+    """
+    word_weights: 傳入的字典會被清空並填為 {詞組: 權重} (word_mapping 中保留的條目的權重)
+    top_chars: 只保留總權重最高的 N 個字，以及完全由這些字組成的詞組
+    """
+    if rows is None:
+        rows = read_mapping_rows(csv_file)
     cmap = font.getBestCmap()
     word_mapping = {}
     char_cnt = defaultdict(lambda: defaultdict(int))
@@ -33,41 +62,46 @@ def load_mapping(font, csv_file):
     # all_csv_entries 用於追蹤所有條目(單字+詞組)，以便在丟棄註音時報告來源
     all_csv_entries = []
     
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if len(row) >= 2:
-                base_chars = row[0]
-                anno_str_raw = row[1]
-                anno_strs = anno_str_raw.split(' ')
-                # 詞條權重：如果第三欄是數字則取其值，否則默認為 1
-                weight = int(row[2]) if len(row) > 2 and row[2].isdigit() else 1 
+    for row in rows:
+        if len(row) >= 2:
+            base_chars = row[0]
+            anno_str_raw = row[1]
+            anno_strs = anno_str_raw.split(' ')
+            # 詞條權重：如果第三欄是數字則取其值，否則默認為 1
+            weight = int(row[2]) if len(row) > 2 and row[2].isdigit() else 1 
 
-                if True in [ord(char) not in cmap for char in base_chars]:
-                    print(f"Skip {base_chars} as there is char not found in the font")
-                    continue
+            if True in [ord(char) not in cmap for char in base_chars]:
+                build_log.count(SKIPPED_MISSING_CHAR, word=base_chars)
+                continue
+            
+            if len(base_chars) == len(anno_strs):
                 
-                if len(base_chars) == len(anno_strs):
-                    
-                    # --- [修改] ---
-                    # 需求 1：收集所有 CSV 條目 (單字和詞組) 以便後續追蹤來源
-                    all_csv_entries.append((base_chars, anno_strs, weight))
-                    
-                    if len(base_chars) > 1:
-                        if len(base_chars) <= MAX_base_chars: # 只保留長度 <= MAX_base_chars 的詞組
-                            MIN_WEIGHT = 1  # 可調整權重閾值
-                            if weight >= MIN_WEIGHT:
-                                # 詞組處理：儲存詞組、拼音列表和權重 (這部分保持不變，用於生成 word_mapping)
-                                raw_word_entries.append((base_chars, anno_strs, weight))
-                        else:
-                            # 新增的列印信息：大於 MAX_base_chars 的詞組跳過
-                            print(f"Skip, {len(base_chars)} is too long (>{MAX_base_chars})， word'{base_chars}'。")
+                # --- [修改] ---
+                # 需求 1：收集所有 CSV 條目 (單字和詞組) 以便後續追蹤來源
+                all_csv_entries.append((base_chars, anno_strs, weight))
                 
-                    # 單字和字頻處理
-                    for base_char, anno_str in zip(base_chars, anno_strs):
-                        if anno_str != '':
-                            char_cnt[base_char][anno_str] += weight
-                            
+                if len(base_chars) > 1:
+                    if len(base_chars) <= MAX_base_chars: # 只保留長度 <= MAX_base_chars 的詞組
+                        MIN_WEIGHT = 1  # 可調整權重閾值
+                        if weight >= MIN_WEIGHT:
+                            # 詞組處理：儲存詞組、拼音列表和權重 (這部分保持不變，用於生成 word_mapping)
+                            raw_word_entries.append((base_chars, anno_strs, weight))
+                    else:
+                        # 大於 MAX_base_chars 的詞組跳過
+                        build_log.count(SKIPPED_LONG_WORD, word=base_chars, length=len(base_chars))
+            
+                # 單字和字頻處理
+                for base_char, anno_str in zip(base_chars, anno_strs):
+                    if anno_str != '':
+                        char_cnt[base_char][anno_str] += weight
+                        
+    if top_chars is not None:
+        kept_chars = select_top_chars(char_cnt, top_chars)
+        char_cnt = {char: cnts for char, cnts in char_cnt.items() if char in kept_chars}
+        word_count = len({entry[0] for entry in raw_word_entries})
+        raw_word_entries = [entry for entry in raw_word_entries if all(char in kept_chars for char in entry[0])]
+        build_log.info(f"--top-chars: kept {len({entry[0] for entry in raw_word_entries})} of {word_count} words made only of these characters.")
+
     # --- char_mapping 的排序與截斷邏輯 ---
     char_mapping_raw = {}
     for char, cnts in char_cnt.items():
@@ -83,44 +117,48 @@ def load_mapping(font, csv_file):
             kept_variants = sorted_cnts[:MAX_CHAR_VARIANTS]
             discarded_variants = sorted_cnts[MAX_CHAR_VARIANTS:]
             
-            kept_str = [f"{item[0]} (weight:{item[1]})" for item in kept_variants]
+            # 找出被丟棄發音的來源需要遍歷所有條目，只在輸出或記錄詳細資訊時計算
+            if build_log.wants_detail():
+                kept_str = [f"{item[0]} (weight:{item[1]})" for item in kept_variants]
             
-            # --- [修改] ---
-            # 為了找出是哪些詞組 (或單字) 使用了這些被丟棄的發音
-            discarded_annos_set = {item[0] for item in discarded_variants} # 取得所有被丟棄的發音 (e.g., {'di2', 'di4'})
-            problematic_entries = defaultdict(set) # key: 被丟棄的發音, value: set(包含該發音的詞組或單字)
+                # --- [修改] ---
+                # 為了找出是哪些詞組 (或單字) 使用了這些被丟棄的發音
+                discarded_annos_set = {item[0] for item in discarded_variants} # 取得所有被丟棄的發音 (e.g., {'di2', 'di4'})
+                problematic_entries = defaultdict(set) # key: 被丟棄的發音, value: set(包含該發音的詞組或單字)
             
-            # 需求 2：遍歷所有 CSV 條目 (all_csv_entries) 來查找來源，而不是只查詞組 (raw_word_entries)
-            for word, annos, _ in all_csv_entries: # <--- [核心修改]
-                for i, c in enumerate(word):
-                    if c == char and annos[i] in discarded_annos_set:
-                        # 這個詞 (word) 的第 i 個字 (c) 是當前處理的字 (char)
-                        # 且其發音 (annos[i]) 是被丟棄的發音之一
-                        problematic_entries[annos[i]].add(word)
+                # 需求 2：遍歷所有 CSV 條目 (all_csv_entries) 來查找來源，而不是只查詞組 (raw_word_entries)
+                for word, annos, _ in all_csv_entries: # <--- [核心修改]
+                    for i, c in enumerate(word):
+                        if c == char and annos[i] in discarded_annos_set:
+                            # 這個詞 (word) 的第 i 個字 (c) 是當前處理的字 (char)
+                            # 且其發音 (annos[i]) 是被丟棄的發音之一
+                            problematic_entries[annos[i]].add(word)
 
-            # 構建更詳細的 discarded_str
-            discarded_str_detailed = []
-            for anno, weight in discarded_variants:
-                entry_str = f"{anno} (weight:{weight})"
-                if anno in problematic_entries:
-                    # 為了避免訊息太長，只顯示幾個例子，最多3個
-                    example_words = list(problematic_entries[anno])[:3]
-                    examples_str = ", ".join([f"'{w}'" for w in example_words])
-                    if len(problematic_entries[anno]) > 3:
-                        examples_str += ", ..." # 如果來源詞組太多，用 ... 省略
-                    entry_str += f" [found in: {examples_str}]"
-                discarded_str_detailed.append(entry_str)
-            # --- [修改結束] ---
-            
-            
-            # --- [修改後的 print] ---
-            # 使用新構建的 discarded_str_detailed 替換舊的 discarded_str
-            print(f"Skip, {len(discarded_variants)} annos of '{char}': {', '.join(discarded_str_detailed)}, too high {len(sorted_cnts)}>{MAX_CHAR_VARIANTS}, Keep {len(kept_variants)} : {', '.join(kept_str)}")
+                # 構建更詳細的 discarded_str
+                discarded_str_detailed = []
+                for anno, weight in discarded_variants:
+                    entry_str = f"{anno} (weight:{weight})"
+                    if anno in problematic_entries:
+                        # 為了避免訊息太長，只顯示幾個例子，最多3個
+                        example_words = list(problematic_entries[anno])[:3]
+                        examples_str = ", ".join([f"'{w}'" for w in example_words])
+                        if len(problematic_entries[anno]) > 3:
+                            examples_str += ", ..." # 如果來源詞組太多，用 ... 省略
+                        entry_str += f" [found in: {examples_str}]"
+                    discarded_str_detailed.append(entry_str)
+                # --- [修改結束] ---
             
+                build_log.count(TRUNCATED_VARIANTS, char=char, readings=len(sorted_cnts),
+                                kept=", ".join(kept_str), discarded=", ".join(discarded_str_detailed))
+            else:
+                build_log.count(TRUNCATED_VARIANTS)
+
             sorted_cnts = kept_variants
         
         char_mapping_raw[char] = {k: None for k, v in sorted_cnts}
 
+    build_log.summarize()
+
     # --- [核心修正] word_mapping 的排序邏輯 ---
     # (這部分不需要修改，它仍然正確地使用 raw_word_entries 來生成 "詞組" 映射)
     
@@ -139,8 +177,12 @@ def load_mapping(font, csv_file):
     # 由於 Python 3.7+ 的字典會保持插入順序，
     # 這裡生成的 word_mapping_final 將會是已經排序好的。
     word_mapping_final = {}
-    for word, anno_strs, _ in sorted_word_entries:
+    if word_weights is not None:
+        word_weights.clear()
+    for word, anno_strs, weight in sorted_word_entries:
         if word not in word_mapping_final:
             word_mapping_final[word] = anno_strs
+            if word_weights is not None:
+                word_weights[word] = weight
     
     return (word_mapping_final, char_mapping_raw)
\ No newline at end of file
@@ -0,0 +1,333 @@
+# mark_attachment.py
+# --marks 模式：以 GPOS 標記附著取代預先合成的 (字 + 註音) 字形
+#   - 每個有註音的字只有一個基礎字形，縮放並放在有註音時的位置
+#   - 每個讀音 (註音字串) 一個零寬度標記字形，所有同音字共用
+#   - GSUB: 變體 k 的 MultipleSubst lookup 將基礎字形替換為 (基礎字形, 第 k 個讀音的標記)
+#       calt: 詞組規則 (chain_context_handler) 插入非預設讀音的標記
+#       liga: 字 + 數字 / 字 + 丅 + 中文數字 選擇讀音 (刪除數字與已插入的標記，插入對應的標記)
+#       calt: 之後仍沒有標記的基礎字形插入預設讀音的標記
+#   - GPOS mark-to-base: 基礎字形的錨點在寬度中點，標記以原點為錨點，與 generate_glyphs 的置中計算相同
+# 字形數量由「字數 × 讀音數」降為「字數 + 讀音數」。
+#
+# 與合成模式的差異：同一個標記用於所有字，auto-width 無法按讀音加寬字形 (忽略)，
+# fit 以有註音字形最常見的寬度計算壓縮。
+
+import collections
+from fontTools.ttLib import newTable
+from fontTools.ttLib.tables import otTables
+from fontTools.otlLib import builder
+from build_glyph import (
+    GLYPH_PREFIX, find_cmap_aliases, prepare_layout, measure_base_glyph,
+    draw_annotated_glyph, draw_unannotated_glyph, draw_mark_glyph,
+    store_unannotated_glyph, unannotated_glyph_names, apply_auto_height
+)
+from chain_context_handler import buildChainSub, MAX_VARIANT_LOOKUPS, _update_or_create_feature
+from rule_analysis import PRUNE_SAFE
+from utils import get_glyph_name_by_char, buildDefaultLangSys
+import build_log
+
+MARK_PREFIX = GLYPH_PREFIX + "mark"
+
+# GDEF 字形類別
+GDEF_BASE = 1
+GDEF_MARK = 3
+
+CHINESE_NUMERALS = ['零', '一', '二', '三', '四', '五', '六', '七', '八', '九']
+
+
+def assign_mark_names(base_font, output_font, mapping):
+    """
+    為每個讀音分配一個標記字形名稱，mapping 的值填為 (標記名稱, variant_index)；cmap 保持指向基礎字形。
+    cmap 中指向同一字形的字只繪製一次基礎字形；它們的讀音不同時無法區分，GSUB 使用第一個字的讀音。
+    返回 (bases, marks, processed_glyph_names)；bases 為 [(base_char, glyph_name), ...]，marks 為 {anno_str: 標記名稱}
+    """
+    base_glyph_set = base_font.getGlyphSet()
+    base_glyph_order = set(base_font.getGlyphOrder())
+    output_glyph_order = output_font.getGlyphOrder()
+    output_glyph_order_set = set(output_glyph_order)
+    output_font['glyf']  # glyf 的 glyph order 與字體共用，須在加入新名稱前載入
+
+    bases = []
+    marks = {}
+    processed_glyph_names = set()
+    cnt = 0
+
+    _, conflicts = find_cmap_aliases(base_font, mapping)
+    if conflicts:
+        build_log.info(f"--marks: {len(conflicts)} glyphs are shared by code points with different readings, "
+                       f"the first character's readings apply to all of them: "
+                       + ", ".join(" / ".join(f"U+{ord(char):04X}" for char in chars) for chars in list(conflicts.values())[:5])
+                       + (" ..." if len(conflicts) > 5 else ""))
+
+    for base_char, anno_strs_dict in mapping.items():
+        glyph_name = get_glyph_name_by_char(base_font, base_char)
+        if not isinstance(glyph_name, str) or glyph_name not in base_glyph_order:
+            continue
+        is_alias = glyph_name in processed_glyph_names
+        processed_glyph_names.add(glyph_name)
+        if glyph_name not in base_glyph_set:
+            continue
+
+        for i, anno_str in enumerate(anno_strs_dict.keys()):
+            if anno_str not in marks:
+                mark_name = MARK_PREFIX + str(cnt).zfill(6)
+                while mark_name in output_glyph_order_set:
+                    cnt += 1
+                    mark_name = MARK_PREFIX + str(cnt).zfill(6)
+                cnt += 1
+                marks[anno_str] = mark_name
+                output_glyph_order.append(mark_name)
+                output_glyph_order_set.add(mark_name)
+            mapping[base_char][anno_str] = (marks[anno_str], i)
+        if not is_alias:
+            bases.append((base_char, glyph_name))
+
+    return bases, marks, processed_glyph_names
+
+
+def generate_mark_glyphs(
+    base_font, anno_font, output_font, mapping,
+    top_padding_percent=None,
+    bottom_padding_percent=None,
+    **layout_options
+):
+    """
+    繪製基礎字形、標記字形與沒有註音的字形 (對應 generate_glyphs)，
+    返回 (bases, marks, anchors)；anchors 為 {基礎字形名稱: 錨點 x}
+    """
+    layout = prepare_layout(base_font, anno_font, output_font.getGlyphSet(), **layout_options)
+    if layout["auto_width"]:
+        build_log.info("--marks: one mark is shared by every character with the same reading, auto-width is ignored.")
+
+    bases, marks, processed_glyph_names = assign_mark_names(base_font, output_font, mapping)
+    output_font.getReverseGlyphMap(rebuild=True)
+
+    auto_height = layout_options.get("auto_height", False)
+    global_max_y = -99999
+    global_min_y = 99999
+
+    def track(bounds):
+        nonlocal global_min_y, global_max_y
+        if auto_height and bounds:
+            if bounds[1] < global_min_y: global_min_y = bounds[1]
+            if bounds[3] > global_max_y: global_max_y = bounds[3]
+
+    # --- 第一部分: 基礎字形 (與合成字形中的基礎字形位置相同，只是沒有註音) ---
+    anchors = {}
+    for base_char, glyph_name in bases:
+        result = draw_annotated_glyph(layout, glyph_name, "", measure_base_glyph(layout, glyph_name))
+        store_unannotated_glyph(output_font, glyph_name, result)
+        anchors[glyph_name] = round(result[1] / 2)
+        track(result[3])
+        layout["base_glyph_set"].release(glyph_name)
+
+    # --- 第二部分: 標記字形 ---
+    widths = collections.Counter(output_font['hmtx'][glyph_name][0] for _, glyph_name in bases)
+    reference_width = widths.most_common(1)[0][0] if widths else output_font['head'].unitsPerEm
+    for anno_str, mark_name in marks.items():
+        glyph, advance_width, lsb, bounds = draw_mark_glyph(layout, anno_str, reference_width)
+        output_font['glyf'][mark_name] = glyph
+        output_font['hmtx'][mark_name] = (advance_width, lsb)
+        if 'vmtx' in output_font:
+            output_font['vmtx'][mark_name] = (0, 0)
+        track(bounds)
+
+    # --- 第三部分: 沒有註音的字形 ---
+    glyph_names, skipped_no_outline = unannotated_glyph_names(base_font, processed_glyph_names, output_font)
+    for glyph_name in glyph_names:
+        result = draw_unannotated_glyph(layout, glyph_name)
+        store_unannotated_glyph(output_font, glyph_name, result)
+        if not result[0].isComposite():
+            track(result[3])
+
+    if skipped_no_outline:
+        build_log.info(f"Skipped {len(skipped_no_outline)} empty glyphs.")
+    build_log.info(f"Mark attachment: {len(bases)} base glyphs and {len(marks)} reading marks "
+                   f"instead of {sum(len(v) for v in mapping.values())} annotated glyphs.")
+
+    if auto_height and global_max_y != -99999:
+        apply_auto_height(output_font, global_min_y, global_max_y, layout_options.get("invert", False),
+                          top_padding_percent, bottom_padding_percent)
+
+    return bases, marks, anchors
+
+
+def _append_lookup(table, lookup):
+    table.LookupList.Lookup.append(lookup)
+    table.LookupList.LookupCount = len(table.LookupList.Lookup)
+    return len(table.LookupList.Lookup) - 1
+
+
+def _subst_record(sequence_index, lookup_index):
+    record = otTables.SubstLookupRecord()
+    record.SequenceIndex = sequence_index
+    record.LookupListIndex = lookup_index
+    return record
+
+
+def _chain_subtable(glyph_map, input_glyphs, lookahead_glyphs=(), records=()):
+    """ChainContextSubst Format 3 (每個位置一個 Coverage)；records 為 [(位置, lookup 索引)]"""
+    subtable = otTables.ChainContextSubst()
+    subtable.Format = 3
+    subtable.BacktrackCoverage = []
+    subtable.BacktrackGlyphCount = 0
+    subtable.InputCoverage = [builder.buildCoverage(glyphs, glyph_map) for glyphs in input_glyphs]
+    subtable.InputGlyphCount = len(subtable.InputCoverage)
+    subtable.LookAheadCoverage = [builder.buildCoverage(glyphs, glyph_map) for glyphs in lookahead_glyphs]
+    subtable.LookAheadGlyphCount = len(subtable.LookAheadCoverage)
+    subtable.SubstLookupRecord = [_subst_record(i, lookup_index) for i, lookup_index in records]
+    subtable.SubstCount = len(subtable.SubstLookupRecord)
+    return subtable
+
+
+def _chain_lookup(subtables):
+    lookup = otTables.Lookup()
+    lookup.LookupType = 6
+    lookup.LookupFlag = 0
+    lookup.SubTable = subtables
+    lookup.SubTableCount = len(subtables)
+    return lookup
+
+
+def buildMarkSub(output_font, word_mapping, char_mapping, prune_word_rules=PRUNE_SAFE, **word_rule_options):
+    """建立 --marks 模式的 GSUB (取代 buildChainSub + buildLiga)；word_rule_options 傳給 buildChainSub"""
+    gsub = output_font["GSUB"].table
+    glyph_map = output_font.getReverseGlyphMap()
+
+    # 1. 變體 lookups: 基礎字形 -> (基礎字形, 標記)
+    variant_builders = [builder.MultipleSubstBuilder(output_font, None) for _ in range(MAX_VARIANT_LOOKUPS)]
+    skipped = 0
+    all_marks = set()
+    for char, anno_map in char_mapping.items():
+        glyph_name = get_glyph_name_by_char(output_font, char)
+        for mark_name, variant in anno_map.values():
+            if glyph_name is None:
+                continue
+            all_marks.add(mark_name)
+            if variant >= MAX_VARIANT_LOOKUPS:
+                skipped += 1
+                continue
+            variant_builders[variant].mapping.setdefault(glyph_name, [glyph_name, mark_name])
+    if skipped:
+        build_log.info(f"--marks: {skipped} readings beyond the first {MAX_VARIANT_LOOKUPS} of a character are not selectable.")
+
+    variant_lookups = {}
+    variant_bases = {}
+    for variant, variant_builder in enumerate(variant_builders):
+        if variant_builder.mapping:
+            variant_bases[variant] = sorted(variant_builder.mapping, key=glyph_map.__getitem__)
+            variant_lookups[variant] = _append_lookup(gsub, variant_builder.build())
+    if 0 not in variant_lookups:
+        build_log.info("--marks: no annotated characters, skipping GSUB.")
+        return
+    all_marks = sorted(all_marks, key=glyph_map.__getitem__)
+
+    # 2. 刪除 lookup: 用於移除選擇讀音的數字以及被取代的標記
+    number_glyphs = {i: get_glyph_name_by_char(output_font, str(i)) for i in range(10)}
+    number_glyphs = {i: g for i, g in number_glyphs.items() if g}
+    hen_glyph = get_glyph_name_by_char(output_font, '丅')
+    numeral_glyphs = {i: get_glyph_name_by_char(output_font, ch) for i, ch in enumerate(CHINESE_NUMERALS)}
+    numeral_glyphs = {i: g for i, g in numeral_glyphs.items() if g}
+    if not hen_glyph:
+        numeral_glyphs = {}
+
+    delete_builder = builder.MultipleSubstBuilder(output_font, None)
+    for glyph_name in list(number_glyphs.values()) + list(numeral_glyphs.values()) + all_marks + ([hen_glyph] if numeral_glyphs else []):
+        delete_builder.mapping[glyph_name] = []
+    delete_lookup = _append_lookup(gsub, delete_builder.build())
+
+    # 3. 詞組規則 (calt)
+    buildChainSub(output_font, word_mapping, char_mapping, prune_word_rules=prune_word_rules, variant_lookups=variant_lookups,
+                  **word_rule_options)
+
+    # 4. 數字選擇讀音 (liga)：數字 0 為預設讀音；詞組規則已插入的標記一併刪除
+    subtables = []
+    for variant, bases in variant_bases.items():
+        selectors = []
+        if variant in number_glyphs:
+            selectors.append([[number_glyphs[variant]]])
+        if variant in numeral_glyphs:
+            selectors.append([[hen_glyph], [numeral_glyphs[variant]]])
+        for selector in selectors:
+            for with_mark in (True, False):
+                inputs = [bases] + ([all_marks] if with_mark else []) + selector
+                # 插入會使之後的位置後移，先刪除後面的字形
+                records = [(i, delete_lookup) for i in range(len(inputs) - 1, 0, -1)] + [(0, variant_lookups[variant])]
+                subtables.append(_chain_subtable(glyph_map, inputs, records=records))
+    if subtables:
+        _update_or_create_feature(gsub, 'liga', [_append_lookup(gsub, _chain_lookup(subtables))])
+
+    # 5. 仍沒有標記的基礎字形插入預設讀音的標記 (calt)；已有標記的由第一個子表匹配並略過
+    all_bases = variant_bases[0]
+    default_lookup = _chain_lookup([
+        _chain_subtable(glyph_map, [all_bases], lookahead_glyphs=[all_marks]),
+        _chain_subtable(glyph_map, [all_bases], records=[(0, variant_lookups[0])]),
+    ])
+    _update_or_create_feature(gsub, 'calt', [_append_lookup(gsub, default_lookup)])
+
+    build_log.info("Done mark substitutions")
+
+
+def _empty_gpos(output_font):
+    """建立空的 GPOS，腳本與 GSUB 相同"""
+    gpos = otTables.GPOS()
+    gpos.Version = 0x00010000
+    gpos.ScriptList = otTables.ScriptList()
+    gpos.ScriptList.ScriptRecord = []
+    if 'GSUB' in output_font:
+        for gsub_record in output_font['GSUB'].table.ScriptList.ScriptRecord:
+            record = otTables.ScriptRecord()
+            record.ScriptTag = gsub_record.ScriptTag
+            record.Script = otTables.Script()
+            record.Script.DefaultLangSys = buildDefaultLangSys()
+            record.Script.LangSysRecord = []
+            record.Script.LangSysCount = 0
+            gpos.ScriptList.ScriptRecord.append(record)
+    gpos.ScriptList.ScriptCount = len(gpos.ScriptList.ScriptRecord)
+    gpos.FeatureList = otTables.FeatureList()
+    gpos.FeatureList.FeatureRecord = []
+    gpos.FeatureList.FeatureCount = 0
+    gpos.LookupList = otTables.LookupList()
+    gpos.LookupList.Lookup = []
+    gpos.LookupList.LookupCount = 0
+    table = newTable('GPOS')
+    table.table = gpos
+    return table
+
+
+def _set_glyph_classes(output_font, bases, marks):
+    if 'GDEF' not in output_font:
+        gdef = otTables.GDEF()
+        gdef.Version = 0x00010000
+        gdef.GlyphClassDef = None
+        gdef.AttachList = None
+        gdef.LigCaretList = None
+        gdef.MarkAttachClassDef = None
+        table = newTable('GDEF')
+        table.table = gdef
+        output_font['GDEF'] = table
+    gdef = output_font['GDEF'].table
+    if gdef.GlyphClassDef is None:
+        gdef.GlyphClassDef = otTables.GlyphClassDef()
+        gdef.GlyphClassDef.classDefs = {}
+    class_defs = gdef.GlyphClassDef.classDefs
+    for glyph_name in bases:
+        class_defs.setdefault(glyph_name, GDEF_BASE)
+    for mark_name in marks:
+        class_defs[mark_name] = GDEF_MARK
+
+
+def buildMarkPos(output_font, marks, anchors):
+    """GPOS mark-to-base：標記錨點為原點，基礎字形錨點 (寬度中點, 0)"""
+    _set_glyph_classes(output_font, anchors, marks.values())
+    if 'GPOS' not in output_font:
+        output_font['GPOS'] = _empty_gpos(output_font)
+    gpos = output_font['GPOS'].table
+
+    mark_anchor = builder.buildAnchor(0, 0)
+    mark_records = {mark_name: (0, mark_anchor) for mark_name in marks.values()}
+    base_records = {glyph_name: {0: builder.buildAnchor(x, 0)} for glyph_name, x in anchors.items()}
+    subtables = builder.buildMarkBasePos(mark_records, base_records, output_font.getReverseGlyphMap())
+    lookup_index = _append_lookup(gpos, builder.buildLookup(subtables))
+    _update_or_create_feature(gpos, 'mark', [lookup_index])
+    build_log.info(f"GPOS mark-to-base: {len(mark_records)} marks on {len(base_records)} bases.")
@@ -0,0 +1,135 @@
+# outline_simplify.py
+# 縮小後字形的輪廓點精簡 (--simplify)，容差以縮放後的字體單位計算，平均分給三個步驟：
+#   1. simplifying_pen: 繪製時 (縮放後、四捨五入前) 將連續的二次曲線合併為三次曲線，再以最少的二次曲線重新擬合
+#   2. simplify_glyph: pen.glyph() 之後、寫入 glyf 之前，移除
+#      - 四捨五入後重合的點
+#      - 直線上共線的 on-curve 點
+#      - 幾乎是直線的二次曲線 (控制點移除，曲線變為直線)
+#      - 位於兩個 off-curve 點中點、可隱含的 on-curve 點
+# 步驟 2 的每次移除都檢查所有已移除的點到新線段的距離，因此累積偏差不會超過其容差。
+
+import math
+from array import array
+from fontTools.ttLib.tables._g_l_y_f import GlyphCoordinates, dropImpliedOnCurvePoints, flagOnCurve, flagCubic, flagOverlapSimple
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.qu2cuPen import Qu2CuPen
+
+# 容差分配：qu2cu 合併、cu2qu 重新擬合、點精簡
+SIMPLIFY_STEPS = 3
+
+
+def simplifying_pen(pen, tolerance):
+    """返回在寫入 pen 之前重新擬合曲線的 pen；tolerance 為空時直接返回 pen"""
+    if not tolerance or tolerance <= 0:
+        return pen
+    step = tolerance / SIMPLIFY_STEPS
+    return Qu2CuPen(Cu2QuPen(pen, step, all_quadratic=True), step, all_cubic=False)
+
+
+def _distance_to_segment(p, a, b):
+    ax, ay = a[0], a[1]
+    dx, dy = b[0] - ax, b[1] - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(p[0] - ax, p[1] - ay)
+    t = max(0.0, min(1.0, ((p[0] - ax) * dx + (p[1] - ay) * dy) / length2))
+    return math.hypot(p[0] - (ax + t * dx), p[1] - (ay + t * dy))
+
+
+def _merge_duplicates(points):
+    """
+    合併重合的相鄰點，曲線形狀不變：
+      on + on   -> on
+      off + off -> on (兩點的中點即其本身)
+      on + off  -> on，僅當 off-curve 點的另一側也是 on-curve (該段本來就是直線)
+    """
+    changed = True
+    while changed and len(points) > 1:
+        changed = False
+        n = len(points)
+        for i in range(n):
+            j = (i + 1) % n
+            p, q = points[i], points[j]
+            if p[0] != q[0] or p[1] != q[1]:
+                continue
+            if p[2] and not q[2] and not points[(j + 1) % n][2]:
+                continue
+            if q[2] and not p[2] and not points[(i - 1) % n][2]:
+                continue
+            points[i] = [p[0], p[1], 1, p[3]]
+            del points[j]
+            changed = True
+            break
+    return points
+
+
+def _simplify_contour(points, tolerance):
+    """points: [[x, y, on, flag], ...]，flag 為原來的旗標；返回精簡後的點列表"""
+    points = _merge_duplicates(points)
+    # removed[i]: 點 i 與下一個保留點之間已移除的點 (曲線以其 t=0.5 處的點代表)
+    removed = [[] for _ in points]
+
+    changed = True
+    while changed:
+        changed = False
+        i = 0
+        while i < len(points) and len(points) > 3:
+            n = len(points)
+            prev_i, next_i = (i - 1) % n, (i + 1) % n
+            a, p, b = points[prev_i], points[i], points[next_i]
+            if not (a[2] and b[2]):
+                i += 1
+                continue
+            if p[2]:
+                probe = (p[0], p[1])
+            else:
+                probe = ((a[0] + 2 * p[0] + b[0]) / 4, (a[1] + 2 * p[1] + b[1]) / 4)
+            test_points = removed[prev_i] + [probe] + removed[i]
+            if all(_distance_to_segment(t, a, b) <= tolerance for t in test_points):
+                removed[prev_i] = test_points
+                del points[i]
+                del removed[i]
+                changed = True
+            else:
+                i += 1
+    return points
+
+
+def simplify_glyph(glyph, tolerance):
+    """就地精簡一個簡單字形 (組合字形與空字形不變)，返回移除的點數"""
+    if glyph.numberOfContours < 1 or tolerance is None or tolerance <= 0:
+        return 0
+    tolerance = tolerance / SIMPLIFY_STEPS
+    coordinates = glyph.coordinates
+    flags = glyph.flags
+    before = len(coordinates)
+
+    new_coordinates, new_flags, new_ends = [], [], []
+    start = 0
+    for end in glyph.endPtsOfContours:
+        contour_flags = flags[start:end + 1]
+        points = [[x, y, flag & flagOnCurve, flag] for (x, y), flag in zip(coordinates[start:end + 1], contour_flags)]
+        if not any(flag & flagCubic for flag in contour_flags):
+            points = _simplify_contour(points, tolerance)
+            # 塌縮為一條線或一個點的輪廓沒有面積，整個移除
+            if len(points) < 3 and all(point[2] for point in points):
+                points = []
+        start = end + 1
+        if not points:
+            continue
+        for x, y, on, flag in points:
+            new_coordinates.append((x, y))
+            # 只改變 on-curve 位，保留 OVERLAP_SIMPLE 等其他旗標
+            new_flags.append((flag & ~flagOnCurve) | on)
+        new_ends.append(len(new_coordinates) - 1)
+
+    overlap = flags[0] & flagOverlapSimple
+    glyph.coordinates = GlyphCoordinates(new_coordinates)
+    glyph.flags = array('B', new_flags)
+    glyph.endPtsOfContours = new_ends
+    glyph.numberOfContours = len(new_ends)
+    if glyph.numberOfContours:
+        dropImpliedOnCurvePoints(glyph)
+        # OVERLAP_SIMPLE 只在字形的第一個點上有效，第一個點被移除時移到新的第一個點
+        glyph.flags[0] |= overlap
+    return before - len(glyph.coordinates)
@@ -0,0 +1,258 @@
+# pipeline.py
+# 並行建置流水線 (-j/--jobs > 1)：
+#   1. 載入字體的同時在另一個線程讀取映射 CSV
+#   2. 先分配所有輸出字形名稱 (glyph order 從此固定)
+#   3. 一個線程建立 GSUB (並提前編碼)，同時多個進程繪製字形輪廓
+#   4. 主線程按完成順序合併輪廓
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from fontTools.ttLib.tables.DefaultTable import DefaultTable
+from mappings.csv_parser import read_mapping_rows, load_mapping
+from chain_context_handler import buildChainSub
+from liga_handler import buildLiga
+from build_glyph import (
+    prepare_layout, assign_glyph_names, measure_base_glyph,
+    draw_annotated_glyph, draw_unannotated_glyph,
+    store_annotated_glyph, store_unannotated_glyph,
+    unannotated_glyph_names, apply_auto_height
+)
+from utils import chunk
+from cff_source import load_font, DEFAULT_CU2QU_MAX_ERR
+import build_log
+
+# 每個繪製任務包含的字形數 (含所有變體)
+DRAW_CHUNK_SIZE = 256
+
+# 分配名稱後、啟動線程前預先載入的表格 (TTFont 的延遲載入不是線程安全的)
+PRELOAD_TABLES = ('head', 'hhea', 'maxp', 'OS/2', 'cmap', 'glyf', 'hmtx', 'vmtx', 'GSUB')
+
+
+def load_inputs(base_font_file, anno_font_file, mapping_file, cu2qu_max_err=DEFAULT_CU2QU_MAX_ERR, jobs=1, word_weights=None,
+                top_chars=None):
+    """載入兩個字體的同時讀取映射 CSV，返回 (base_font, anno_font, word_mapping, char_mapping)"""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        rows_future = executor.submit(read_mapping_rows, mapping_file)
+        base_font = load_font(base_font_file, cu2qu_max_err, jobs)
+        anno_font = load_font(anno_font_file, cu2qu_max_err, jobs)
+        base_font.getBestCmap()
+        anno_font.getBestCmap()
+        rows = rows_future.result()
+    word_mapping, char_mapping = load_mapping(base_font, mapping_file, rows=rows, word_weights=word_weights,
+                                              top_chars=top_chars)
+    return base_font, anno_font, word_mapping, char_mapping
+
+
+# --- 繪製進程 ---
+_worker_layout = None
+
+
+def _init_draw_worker(base_font_file, anno_font_file, cu2qu_max_err, layout_options):
+    global _worker_layout
+    # CFF 字體的轉換結果已由主進程快取
+    base_font = load_font(base_font_file, cu2qu_max_err, verbose=False)
+    anno_font = load_font(anno_font_file, cu2qu_max_err, verbose=False)
+    # 輸出字體在繪製前與基礎字體相同，TTGlyphPen 只用它檢查組件名稱
+    _worker_layout = prepare_layout(base_font, anno_font, base_font.getGlyphSet(), verbose=False, **layout_options)
+
+
+def _draw_chunk(annotated, unannotated):
+    """
+    annotated: [(glyph_name, [(anno_str, new_glyph_name), ...]), ...]
+    unannotated: [glyph_name, ...]
+    返回 [(glyph_name, new_glyph_name 或 None, anno_str 或 None, (glyph, advance_width, lsb, bounds)), ...]
+    組合字形的 lsb 與邊界取決於輸出字體中已處理的組件，由主線程在合併後按原始順序重繪。
+    """
+    layout = _worker_layout
+    results = []
+    for glyph_name, variants in annotated:
+        base_info = measure_base_glyph(layout, glyph_name)
+        for anno_str, new_glyph_name in variants:
+            results.append((glyph_name, new_glyph_name, anno_str, draw_annotated_glyph(layout, glyph_name, anno_str, base_info)))
+        layout["base_glyph_set"].release(glyph_name)
+    for glyph_name in unannotated:
+        results.append((glyph_name, None, None, draw_unannotated_glyph(layout, glyph_name)))
+        layout["base_glyph_set"].release(glyph_name)
+    return results
+
+
+class _OrderedGlyphSetView:
+    """
+    重現逐個處理時的輸出字形集合：處理順序在 limit 之前的字形已替換為輸出字形，其餘仍是基礎字形。
+    用於重繪組合字形，使其組件邊界與單進程建置完全相同。
+    """
+
+    def __init__(self, output_glyph_set, base_glyph_set, order):
+        self.output_glyph_set = output_glyph_set
+        self.base_glyph_set = base_glyph_set
+        self.order = order
+        self.limit = 0
+
+    def __contains__(self, glyph_name):
+        return glyph_name in self.output_glyph_set
+
+    def __getitem__(self, glyph_name):
+        if self.order.get(glyph_name, -1) >= self.limit:
+            return self.base_glyph_set[glyph_name]
+        return self.output_glyph_set[glyph_name]
+
+
+def _draw_jobs(plan, glyph_names, chunk_size=DRAW_CHUNK_SIZE):
+    """將字形工作切分為大小相近的任務 (每個任務約 chunk_size 個字形)"""
+    jobs, annotated, unannotated, size = [], [], [], 0
+    for _, glyph_name, variants in plan:
+        annotated.append((glyph_name, [(anno_str, new_glyph_name) for anno_str, new_glyph_name, _ in variants]))
+        size += len(variants)
+        if size >= chunk_size:
+            jobs.append((annotated, []))
+            annotated, size = [], 0
+    if annotated:
+        jobs.append((annotated, []))
+    for names in chunk(glyph_names, chunk_size):
+        jobs.append(([], names))
+    return jobs
+
+
+def _build_gsub(output_font, word_mapping, char_mapping, prune_word_rules, encode, word_rule_options):
+    buildChainSub(output_font, word_mapping, char_mapping, prune_word_rules=prune_word_rules, **word_rule_options)
+    buildLiga(output_font, char_mapping)
+    if encode:
+        return output_font['GSUB'].compile(output_font)
+    return None
+
+
+def plan_outlines(base_font, output_font, char_mapping, group_variants=False):
+    """
+    分配所有輸出字形名稱 (glyph order 從此固定)，返回 (plan, glyph_names, skipped_no_outline, store_order)；
+    store_order 為單進程建置中每個輸出字形的寫入順序。
+    """
+    plan, processed_glyph_names = assign_glyph_names(base_font, output_font, char_mapping, group_variants)
+    glyph_names, skipped_no_outline = unannotated_glyph_names(base_font, processed_glyph_names, output_font)
+
+    store_order = {}
+    for _, _, variants in plan:
+        for _, new_glyph_name, _ in variants:
+            store_order[new_glyph_name] = len(store_order)
+    for glyph_name in glyph_names:
+        store_order[glyph_name] = len(store_order)
+    return plan, glyph_names, skipped_no_outline, store_order
+
+
+class OutlineMerger:
+    """
+    把其他進程繪製的結果 (_draw_chunk 的返回值) 按任意順序寫入輸出字體；
+    組合字形在 finish() 中按 store_order 重繪，結果與單進程建置完全相同。
+    """
+
+    def __init__(self, base_font, output_font, anno_font_file, cu2qu_max_err, store_order, layout_options):
+        self.base_font = base_font
+        self.output_font = output_font
+        self.store_order = store_order
+        self.layout_options = layout_options
+        # 主線程的排版只用於重繪組合字形 (以及輸出排版資訊)
+        self.anno_font = load_font(anno_font_file, cu2qu_max_err, verbose=False)
+        self.view = _OrderedGlyphSetView(output_font.getGlyphSet(), None, store_order)
+        self.layout = prepare_layout(base_font, self.anno_font, self.view, **layout_options)
+        self.view.base_glyph_set = self.layout["base_glyph_set"]
+        self.auto_height = layout_options.get("auto_height", False)
+        self.global_max_y = -99999
+        self.global_min_y = 99999
+        self.composites = []
+
+    def _track(self, bounds):
+        if self.auto_height and bounds:
+            if bounds[1] < self.global_min_y: self.global_min_y = bounds[1]
+            if bounds[3] > self.global_max_y: self.global_max_y = bounds[3]
+
+    def add(self, results):
+        for glyph_name, new_glyph_name, anno_str, result in results:
+            if new_glyph_name is None:
+                store_unannotated_glyph(self.output_font, glyph_name, result)
+            else:
+                store_annotated_glyph(self.base_font, self.output_font, glyph_name, new_glyph_name, result)
+
+            if result[0].isComposite():
+                self.composites.append((glyph_name, new_glyph_name, anno_str))
+            else:
+                self._track(result[3])
+
+    def redraw_composites(self):
+        """所有輪廓寫入後，按原始順序重繪組合字形"""
+        layout = self.layout
+        for glyph_name, new_glyph_name, anno_str in self.composites:
+            self.view.limit = self.store_order[new_glyph_name or glyph_name]
+            if new_glyph_name is None:
+                result = draw_unannotated_glyph(layout, glyph_name)
+                store_unannotated_glyph(self.output_font, glyph_name, result)
+            else:
+                result = draw_annotated_glyph(layout, glyph_name, anno_str, measure_base_glyph(layout, glyph_name))
+                store_annotated_glyph(self.base_font, self.output_font, glyph_name, new_glyph_name, result)
+            self._track(result[3])
+        self.composites = []
+
+    def finish(self, skipped_no_outline, top_padding_percent=None, bottom_padding_percent=None):
+        self.anno_font.close()
+        if skipped_no_outline:
+            build_log.info(f"Skipped {len(skipped_no_outline)} empty glyphs.")
+
+        if self.auto_height and self.global_max_y != -99999:
+            apply_auto_height(self.output_font, self.global_min_y, self.global_max_y, self.layout_options.get("invert", False),
+                              top_padding_percent, bottom_padding_percent)
+
+
+def preload_tables(output_font):
+    """分配名稱後、啟動線程前載入表格與 glyph 索引"""
+    for tag in PRELOAD_TABLES:
+        if tag in output_font:
+            output_font[tag]
+    output_font.getReverseGlyphMap(rebuild=True)
+
+
+def set_encoded_gsub(output_font, gsub_data):
+    if gsub_data is not None:
+        gsub_table = DefaultTable('GSUB')
+        gsub_table.data = gsub_data
+        output_font['GSUB'] = gsub_table
+
+
+def build_pipelined(
+    base_font_file, anno_font_file,
+    base_font, output_font, word_mapping, char_mapping,
+    jobs=2,
+    prune_word_rules=None,
+    encode_gsub=True,
+    cu2qu_max_err=DEFAULT_CU2QU_MAX_ERR,
+    top_padding_percent=None,
+    bottom_padding_percent=None,
+    group_variants=False,
+    word_rule_options=None,
+    **layout_options
+):
+    """
+    與 generate_glyphs + buildChainSub + buildLiga 得到相同的字體，但 GSUB 與輪廓繪製並行。
+    encode_gsub: 在 GSUB 線程中直接編碼為二進位 (之後還需要子集化時應設為 False)。
+    word_rule_options: 傳給 buildChainSub 的詞組規則預算參數 (word_weights, max_word_rules, max_word_rule_bytes)。
+    """
+    plan, glyph_names, skipped_no_outline, store_order = plan_outlines(base_font, output_font, char_mapping, group_variants)
+    merger = OutlineMerger(base_font, output_font, anno_font_file, cu2qu_max_err, store_order, layout_options)
+    preload_tables(output_font)
+
+    draw_jobs = _draw_jobs(plan, glyph_names)
+    build_log.info(f"Pipeline: {len(draw_jobs)} outline jobs on {jobs} processes, GSUB in a separate thread.")
+
+    with ThreadPoolExecutor(max_workers=1) as gsub_executor, \
+         ProcessPoolExecutor(max_workers=jobs, initializer=_init_draw_worker,
+                             initargs=(base_font_file, anno_font_file, cu2qu_max_err, layout_options)) as draw_executor:
+        gsub_future = gsub_executor.submit(
+            _build_gsub, output_font, word_mapping, char_mapping, prune_word_rules, encode_gsub,
+            word_rule_options or {}
+        )
+        futures = [draw_executor.submit(_draw_chunk, annotated, unannotated) for annotated, unannotated in draw_jobs]
+
+        for future in as_completed(futures):
+            merger.add(future.result())
+        merger.redraw_composites()
+
+        gsub_data = gsub_future.result()
+
+    set_encoded_gsub(output_font, gsub_data)
+    merger.finish(skipped_no_outline, top_padding_percent, bottom_padding_percent)
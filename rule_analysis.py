@@ -0,0 +1,245 @@
+# rule_analysis.py
+# 在寫入 GSUB 之前分析 buildChainSub 收集的詞組規則，移除不影響排版結果的規則
+#
+# 每條規則是一個 WordRule (見下)，字形以 GID 儲存，不保留字形名稱或除錯字串
+#
+# 匹配優先級：同一位置上較長的規則先嘗試 (子表按長度降序寫出)，同長度同起始字形的規則按 label 排序。
+
+from array import array
+
+# 修剪模式
+PRUNE_OFF = "off"
+PRUNE_SAFE = "safe"   # 只移除不影響排版結果的規則
+PRUNE_ALL = "all"     # 另外移除所有仍保留的預設讀音詞組，可能讓重疊的其他詞組生效
+PRUNE_MODES = (PRUNE_OFF, PRUNE_SAFE, PRUNE_ALL)
+
+
+class WordRule:
+    """
+    一條詞組規則：
+      word / readings: 詞組與讀音列表 (與 word_mapping 共用，不複製)
+      glyphs:          array('H')，起始字形與其餘字形的 GID
+      variants:        每個位置的變體索引；None 表示該位置不需要替換 (沒有註音或替換為自身)
+      weight:          詞組在映射 CSV 中的權重 (用於 limit_rules)
+    """
+
+    __slots__ = ("word", "readings", "glyphs", "variants", "weight")
+
+    def __init__(self, word, readings, glyph_ids, variants, weight=1):
+        self.word = word
+        self.readings = readings
+        self.glyphs = array('H', glyph_ids)
+        self.variants = tuple(variants)
+        self.weight = weight
+
+    @property
+    def label(self):
+        """詞組 + 讀音，用於報告與同一規則集內的排序 (需要時才產生)"""
+        return self.word + " " + " ".join(self.readings)
+
+
+def rule_glyphs(rule):
+    return rule.glyphs
+
+
+def is_default_only(rule):
+    """規則的每個位置都保持預設字形，套用後不會改變任何字形"""
+    return all(variant is None for variant in rule.variants)
+
+
+class _TrieNode:
+    __slots__ = ("children", "rules", "retained_here", "retained_below")
+
+    def __init__(self):
+        self.children = None      # {字形 GID: 子節點}，沒有子節點時為 None
+        self.rules = None         # 字形序列恰好到此節點的規則索引，沒有時為 None
+        self.retained_here = 0    # 其中仍保留的規則數
+        self.retained_below = 0   # 以此節點為前綴 (含自身) 的保留規則數
+
+
+class RuleTrie:
+    """以字形序列為鍵的規則字典樹；節點只在需要時建立子節點字典與規則列表，規則的路徑在需要時重新走訪"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.root = _TrieNode()
+        self.retained = [False] * len(rules)
+        for i, rule in enumerate(rules):
+            node = self.root
+            for glyph in rule_glyphs(rule):
+                if node.children is None:
+                    node.children = {}
+                child = node.children.get(glyph)
+                if child is None:
+                    child = node.children[glyph] = _TrieNode()
+                node = child
+            if node.rules is None:
+                node.rules = []
+            node.rules.append(i)
+
+    def path(self, i):
+        """規則 i 從根節點開始的節點列表"""
+        node = self.root
+        path = [node]
+        for glyph in rule_glyphs(self.rules[i]):
+            node = node.children[glyph]
+            path.append(node)
+        return path
+
+    def nodes_with_rules(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.rules:
+                yield node
+            if node.children:
+                stack.extend(node.children.values())
+
+    def set_retained(self, i, retained):
+        if self.retained[i] == retained:
+            return
+        self.retained[i] = retained
+        delta = 1 if retained else -1
+        path = self.path(i)
+        path[-1].retained_here += delta
+        for node in path:
+            node.retained_below += delta
+
+    def longest_retained_prefix(self, i):
+        """返回規則 i 最長的、仍保留的真前綴規則 (索引, 長度)，沒有則返回 (None, 0)"""
+        path = self.path(i)
+        for length in range(len(path) - 2, 1, -1):
+            node = path[length]
+            if node.retained_here:
+                for j in node.rules:
+                    if self.retained[j]:
+                        return j, length
+        return None, 0
+
+    def overlaps_from(self, glyphs, start):
+        """
+        是否有保留的規則可能從 glyphs 的偏移 k (start <= k < len) 開始匹配：
+        該規則等於 glyphs[k:] 的某個前綴，或以 glyphs[k:] 為前綴 (延伸到 glyphs 之後)。
+        """
+        n = len(glyphs)
+        for k in range(max(start, 1), n):
+            node = self.root
+            for m, glyph in enumerate(glyphs[k:], 1):
+                node = node.children.get(glyph) if node.children else None
+                if node is None:
+                    break
+                if m >= 2 and m < n - k and node.retained_here:
+                    return True
+            else:
+                if node.retained_below:
+                    return True
+        return False
+
+
+def rule_sort_key(rule):
+    return (-len(rule.glyphs), rule.label)
+
+
+def analyze_rules(rules, mode=PRUNE_SAFE):
+    """
+    移除永遠不會生效或不影響排版結果的規則，返回 (保留的規則列表, 統計字典)。
+
+    1. 重複：字形序列相同的規則只有排序最前的會生效。替換也相同的合併，不同的視為無法到達。
+    2. 被前綴規則涵蓋：設 F 為規則 W 最長的保留真前綴規則 (沒有則 F 為空)。如果 W 在 F 範圍內的替換
+       與 F 相同、在 F 之後沒有替換，而且沒有保留的規則可能從 W 的 F 之後的位置開始匹配，
+       那麼移除 W 後 F 會在同一位置生效並得到完全相同的結果。F 為空時即為只選擇預設讀音的詞組。
+       由於保留一條規則可能使另一條必須保留，先假設全部可移除，再反覆把不符合條件的規則加回，直到穩定。
+    3. PRUNE_ALL 模式下，再移除所有仍保留的預設讀音詞組 (它們只用於阻擋重疊的詞組)。
+    """
+    stats = {"duplicates_merged": 0, "unreachable": 0, "default_only": 0, "shadowed": 0, "kept_for_blocking": 0}
+    if mode == PRUNE_OFF or not rules:
+        return rules, stats
+
+    trie = RuleTrie(rules)
+    removed = set(range(len(rules)))
+
+    # --- 1. 重複的字形序列 ---
+    for node in trie.nodes_with_rules():
+        if len(node.rules) < 2:
+            continue
+        ordered = sorted(node.rules, key=lambda i: rule_sort_key(rules[i]))
+        first = ordered[0]
+        for i in ordered[1:]:
+            if rules[i].variants == rules[first].variants:
+                stats["duplicates_merged"] += 1
+            else:
+                stats["unreachable"] += 1
+        node.rules = [first]
+
+    candidates = {node.rules[0] for node in trie.nodes_with_rules()}
+
+    # --- 2. 反覆加回不符合移除條件的規則 ---
+    def removable(i):
+        rule = rules[i]
+        variants = rule.variants
+        prefix, prefix_len = trie.longest_retained_prefix(i)
+        if prefix is None:
+            if not is_default_only(rule):
+                return False
+        else:
+            if variants[:prefix_len] != rules[prefix].variants:
+                return False
+            if any(v is not None for v in variants[prefix_len:]):
+                return False
+        return not trie.overlaps_from(rule_glyphs(rule), prefix_len)
+
+    changed = True
+    while changed:
+        changed = False
+        for i in sorted(candidates & removed, key=lambda i: rule_sort_key(rules[i])):
+            if not removable(i):
+                removed.discard(i)
+                trie.set_retained(i, True)
+                changed = True
+
+    for i in candidates & removed:
+        if trie.longest_retained_prefix(i)[0] is None:
+            stats["default_only"] += 1
+        else:
+            stats["shadowed"] += 1
+
+    kept_indices = [i for i in range(len(rules)) if i not in removed]
+
+    # --- 3. 可選：移除剩餘的預設讀音詞組 ---
+    if mode == PRUNE_ALL:
+        before = len(kept_indices)
+        kept_indices = [i for i in kept_indices if not is_default_only(rules[i])]
+        stats["default_only"] += before - len(kept_indices)
+    else:
+        stats["kept_for_blocking"] = sum(1 for i in kept_indices if is_default_only(rules[i]))
+
+    return [rules[i] for i in kept_indices], stats
+
+
+def changed_positions(rule):
+    return sum(1 for variant in rule.variants if variant is not None)
+
+
+def rule_bytes(rule):
+    """規則寫入 ChainSubRule 的大約位元組數：4 個計數、輸入字形、每個替換 4 位元組、規則集中的偏移量"""
+    return 2 * 4 + 2 * (len(rule.glyphs) - 1) + 4 * changed_positions(rule) + 2
+
+
+def limit_rules(rules, max_rules=None, max_bytes=None):
+    """
+    按價值保留最多 max_rules 條、合計最多 max_bytes 位元組 (rule_bytes) 的規則。
+    價值：權重較高者優先，同權重時改變較多位置者優先，其餘保持原順序。
+    返回 (保留的規則 (原順序), 被刪除的規則 (價值降序))。
+    """
+    ranked = sorted(range(len(rules)), key=lambda i: (-rules[i].weight, -changed_positions(rules[i]), i))
+    kept = set()
+    total = 0
+    for i in ranked:
+        if max_rules is not None and len(kept) >= max_rules:
+            break
+        size = rule_bytes(rules[i])
+        if max_bytes is not None and total + size > max_bytes:
+            break
+        kept.add(i)
+        total += size
+    return [rules[i] for i in range(len(rules)) if i in kept], [rules[i] for i in ranked if i not in kept]
@@ -0,0 +1,325 @@
+# scheduler.py
+# 建置矩陣排程：在記憶體與 CPU 預算內同時執行多個 wing-font.py 建置
+#   - 從建置矩陣讀取指令：build-fonts.yml 或每行一個指令的文字檔，其中每行 "python wing-font.py ..." 為一個建置
+#   - 按基礎字體的字形數與映射 CSV 的行數估算每個建置的峰值記憶體，以建置記錄 (--profile-log) 中的
+#     peak_rss_kb 校準；同一基礎字體與映射之前建置過時直接使用其實測值
+#   - 估計耗時最長的建置先開始；預算允許時同時執行較小的建置。單個建置超出預算時單獨執行
+#   - 被 OOM killer 終止 (SIGKILL) 或出現 MemoryError 的建置，提高其記憶體估算並降低同時執行數後重試
+#   - 每個建置的輸出寫入 --log-dir 中的獨立記錄檔
+#
+# 用法: python3 scheduler.py [.github/workflows/build-fonts.yml] [--max-memory MB] [--max-cpus N] [--plan]
+
+import argparse
+import os
+import shlex
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from fontTools.ttLib import TTFont
+from build_profile import PROFILE_LOG, load_profiles
+from estimator import count_mapping_rows
+from utils import CACHE_DIR
+
+DEFAULT_MATRIX = os.path.join(".github", "workflows", "build-fonts.yml")
+
+# 每個建置的記錄檔目錄
+SCHEDULE_LOG_DIR = os.path.join(CACHE_DIR, "schedule-logs")
+
+# 沒有建置記錄時的峰值記憶體模型 (MB)：固定部分 + 每個基礎字形 + 每行映射
+MEMORY_FIXED_MB = 40
+MEMORY_PER_GLYPH_MB = 0.04
+MEMORY_PER_ROW_MB = 0.008
+
+# -j 的每個繪製進程另外載入兩個字體，約為主進程的一部分
+MEMORY_PER_WORKER_SHARE = 0.5
+
+# 估算值的安全係數
+MEMORY_SAFETY = 1.2
+
+# 沒有指定 --max-memory 時使用的實體記憶體比例
+DEFAULT_MEMORY_SHARE = 0.8
+
+# OOM 後記憶體估算的放大倍數
+OOM_MEMORY_FACTOR = 1.5
+
+POLL_INTERVAL = 0.5
+
+
+def read_matrix(matrix_file):
+    """返回 [wing-font.py 指令的參數列表, ...] (不含 python 與腳本本身之前的部分)"""
+    commands = []
+    with open(matrix_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("- "):
+                line = line[2:].strip()
+            if line.startswith("run:"):
+                line = line[4:].strip()
+            if "wing-font.py" not in line or line.startswith("#"):
+                continue
+            words = shlex.split(line)
+            for i, word in enumerate(words):
+                if word.endswith("wing-font.py"):
+                    commands.append(words[i:])
+                    break
+    return commands
+
+
+def _job_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-i', '--base-font-file')
+    parser.add_argument('-a', '--anno-font-file')
+    parser.add_argument('-m', '--mapping')
+    parser.add_argument('-o', '--output-prefix')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    return parser
+
+
+def default_memory_mb(base_glyphs, mapping_rows, jobs=1):
+    """沒有校準時的峰值記憶體估算 (MB)"""
+    single = MEMORY_FIXED_MB + MEMORY_PER_GLYPH_MB * base_glyphs + MEMORY_PER_ROW_MB * mapping_rows
+    return single * (1 + MEMORY_PER_WORKER_SHARE * (max(jobs, 1) - 1))
+
+
+def calibrate_memory(profiles):
+    """
+    從建置記錄校準：返回 (記憶體倍數, 每 MB 估算的秒數, {(基礎字體, 映射): (峰值 MB, 秒數)})。
+    記錄中的峰值為主進程的 peak_rss_kb。
+    """
+    memory_ratios, second_rates, known = [], [], {}
+    for p in profiles:
+        counts = p.get("counts", {})
+        if not counts.get("base_glyphs"):
+            continue
+        predicted = default_memory_mb(counts["base_glyphs"], counts.get("mapping_rows", 0))
+        peak_kb = p.get("peak_rss_kb")
+        if peak_kb:
+            memory_ratios.append(peak_kb / 1024 / predicted)
+        if p.get("total_seconds"):
+            second_rates.append(p["total_seconds"] / predicted)
+        key = (p.get("base_font"), p.get("mapping"))
+        peaks, seconds = known.setdefault(key, ([], []))
+        if peak_kb:
+            peaks.append(peak_kb / 1024)
+        if p.get("total_seconds"):
+            seconds.append(p["total_seconds"])
+    known = {
+        key: (max(peaks) if peaks else None, statistics.median(seconds) if seconds else None)
+        for key, (peaks, seconds) in known.items()
+    }
+    return (
+        statistics.median(memory_ratios) if memory_ratios else 1.0,
+        statistics.median(second_rates) if second_rates else None,
+        known,
+    )
+
+
+class Job:
+    """矩陣中的一個建置"""
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        options, _ = _job_parser().parse_known_args(args[1:])
+        self.base_font_file = options.base_font_file
+        self.mapping = options.mapping
+        self.output_prefix = options.output_prefix
+        self.cpus = max(options.jobs, 1)
+        self.name = os.path.basename(options.output_prefix or f"job{index}")
+        self.memory_mb = None
+        self.seconds = None
+        self.retries = 0
+        self.status = "pending"
+        self.peak_mb = None
+        self.elapsed = None
+        self.process = None
+        self.started = None
+        self.log_file = None
+
+    def estimate(self, memory_ratio, seconds_rate, known):
+        """估算峰值記憶體 (MB) 與耗時 (秒，沒有記錄時為 None)"""
+        base_glyphs = TTFont(self.base_font_file, lazy=True)['maxp'].numGlyphs
+        rows = count_mapping_rows(self.mapping)
+        predicted = default_memory_mb(base_glyphs, rows, self.cpus)
+        known_peak, known_seconds = known.get((os.path.basename(self.base_font_file), os.path.basename(self.mapping)),
+                                              (None, None))
+        if known_peak:
+            memory = known_peak * (1 + MEMORY_PER_WORKER_SHARE * (self.cpus - 1))
+        else:
+            memory = predicted * memory_ratio
+        self.memory_mb = memory * MEMORY_SAFETY
+        if known_seconds:
+            self.seconds = known_seconds
+        elif seconds_rate is not None:
+            self.seconds = predicted * seconds_rate
+        # 沒有耗時記錄時以記憶體估算排序 (較大的建置通常較慢)
+        self.sort_key = self.seconds if self.seconds is not None else predicted
+
+
+def total_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 / 1024
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _start(job, log_dir):
+    if job.output_prefix and os.path.dirname(job.output_prefix):
+        os.makedirs(os.path.dirname(job.output_prefix), exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    job.log_file = os.path.join(log_dir, f"{job.index:02d}-{job.name}.log")
+    log = open(job.log_file, 'w', encoding='utf-8')
+    job.process = subprocess.Popen([sys.executable] + job.args, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    job.started = time.perf_counter()
+    job.status = "running"
+
+
+def _poll(job):
+    """返回退出碼 (仍在執行時為 None)，並記錄子進程的峰值記憶體"""
+    if hasattr(os, "wait4"):
+        pid, status, rusage = os.wait4(job.process.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        job.process.returncode = os.waitstatus_to_exitcode(status)
+        job.peak_mb = rusage.ru_maxrss / 1024
+    elif job.process.poll() is None:
+        return None
+    job.elapsed = time.perf_counter() - job.started
+    return job.process.returncode
+
+
+def _out_of_memory(job, returncode):
+    if returncode == -signal.SIGKILL:
+        return True
+    try:
+        with open(job.log_file, 'r', encoding='utf-8', errors='replace') as f:
+            return "MemoryError" in f.read()[-4000:]
+    except OSError:
+        return False
+
+
+def _fmt_seconds(seconds):
+    return "n/a" if seconds is None else f"{seconds / 60:.1f} min"
+
+
+def print_plan(jobs, max_memory, max_cpus):
+    print(f"[INFO] Budget: {max_memory:.0f} MB memory, {max_cpus} CPUs. Jobs, longest first:")
+    for job in jobs:
+        print(f"  {job.name:<40} ~{job.memory_mb:>7.0f} MB  {job.cpus} CPU  {_fmt_seconds(job.seconds)}")
+
+
+def run_matrix(jobs, max_memory, max_cpus, max_retries=2, log_dir=SCHEDULE_LOG_DIR):
+    """執行所有建置，返回失敗的建置列表"""
+    pending = sorted(jobs, key=lambda job: -job.sort_key)
+    running = []
+    concurrency = max_cpus
+    failed = []
+    try:
+        while pending or running:
+            used_memory = sum(job.memory_mb for job in running)
+            used_cpus = sum(job.cpus for job in running)
+            for job in list(pending):
+                if len(running) >= concurrency:
+                    break
+                if running and (used_memory + job.memory_mb > max_memory or used_cpus + job.cpus > max_cpus):
+                    continue
+                pending.remove(job)
+                _start(job, log_dir)
+                running.append(job)
+                used_memory += job.memory_mb
+                used_cpus += job.cpus
+                print(f"[INFO] Started {job.name} (~{job.memory_mb:.0f} MB; {len(running)} running, "
+                      f"~{used_memory:.0f} of {max_memory:.0f} MB)", flush=True)
+
+            time.sleep(POLL_INTERVAL)
+            running_before = len(running)
+            for job in list(running):
+                returncode = _poll(job)
+                if returncode is None:
+                    continue
+                running.remove(job)
+                peak = f", peak {job.peak_mb:.0f} MB" if job.peak_mb else ""
+                if returncode == 0:
+                    job.status = "done"
+                    print(f"[INFO] Finished {job.name} in {_fmt_seconds(job.elapsed)}{peak}", flush=True)
+                elif _out_of_memory(job, returncode) and job.retries < max_retries:
+                    # 降低同時執行數並提高此建置的估算後重試
+                    job.retries += 1
+                    concurrency = min(concurrency, max(1, running_before - 1))
+                    job.memory_mb = max(job.memory_mb * OOM_MEMORY_FACTOR, (job.peak_mb or 0) * MEMORY_SAFETY)
+                    job.status = "pending"
+                    pending.append(job)
+                    pending.sort(key=lambda job: -job.sort_key)
+                    print(f"[ERROR] {job.name} ran out of memory{peak}; retrying with at most {concurrency} "
+                          f"concurrent builds and ~{job.memory_mb:.0f} MB (retry {job.retries} of {max_retries})", flush=True)
+                else:
+                    job.status = "failed"
+                    failed.append(job)
+                    print(f"[ERROR] {job.name} failed with exit code {returncode}, see {job.log_file}", flush=True)
+    except KeyboardInterrupt:
+        for job in running:
+            job.process.terminate()
+        raise
+    return failed
+
+
+def main(matrix_file=DEFAULT_MATRIX, max_memory=None, max_cpus=None, max_retries=2,
+         log_dir=SCHEDULE_LOG_DIR, profile_log=PROFILE_LOG, plan_only=False):
+    commands = read_matrix(matrix_file)
+    if not commands:
+        print(f"[ERROR] No wing-font.py commands found in {matrix_file}")
+        return 1
+
+    memory_ratio, seconds_rate, known = calibrate_memory(load_profiles(profile_log))
+    jobs = []
+    for index, args in enumerate(commands):
+        job = Job(index, args)
+        try:
+            job.estimate(memory_ratio, seconds_rate, known)
+        except (OSError, TypeError) as e:
+            print(f"[ERROR] Skipping {job.name}: cannot read its inputs ({e})")
+            continue
+        jobs.append(job)
+    if not jobs:
+        return 1
+
+    if max_memory is None:
+        total = total_memory_mb()
+        max_memory = total * DEFAULT_MEMORY_SHARE if total else max(job.memory_mb for job in jobs)
+    if max_cpus is None:
+        max_cpus = os.cpu_count() or 1
+
+    print_plan(sorted(jobs, key=lambda job: -job.sort_key), max_memory, max_cpus)
+    if plan_only:
+        return 0
+
+    start = time.perf_counter()
+    failed = run_matrix(jobs, max_memory, max_cpus, max_retries, log_dir)
+    print(f"[INFO] {len(jobs) - len(failed)} of {len(jobs)} builds finished in {_fmt_seconds(time.perf_counter() - start)}.")
+    for job in failed:
+        print(f"[ERROR] Failed: {job.name} ({job.log_file})")
+    return 1 if failed or len(jobs) < len(commands) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="scheduler.py", description="Run the wing-font.py builds of a build matrix in parallel within a memory and CPU budget.")
+    parser.add_argument('matrix', nargs='?', default=DEFAULT_MATRIX, help=f"Workflow file or text file with one 'python wing-font.py ...' command per line. (default: {DEFAULT_MATRIX})")
+    parser.add_argument('--max-memory', type=float, default=None, help=f"Memory budget in MB for all running builds. (default: {DEFAULT_MEMORY_SHARE:.0%} of physical memory)")
+    parser.add_argument('--max-cpus', type=int, default=None, help="CPU budget; a build with -j N uses N. (default: number of CPUs)")
+    parser.add_argument('--max-retries', type=int, default=2, help="Retries of a build killed for running out of memory. (default: 2)")
+    parser.add_argument('--log-dir', default=SCHEDULE_LOG_DIR, help=f"Directory for each build's output. (default: {SCHEDULE_LOG_DIR})")
+    parser.add_argument('--profile-log', default=PROFILE_LOG, help=f"Build profiles used to calibrate the memory and time estimates. (default: {PROFILE_LOG})")
+    parser.add_argument('--plan', action='store_true', help="Only print the estimates and the job order.")
+    options = parser.parse_args()
+    sys.exit(main(
+        matrix_file=options.matrix,
+        max_memory=options.max_memory,
+        max_cpus=options.max_cpus,
+        max_retries=options.max_retries,
+        log_dir=options.log_dir,
+        profile_log=options.profile_log,
+        plan_only=options.plan,
+    ))
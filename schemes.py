@@ -0,0 +1,80 @@
+# schemes.py
+# 多方案模式：一個字體包含多個映射 CSV (例如各種粵語拼音方案)，以 ss01-ss20 切換
+#   - 主映射 (ss01，預設) 與單方案建置相同：cmap、calt、liga 不變
+#   - 附加方案的每個 (字, 註音) 都是新字形 (包括變體 0)，與主映射共用基礎字形的測量與解碼
+#   - ssNN: 先以 SingleSubst 將 cmap 字形換成該方案的預設字形，之後該方案自己的詞組規則 (chain_context_handler)
+#     與數字選擇 (liga_handler) 都以這些字形為輸入。這些 lookup 在 LookupList 中位於主映射的 calt/liga 之前，
+#     已切換的字不再匹配主映射的規則
+#   - 附加方案中沒有讀音的字保持主映射的字形
+#   - 每個 ssNN 以 FeatureParams 記錄方案名稱 (name 表)，供應用程式顯示
+
+import os
+from fontTools.ttLib.tables import otTables
+from fontTools.otlLib import builder
+from chain_context_handler import buildChainSub, _update_or_create_feature
+from liga_handler import buildLiga
+from mark_attachment import _append_lookup
+from rule_analysis import PRUNE_SAFE
+from utils import get_glyph_name_by_char
+import build_log
+
+# ss01-ss20
+MAX_SCHEMES = 20
+
+
+def scheme_feature_tag(index):
+    """方案 index (0 為主映射) 的 feature 標籤"""
+    return f"ss{index + 1:02d}"
+
+
+def scheme_label(mapping_file):
+    """以映射 CSV 的檔名 (不含副檔名) 作為方案名稱"""
+    return os.path.splitext(os.path.basename(mapping_file))[0]
+
+
+def buildSchemeSub(output_font, feature_tag, word_mapping, char_mapping, prune_word_rules=PRUNE_SAFE, **word_rule_options):
+    """
+    建立一個附加方案的 GSUB (須在主映射的 buildChainSub / buildLiga 之前呼叫)；
+    char_mapping 的值已由 assign_scheme_glyph_names 填入。word_rule_options 傳給 buildChainSub。
+    """
+    gsub = output_font["GSUB"].table
+
+    base_glyphs = {}
+    for char, anno_map in char_mapping.items():
+        first = next(iter(anno_map.values()), None)
+        if first is not None:
+            base_glyphs[char] = first[0]
+    char_mapping = {char: anno_map for char, anno_map in char_mapping.items() if char in base_glyphs}
+
+    # 1. cmap 字形 -> 本方案的預設字形
+    switch_builder = builder.SingleSubstBuilder(output_font, None)
+    for char, glyph_name in base_glyphs.items():
+        default_glyph = get_glyph_name_by_char(output_font, char)
+        if default_glyph and default_glyph != glyph_name:
+            switch_builder.mapping.setdefault(default_glyph, glyph_name)
+    if not switch_builder.mapping:
+        build_log.info(f"{feature_tag}: no annotated characters, skipping.")
+        return
+    _update_or_create_feature(gsub, feature_tag, [_append_lookup(gsub, switch_builder.build())])
+
+    # 2. 詞組規則與數字選擇，以本方案的預設字形為輸入
+    buildChainSub(output_font, word_mapping, char_mapping, prune_word_rules=prune_word_rules,
+                  base_glyphs=base_glyphs, feature_tag=feature_tag, **word_rule_options)
+    buildLiga(output_font, char_mapping, base_glyphs=base_glyphs, featureTag=feature_tag)
+
+
+def set_scheme_names(output_font, labels):
+    """為 ss01.. 加上方案名稱；沒有任何 lookup 的 ss01 (主映射) 也建立空的 feature，使應用程式列出所有方案"""
+    gsub = output_font["GSUB"].table
+    name_table = output_font['name']
+    for index, label in enumerate(labels):
+        feature_tag = scheme_feature_tag(index)
+        if not any(record.FeatureTag == feature_tag for record in gsub.FeatureList.FeatureRecord):
+            _update_or_create_feature(gsub, feature_tag, [])
+        name_id = name_table.addName(label)
+        for record in gsub.FeatureList.FeatureRecord:
+            if record.FeatureTag == feature_tag:
+                params = otTables.FeatureParamsStylisticSet()
+                params.Version = 0
+                params.UINameID = name_id
+                record.Feature.FeatureParams = params
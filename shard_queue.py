@@ -0,0 +1,258 @@
+# shard_queue.py
+# 分片建置 (--shard-queue DIR)：輪廓繪製切分為分片任務，放在共用目錄的工作佇列中
+#   - 主進程先分配所有輸出字形名稱 (glyph order 從此固定)，再把字形按映射中的字元順序切分為連續的分片，
+#     每個分片寫為 DIR/queue/NNNNN.json；字體路徑與排版參數寫在 DIR/build.json
+#   - 任意數量的工作進程 (同一台機器，或共用檔案系統的多台機器) 執行
+#         python3 shard_queue.py DIR [--follow]
+#     以 rename 原子地領取任務 (queue -> claimed)，繪製後把結果寫為 DIR/done/NNNNN.pickle
+#   - 主進程自己也處理佇列 (-j N 時另外啟動 N-1 個本機工作進程)，GSUB 在另一個線程中建立一次；
+#     全部分片完成後按分片編號合併，組合字形按單進程的處理順序重繪 (與 -j 相同)，結果與單進程建置完全相同
+#   - 領取後超過 stale_timeout 秒仍沒有結果的任務 (工作進程中斷) 放回佇列
+#   - 每次建置有新的 build_id；舊建置留下的任務與結果被忽略
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import socket
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pipeline
+from pipeline import plan_outlines, OutlineMerger, preload_tables, set_encoded_gsub, _build_gsub, _draw_jobs
+from cff_source import DEFAULT_CU2QU_MAX_ERR
+import build_log
+
+# 每個分片包含的字形數 (含所有變體)
+SHARD_SIZE = 2048
+
+# 領取後多少秒沒有結果時放回佇列
+SHARD_STALE_TIMEOUT = 600
+
+# 等待其他工作進程時的輪詢間隔 (秒)
+SHARD_POLL_INTERVAL = 0.5
+
+BUILD_FILE = "build.json"
+
+
+def _dirs(queue_dir):
+    return {name: os.path.join(queue_dir, name) for name in ("queue", "claimed", "done")}
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp-{socket.gethostname()}-{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _shard_name(shard):
+    return f"{shard:05d}"
+
+
+def create_queue(queue_dir, build_info, shards):
+    """清空 queue_dir 並寫入建置資訊與所有分片任務"""
+    dirs = _dirs(queue_dir)
+    for path in dirs.values():
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(queue_dir, exist_ok=True)
+    # 先寫入 build.json，使領取到新任務的工作進程讀到對應的字體與參數
+    _write_atomic(os.path.join(queue_dir, BUILD_FILE), json.dumps(build_info, ensure_ascii=False, indent=2).encode('utf-8'))
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+    for shard, (annotated, unannotated) in enumerate(shards):
+        job = {"build_id": build_info["build_id"], "shard": shard, "annotated": annotated, "unannotated": unannotated}
+        _write_atomic(os.path.join(dirs["queue"], _shard_name(shard) + ".json"), json.dumps(job, ensure_ascii=False).encode('utf-8'))
+
+
+def load_build_info(queue_dir):
+    with open(os.path.join(queue_dir, BUILD_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def claim_job(queue_dir):
+    """領取一個任務，返回 (claimed 路徑, 任務)；佇列為空時返回 (None, None)"""
+    dirs = _dirs(queue_dir)
+    try:
+        names = sorted(name for name in os.listdir(dirs["queue"]) if name.endswith(".json"))
+    except FileNotFoundError:
+        return None, None
+    for name in names:
+        claimed = os.path.join(dirs["claimed"], name)
+        try:
+            os.rename(os.path.join(dirs["queue"], name), claimed)
+        except OSError:
+            continue  # 已被其他工作進程領取
+        os.utime(claimed)  # 領取時間，用於判斷中斷的任務
+        with open(claimed, 'r', encoding='utf-8') as f:
+            return claimed, json.load(f)
+    return None, None
+
+
+def requeue_stale(queue_dir, timeout=SHARD_STALE_TIMEOUT):
+    """把領取後超過 timeout 秒仍沒有結果的任務放回佇列，返回放回的數量"""
+    dirs = _dirs(queue_dir)
+    now = time.time()
+    requeued = 0
+    for name in os.listdir(dirs["claimed"]):
+        path = os.path.join(dirs["claimed"], name)
+        shard_name = name[:-len(".json")]
+        try:
+            stale = now - os.path.getmtime(path) > timeout
+        except OSError:
+            continue
+        if stale and not os.path.exists(os.path.join(dirs["done"], shard_name + ".pickle")):
+            try:
+                os.rename(path, os.path.join(dirs["queue"], name))
+                requeued += 1
+            except OSError:
+                pass
+    return requeued
+
+
+_worker_build_id = None
+
+
+def _process_job(queue_dir, claimed, job):
+    global _worker_build_id
+    if job["build_id"] != _worker_build_id:
+        build_info = load_build_info(queue_dir)
+        if build_info["build_id"] != job["build_id"]:
+            # 舊建置留下的任務
+            os.remove(claimed)
+            return False
+        pipeline._init_draw_worker(build_info["base_font_file"], build_info["anno_font_file"],
+                                   build_info["cu2qu_max_err"], build_info["layout_options"])
+        _worker_build_id = job["build_id"]
+
+    done = os.path.join(_dirs(queue_dir)["done"], _shard_name(job["shard"]))
+    annotated = [(glyph_name, [tuple(variant) for variant in variants]) for glyph_name, variants in job["annotated"]]
+    try:
+        results = pipeline._draw_chunk(annotated, job["unannotated"])
+    except Exception:
+        _write_atomic(done + ".error", traceback.format_exc().encode('utf-8'))
+    else:
+        _write_atomic(done + ".pickle", pickle.dumps({"build_id": job["build_id"], "results": results},
+                                                     protocol=pickle.HIGHEST_PROTOCOL))
+    try:
+        os.remove(claimed)
+    except OSError:
+        pass
+    return True
+
+
+def run_worker(queue_dir, follow=False, poll_interval=SHARD_POLL_INTERVAL, verbose=True):
+    """處理佇列中的任務直到佇列為空 (follow 時持續等待新任務，直到 Ctrl+C)，返回處理的分片數"""
+    processed = 0
+    try:
+        while True:
+            claimed, job = claim_job(queue_dir)
+            if claimed is None:
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+                continue
+            if _process_job(queue_dir, claimed, job):
+                processed += 1
+                if verbose:
+                    print(f"[INFO] Shard {_shard_name(job['shard'])} done.", flush=True)
+    except KeyboardInterrupt:
+        pass
+    if verbose:
+        print(f"[INFO] Shard worker {socket.gethostname()}:{os.getpid()} processed {processed} shards.")
+    return processed
+
+
+def _collect_results(queue_dir, build_id, shard_count, merger):
+    """按分片編號合併所有結果；缺少結果時返回 False"""
+    done = _dirs(queue_dir)["done"]
+    for shard in range(shard_count):
+        error = os.path.join(done, _shard_name(shard) + ".error")
+        if os.path.exists(error):
+            with open(error, 'r', encoding='utf-8') as f:
+                raise RuntimeError(f"Shard {shard} failed:\n{f.read()}")
+        if not os.path.exists(os.path.join(done, _shard_name(shard) + ".pickle")):
+            return False
+    for shard in range(shard_count):
+        path = os.path.join(done, _shard_name(shard) + ".pickle")
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data["build_id"] != build_id:
+            raise RuntimeError(f"Shard result {path} belongs to another build")
+        merger.add(data["results"])
+        os.remove(path)
+    return True
+
+
+def build_sharded(
+    queue_dir,
+    base_font_file, anno_font_file,
+    base_font, output_font, word_mapping, char_mapping,
+    jobs=1,
+    shard_size=SHARD_SIZE,
+    stale_timeout=SHARD_STALE_TIMEOUT,
+    prune_word_rules=None,
+    encode_gsub=True,
+    cu2qu_max_err=DEFAULT_CU2QU_MAX_ERR,
+    top_padding_percent=None,
+    bottom_padding_percent=None,
+    group_variants=False,
+    word_rule_options=None,
+    **layout_options
+):
+    """
+    與 build_pipelined 得到相同的字體，但輪廓由 queue_dir 中的分片任務繪製 (見檔案開頭)。
+    jobs: 本機的工作進程數 (含主進程)。
+    """
+    plan, glyph_names, skipped_no_outline, store_order = plan_outlines(base_font, output_font, char_mapping, group_variants)
+    merger = OutlineMerger(base_font, output_font, anno_font_file, cu2qu_max_err, store_order, layout_options)
+    preload_tables(output_font)
+
+    shards = _draw_jobs(plan, glyph_names, shard_size)
+    build_id = uuid.uuid4().hex
+    create_queue(queue_dir, {
+        "build_id": build_id,
+        "base_font_file": os.path.abspath(base_font_file),
+        "anno_font_file": os.path.abspath(anno_font_file),
+        "cu2qu_max_err": cu2qu_max_err,
+        "layout_options": layout_options,
+    }, shards)
+    build_log.info(f"Shard queue {queue_dir}: {len(shards)} shards, {jobs} local workers. "
+                   f"More workers can join with: python3 shard_queue.py {queue_dir}")
+
+    with ThreadPoolExecutor(max_workers=1) as gsub_executor, \
+         ProcessPoolExecutor(max_workers=max(jobs - 1, 1)) as worker_executor:
+        gsub_future = gsub_executor.submit(
+            _build_gsub, output_font, word_mapping, char_mapping, prune_word_rules, encode_gsub,
+            word_rule_options or {}
+        )
+        for _ in range(jobs - 1):
+            worker_executor.submit(run_worker, queue_dir, verbose=False)
+
+        requeued = 0
+        while True:
+            # 主進程也處理任務；佇列為空後等待其他工作進程
+            run_worker(queue_dir, verbose=False)
+            if _collect_results(queue_dir, build_id, len(shards), merger):
+                break
+            requeued += requeue_stale(queue_dir, stale_timeout)
+            time.sleep(SHARD_POLL_INTERVAL)
+        if requeued:
+            build_log.info(f"Shard queue: {requeued} interrupted shards were queued again.")
+        merger.redraw_composites()
+
+        gsub_data = gsub_future.result()
+
+    set_encoded_gsub(output_font, gsub_data)
+    merger.finish(skipped_no_outline, top_padding_percent, bottom_padding_percent)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="shard_queue.py", description="Draw outline shards queued by wing-font.py --shard-queue.")
+    parser.add_argument('queue_dir', help="Shared queue directory given to --shard-queue")
+    parser.add_argument('--follow', action='store_true', help="Keep waiting for new shards (also of later builds) until Ctrl+C instead of exiting when the queue is empty.")
+    parser.add_argument('--poll', type=float, default=SHARD_POLL_INTERVAL, help=f"Polling interval in seconds while waiting. (default: {SHARD_POLL_INTERVAL})")
+    options = parser.parse_args()
+    run_worker(options.queue_dir, follow=options.follow, poll_interval=options.poll)
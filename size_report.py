@@ -0,0 +1,196 @@
+# size_report.py
+# 輸出字體的表格大小報告與大小預算
+#   - 每個輸出格式的總大小與每個表格的大小：TTF 為編碼後的大小，WOFF 為 zlib 壓縮後的大小，
+#     WOFF2 為轉換後、共用的 Brotli 壓縮前的大小 (WOFF2 的各表格沒有獨立的壓縮大小)
+#   - GSUB 另按 lookup 類型細分 (TTF 為編碼後大小，WOFF 為各自以 zlib 壓縮的大小)
+#   - 可與儲存的基準比較：預算檔中的規則超出時建置失敗
+#
+# 報告格式 {flavor: {鍵: 位元組數}}，鍵為 "total"、表格標籤 (如 "glyf") 或 "GSUB.<lookup 類型>" (如 "GSUB.chain")
+#
+# 預算檔 (JSON): {"<flavor>:<鍵>": 限制, ...}，flavor 與鍵可為 "*"
+#   "10%"   相對基準最多增加 10% (沒有基準時略過)
+#   300000  大小上限 (位元組)
+# 例如 {"*:total": "5%", "woff2:GSUB": "20%", "ttf:glyf": 8000000}
+
+import io
+import json
+import os
+import zlib
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.sfnt import SFNTReader
+from fontTools.ttLib.tables import otTables
+from fontTools.ttLib.tables.otBase import OTTableWriter, OTLOffsetOverflowError
+from utils import CACHE_DIR
+import build_log
+
+# 預設的大小基準檔
+SIZE_BASELINE = os.path.join(CACHE_DIR, "size-baseline.json")
+
+GSUB_LOOKUP_TYPES = {
+    1: "single", 2: "multiple", 3: "alternate", 4: "ligature",
+    5: "context", 6: "chain", 7: "extension", 8: "reverse",
+}
+
+# 與 fontTools 寫 WOFF 時相同的 zlib 壓縮等級
+WOFF_ZLIB_LEVEL = 6
+
+
+class SizeBudgetError(Exception):
+    """輸出超過大小預算；args[0] 為違反的規則說明列表"""
+
+    def __str__(self):
+        return "; ".join(self.args[0])
+
+
+def _compile_lookup(lookup, font):
+    writer = OTTableWriter(tableTag='GSUB')
+    lookup.compile(writer, font)
+    return writer.getAllData()
+
+
+def _lookup_data(lookup, font):
+    """返回 lookup 編碼後的資料；單一 lookup 的偏移量溢出時逐個子表編碼"""
+    try:
+        return _compile_lookup(lookup, font)
+    except OTLOffsetOverflowError:
+        data = b""
+        for subtable in lookup.SubTable:
+            single = otTables.Lookup()
+            single.LookupType = lookup.LookupType
+            single.LookupFlag = lookup.LookupFlag
+            single.SubTable = [subtable]
+            single.SubTableCount = 1
+            data += _compile_lookup(single, font)
+        return data
+
+
+def gsub_lookup_sizes(font):
+    """返回 ({lookup 類型: 編碼後位元組數}, {lookup 類型: zlib 壓縮後位元組數})"""
+    sizes, compressed = {}, {}
+    if 'GSUB' not in font:
+        return sizes, compressed
+    gsub = font['GSUB'].table
+    if gsub.LookupList is None:
+        return sizes, compressed
+    for lookup in gsub.LookupList.Lookup:
+        lookup_type = lookup.LookupType
+        if lookup_type == 7 and lookup.SubTable:
+            lookup_type = lookup.SubTable[0].ExtensionLookupType
+        name = GSUB_LOOKUP_TYPES.get(lookup_type, str(lookup_type))
+        data = _lookup_data(lookup, font)
+        sizes[name] = sizes.get(name, 0) + len(data)
+        compressed[name] = compressed.get(name, 0) + len(zlib.compress(data, WOFF_ZLIB_LEVEL))
+    return sizes, compressed
+
+
+def table_size_report(fonts):
+    """fonts: {flavor: 字體位元組}，返回 {flavor: {鍵: 位元組數}}"""
+    report = {}
+    for flavor, data in fonts.items():
+        reader = SFNTReader(io.BytesIO(data))
+        sizes = {"total": len(data)}
+        for tag in reader.keys():
+            sizes[tag.strip()] = reader.tables[tag].length
+        report[flavor] = sizes
+
+    # 各格式的 GSUB 內容相同，只解碼一次
+    data = fonts.get("ttf") or next(iter(fonts.values()), None)
+    if data is not None:
+        font = TTFont(io.BytesIO(data))
+        lookup_sizes, lookup_compressed = gsub_lookup_sizes(font)
+        font.close()
+        for flavor, sizes in report.items():
+            if flavor == "ttf":
+                values = lookup_sizes
+            elif flavor == "woff":
+                values = lookup_compressed
+            else:
+                continue
+            for name, size in values.items():
+                sizes[f"GSUB.{name}"] = size
+    return report
+
+
+def _row_order(report):
+    first = next(iter(report.values()))
+    tags = sorted((key for key in first if key != "total" and not key.startswith("GSUB.")),
+                  key=lambda key: -first[key])
+    rows = ["total"]
+    for tag in tags:
+        rows.append(tag)
+        if tag == "GSUB":
+            rows.extend(sorted((key for key in first if key.startswith("GSUB.")), key=lambda key: -first[key]))
+    return rows
+
+
+def _cell(size, baseline_size):
+    if size is None:
+        return "-"
+    if baseline_size:
+        return f"{size} ({(size - baseline_size) / baseline_size:+.1%})"
+    return str(size)
+
+
+def print_size_report(report, baseline=None):
+    if not report:
+        return
+    flavors = list(report)
+    widths = 22 if baseline else 12
+    print("[INFO] Output size by table (bytes" + (", change from baseline" if baseline else "") +
+          "; WOFF2 tables before Brotli):")
+    print("  " + "table".ljust(16) + "".join(flavor.rjust(widths) for flavor in flavors))
+    for key in _row_order(report):
+        label = ("  " + key[5:]) if key.startswith("GSUB.") else key
+        cells = []
+        for flavor in flavors:
+            baseline_size = (baseline or {}).get(flavor, {}).get(key)
+            cells.append(_cell(report[flavor].get(key), baseline_size).rjust(widths))
+        print("  " + label.ljust(16) + "".join(cells))
+
+
+def load_size_baseline(baseline_file):
+    if not baseline_file or not os.path.exists(baseline_file):
+        return None
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_size_baseline(baseline_file, report):
+    directory = os.path.dirname(baseline_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(baseline_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    build_log.info(f"Size baseline saved as {baseline_file}")
+
+
+def load_size_budget(budget_file):
+    with open(budget_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_size_budget(report, budget, baseline=None):
+    """返回違反預算的說明列表 (空列表表示全部通過)"""
+    violations = []
+    skipped_relative = False
+    for rule, limit in budget.items():
+        flavor_pattern, _, key_pattern = rule.partition(":")
+        for flavor, sizes in report.items():
+            if flavor_pattern not in ("*", flavor):
+                continue
+            for key, size in sizes.items():
+                if key_pattern not in ("*", key):
+                    continue
+                if isinstance(limit, str) and limit.endswith("%"):
+                    baseline_size = (baseline or {}).get(flavor, {}).get(key)
+                    if not baseline_size:
+                        skipped_relative = True
+                        continue
+                    growth = (size - baseline_size) / baseline_size
+                    if growth > float(limit[:-1]) / 100:
+                        violations.append(f"{flavor} {key} grew {growth:+.1%} ({baseline_size} -> {size} bytes), budget {rule} = {limit}")
+                elif size > limit:
+                    violations.append(f"{flavor} {key} is {size} bytes, budget {rule} = {limit}")
+    if skipped_relative:
+        build_log.info("Some relative size budgets were skipped because the baseline has no matching entry.")
+    return violations
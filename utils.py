@@ -1,5 +1,13 @@
 import collections
+import hashlib
+import json
+import os
+import socket
 from fontTools.ttLib.tables import otTables
+import build_log
+
+# 建置之間共用的快取與記錄目錄
+CACHE_DIR = ".wingfont"
 
 def get_glyph_name_by_char(font, char):
     """
@@ -31,8 +39,10 @@ def get_glyph_name_by_char(font, char):
 
 def buildCoverage(glyphs=None):
     """
-    Builds a Format 1 Coverage table. 
+    Builds a Coverage table. 
     Accepts an optional 'glyphs' keyword argument.
+    Format 1 is only the initial value: when compiling, fontTools switches to
+    Format 2 (glyph ranges) whenever it is smaller, e.g. for --group-variants blocks.
     """
     coverage = otTables.Coverage()
     coverage.Format = 1
@@ -48,7 +58,7 @@ def buildChainSubRuleSet():
     return srs
 
 def buildCoverage(glyphs=None):
-    """Builds a Format 1 Coverage table."""
+    """Builds a Coverage table (fontTools picks Format 1 or 2, whichever is smaller, when compiling)."""
     coverage = otTables.Coverage()
     coverage.Format = 1
     coverage.glyphs = glyphs if glyphs is not None else []
@@ -66,4 +76,32 @@ def buildDefaultLangSys():
 def chunk(lst, n):
     """Yields successive n-sized chunks from lst."""
     for i in range(0, len(lst), n):
-        yield lst[i:i + n]
\ No newline at end of file
+        yield lst[i:i + n]
+
+def file_digest(path):
+    """Returns the SHA-1 hex digest of a file's content (used as a cache key)."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_json_cache(path):
+    """Returns the cached dict in path; a missing file is empty, an unreadable one (e.g. truncated) is warned about and rebuilt."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        build_log.warning(f"Ignoring unreadable cache {path} ({e}); it will be rebuilt.")
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def save_json_cache(path, cache):
+    """Writes cache to path atomically, so an interrupted or concurrent build never leaves a truncated file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{socket.gethostname()}-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
@@ -0,0 +1,166 @@
+# variant_index.py
+# 讀音選擇索引 (--variant-index)：編輯器與輸入法不需要排版文字，就能知道每個字的哪個數字 (或 丅+中文數字) 選擇哪個讀音
+#   - 從最終的 char_mapping (已填入 (字形名稱, 變體編號)) 產生，與 buildLiga 的規則相同：
+#     數字 N / 丅+第 N 個中文數字選擇變體 N，0 為預設讀音；只有 0-9，之後的變體沒有選擇器，不包含在索引中
+#   - 二進位格式 (小端序，各陣列 4 位元組對齊，可以 mmap 或在瀏覽器中直接以 TypedArray 讀取):
+#       header   "WFVI", u16 版本, u16 旗標 (bit 0: 讀音編號為 u32), u16 可用的數字 (bit N: 數字 N),
+#                u16 可用的 丅+中文數字 (bit N: 丅 與第 N 個中文數字都在字體中), u32 字數 N, u32 讀音數 M, u32 條目數 E
+#       u32[N]   排序的碼位
+#       u32[N+1] 每個字的條目起點：字 i 的條目為 [offsets[i], offsets[i+1])，第 j 個條目為選擇器 j 選擇的讀音
+#       u32[M+1] 每個讀音在字串表中的位元組起點 (讀音按字串排序)
+#       u16[E]   讀音編號 (旗標 bit 0 時為 u32)；沒有變體 j 時為 0xFFFF (0xFFFFFFFF)
+#       UTF-8 字串表
+#   - JSON 後備格式: {"version": 1, "selectors": {"digits": "0123456789", "hen": "丅", "numerals": "零一二..."},
+#                    "chars": {"字": ["預設讀音", "數字 1 的讀音", ...]}}
+#   - 附加方案 (ss02..) 的索引另外寫為 <輸出>.ss02.variants.bin 等
+
+import bisect
+import json
+import struct
+import sys
+
+VARIANT_INDEX_MAGIC = b"WFVI"
+VARIANT_INDEX_VERSION = 1
+
+# 與 buildLiga 相同的選擇器
+DIGITS = "0123456789"
+HEN_CHAR = "丅"
+CHINESE_NUMERALS = "零一二三四五六七八九"
+
+FLAG_WIDE_IDS = 0x1
+
+_HEADER = struct.Struct("<4sHHHHIII")
+
+
+def _selectors(output_font):
+    cmap = output_font.getBestCmap()
+    digits = "".join(char for char in DIGITS if ord(char) in cmap)
+    hen = HEN_CHAR if ord(HEN_CHAR) in cmap else None
+    numerals = "".join(char for char in CHINESE_NUMERALS if ord(char) in cmap) if hen else ""
+    return {"digits": digits, "hen": hen, "numerals": numerals}
+
+
+def variant_table(output_font, char_mapping):
+    """
+    返回按碼位排序的 [(碼位, [選擇器 0-9 選擇的讀音 | None, ...]), ...]。
+    變體編號取自 char_mapping 的值 (cmap 別名使用代表字的編號，與 buildLiga 相同)；
+    沒有填入字形名稱或不在輸出字體 cmap 中的字沒有選擇規則，不包含在內。
+    """
+    cmap = output_font.getBestCmap()
+    table = []
+    for char, annos in char_mapping.items():
+        if ord(char) not in cmap:
+            continue
+        by_variant = {}
+        for anno_str, value in annos.items():
+            if value is not None and value[1] < len(DIGITS):
+                by_variant.setdefault(value[1], anno_str)
+        if by_variant:
+            table.append((ord(char), [by_variant.get(i) for i in range(max(by_variant) + 1)]))
+    table.sort()
+    return table
+
+
+def encode_variant_index(table, selectors):
+    """把 variant_table() 的結果編碼為二進位索引"""
+    strings = sorted({reading for _, readings in table for reading in readings if reading is not None})
+    string_ids = {reading: i for i, reading in enumerate(strings)}
+    wide = len(strings) >= 0xFFFF
+    missing = 0xFFFFFFFF if wide else 0xFFFF
+
+    codepoints, offsets, entries = [], [0], []
+    for codepoint, readings in table:
+        codepoints.append(codepoint)
+        entries.extend(missing if reading is None else string_ids[reading] for reading in readings)
+        offsets.append(len(entries))
+
+    blob = bytearray()
+    string_offsets = [0]
+    for reading in strings:
+        blob += reading.encode('utf-8')
+        string_offsets.append(len(blob))
+
+    digit_mask = sum(1 << DIGITS.index(char) for char in selectors["digits"])
+    numeral_mask = sum(1 << CHINESE_NUMERALS.index(char) for char in selectors["numerals"])
+    data = bytearray(_HEADER.pack(VARIANT_INDEX_MAGIC, VARIANT_INDEX_VERSION, FLAG_WIDE_IDS if wide else 0,
+                                  digit_mask, numeral_mask, len(codepoints), len(strings), len(entries)))
+    data += struct.pack(f"<{len(codepoints)}I", *codepoints)
+    data += struct.pack(f"<{len(offsets)}I", *offsets)
+    data += struct.pack(f"<{len(string_offsets)}I", *string_offsets)
+    data += struct.pack(f"<{len(entries)}{'I' if wide else 'H'}", *entries)
+    data += b"\0" * (-len(data) % 4)
+    data += blob
+    return bytes(data)
+
+
+def variant_index_json(table, selectors):
+    index = {
+        "version": VARIANT_INDEX_VERSION,
+        "selectors": selectors,
+        "chars": {chr(codepoint): readings for codepoint, readings in table},
+    }
+    return json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+def variant_index_files(output_font, char_mappings):
+    """
+    char_mappings: [(feature_tag | None, char_mapping), ...]，None 為主映射。
+    返回 {副檔名: bytes}，例如 {"variants.bin": ..., "variants.json": ..., "ss02.variants.bin": ...}
+    """
+    selectors = _selectors(output_font)
+    files = {}
+    for feature_tag, char_mapping in char_mappings:
+        prefix = f"{feature_tag}." if feature_tag else ""
+        table = variant_table(output_font, char_mapping)
+        files[prefix + "variants.bin"] = encode_variant_index(table, selectors)
+        files[prefix + "variants.json"] = variant_index_json(table, selectors)
+    return files
+
+
+class VariantIndex:
+    """
+    讀取二進位索引 (bytes、mmap 等支援 buffer protocol 的物件)，查詢時不解碼整個檔案。
+    用法: VariantIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).readings("行") -> ["hang4", "hong4"]
+    """
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        magic, version, flags, self.digit_mask, self.numeral_mask, count, string_count, entry_count = \
+            _HEADER.unpack_from(self.buffer, 0)
+        if magic != VARIANT_INDEX_MAGIC or version != VARIANT_INDEX_VERSION:
+            raise ValueError(f"Not a version {VARIANT_INDEX_VERSION} variant index")
+        position = _HEADER.size
+        self.codepoints = self._array(position, "I", count)
+        position += 4 * count
+        self.offsets = self._array(position, "I", count + 1)
+        position += 4 * (count + 1)
+        self.string_offsets = self._array(position, "I", string_count + 1)
+        position += 4 * (string_count + 1)
+        wide = flags & FLAG_WIDE_IDS
+        self.entries = self._array(position, "I" if wide else "H", entry_count)
+        self.missing = 0xFFFFFFFF if wide else 0xFFFF
+        position += (4 if wide else 2) * entry_count
+        self.strings = position + (-position % 4)
+
+    def _array(self, position, fmt, count):
+        size = struct.calcsize(fmt)
+        view = self.buffer[position:position + size * count]
+        if sys.byteorder == "little":
+            return view.cast(fmt)
+        return struct.unpack(f"<{count}{fmt}", view)
+
+    def __len__(self):
+        return len(self.codepoints)
+
+    def reading(self, string_id):
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return bytes(self.buffer[self.strings + start:self.strings + end]).decode('utf-8')
+
+    def readings(self, char):
+        """返回選擇器 0, 1, ... 選擇的讀音 (沒有該變體時為 None)；不在索引中時返回 []"""
+        codepoint = ord(char)
+        i = bisect.bisect_left(self.codepoints, codepoint)
+        if i == len(self.codepoints) or self.codepoints[i] != codepoint:
+            return []
+        return [None if string_id == self.missing else self.reading(string_id)
+                for string_id in self.entries[self.offsets[i]:self.offsets[i + 1]]]
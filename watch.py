@@ -0,0 +1,104 @@
+# watch.py
+# --watch 模式：字體、映射與字形輪廓常駐記憶體，映射 CSV 或參數檔改變時只重建受影響的部分。
+#   - 字體只載入一次
+#   - 映射 CSV 改變時重新解析；參數檔改變時重新讀取
+#   - 排版參數不變時，沿用未改變的 (字形, 註音) 輪廓，只繪製新增的註音；GSUB 每次重建
+#   - 排版參數改變時清空輪廓快取
+
+import json
+import os
+import time
+import build_log
+
+# 輪詢間隔 (秒)
+WATCH_INTERVAL = 1.0
+
+# 影響輪廓的參數；其中任何一個改變時清空輪廓快取
+LAYOUT_PARAMS = (
+    "base_scale", "anno_scale", "anno_y_offset", "base_y_offset",
+    "base_rotate", "anno_rotate", "min_lsb", "invert", "fit", "fit_padding",
+    "anno_spacing", "auto_width", "simplify_tolerance",
+)
+
+
+def load_params_file(params_file, allowed=None):
+    """讀取 JSON 參數檔 (鍵名與 main() 的參數相同，例如 --calibrate-output 的輸出)，略過不認識的鍵"""
+    with open(params_file, 'r', encoding='utf-8') as f:
+        params = json.load(f)
+    if allowed is not None:
+        unknown = sorted(k for k in params if k not in allowed)
+        if unknown:
+            build_log.error(f"Ignoring unknown parameters in {params_file}: {', '.join(unknown)}")
+            params = {k: v for k, v in params.items() if k in allowed}
+    return params
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def watch(mapping_file, params_file, build_options, word_mapping, char_mapping,
+          load_mapping, rebuild, interval=WATCH_INTERVAL):
+    """
+    先建置一次，之後在 mapping_file 或 params_file 改變時重建，直到 Ctrl+C。
+    load_mapping() -> (word_mapping, char_mapping)
+    rebuild(word_mapping, char_mapping, options, glyph_cache)
+    """
+    glyph_cache = {}
+    layout_key = None
+    mapping_state = _file_state(mapping_file)
+    params_state = _file_state(params_file) if params_file else None
+    options = dict(build_options)
+    changed = ["initial build"]
+
+    build_log.info(f"Watching {mapping_file}" + (f" and {params_file}" if params_file else "") + ". Press Ctrl+C to stop.")
+    try:
+        while True:
+            if changed:
+                key = tuple(options.get(name) for name in LAYOUT_PARAMS)
+                if key != layout_key:
+                    if layout_key is not None:
+                        build_log.info("Layout parameters changed, redrawing all outlines.")
+                    glyph_cache.clear()
+                    layout_key = key
+
+                build_log.info(f"Rebuilding ({', '.join(changed)})...")
+                start = time.perf_counter()
+                try:
+                    rebuild(word_mapping, char_mapping, options, glyph_cache)
+                    build_log.info(f"Rebuilt in {time.perf_counter() - start:.1f}s.")
+                except Exception as e:
+                    # 保持監看，修正輸入後會再次重建
+                    build_log.error(f"Rebuild failed: {e!r}")
+                changed = []
+
+            time.sleep(interval)
+
+            state = _file_state(mapping_file)
+            if state != mapping_state:
+                mapping_state = state
+                if state is None:
+                    continue
+                try:
+                    word_mapping, char_mapping = load_mapping()
+                    changed.append(os.path.basename(mapping_file))
+                except Exception as e:
+                    build_log.error(f"Cannot load {mapping_file}: {e!r}")
+
+            if params_file:
+                state = _file_state(params_file)
+                if state != params_state:
+                    params_state = state
+                    if state is None:
+                        continue
+                    try:
+                        options = {**build_options, **load_params_file(params_file, build_options)}
+                        changed.append(os.path.basename(params_file))
+                    except (OSError, ValueError) as e:
+                        build_log.error(f"Cannot load {params_file}: {e!r}")
+    except KeyboardInterrupt:
+        build_log.info("Stopped watching.")
@@ -2,51 +2,71 @@
 
 from fontTools.ttLib import TTFont
 from mappings.csv_parser import load_mapping
-from chain_context_handler import buildChainSub
-from liga_handler import buildLiga
-from build_glyph import generate_glyphs
 import sys
 import argparse
-from fontTools import subset
 from functools import reduce
-from utils import get_glyph_name_by_char
+from build_profile import PhaseTimer, PROFILE_LOG, record_profile, load_profiles
+from estimator import count_build, predict_sizes, calibrate, estimate, print_dry_run_report, count_mapping_rows
+from calibrate import calibrate_layout, format_cli_args
+from rule_analysis import PRUNE_MODES, PRUNE_SAFE
+from pipeline import load_inputs
+from build_api import BuildConfig, build_font_bytes, write_outputs, FLAVORS
+from size_report import (
+    SIZE_BASELINE, SizeBudgetError, table_size_report, print_size_report,
+    load_size_baseline, save_size_baseline, load_size_budget, check_size_budget
+)
+from cff_source import load_font, DEFAULT_CU2QU_MAX_ERR
+from glyph_source import GLYPH_SOURCE_SIZE
+from shard_queue import SHARD_SIZE
+from schemes import scheme_label
+from checkpoint import CHECKPOINT_DIR, mapping_key, load_checkpoint, save_checkpoint
+import build_log
+from watch import watch, load_params_file, WATCH_INTERVAL
+import json
 import operator
 import string 
 
-# ... (語言 ID 常量) ...
-WINDOWS_ENGLISH_IDS = (3, 1, 0x0409) 
-MAC_ROMAN_IDS = (1, 0, 0)          
-WINDOWS_CHINESE_SIMPLIFIED_IDS = (3, 1, 0x0804) 
-WINDOWS_CHINESE_TAIWAN_IDS = (3, 1, 0x0404)     
-WINDOWS_CHINESE_HONGKONG_IDS = (3, 1, 0x0C04)   
+def build_font(
+    base_font,
+    anno_font,
+    base_font_file,
+    anno_font_file,
+    output_prefix,
+    word_mapping,
+    char_mapping,
+    timer,
+    glyph_cache=None,
+    word_weights=None,
+    extra_schemes=None,
+    size_report=True,
+    size_budget=None,
+    size_baseline=SIZE_BASELINE,
+    update_size_baseline=False,
+    **options
+):
+    """
+    以已載入的字體與映射建置並儲存各格式；options 為 BuildConfig 的欄位。
+    儲存後輸出各表格大小；超過 size_budget 時 (已寫入輸出檔案) 拋出 SizeBudgetError。
+    """
+    config = BuildConfig(**options)
+    fonts = build_font_bytes(
+        config, base_font, anno_font, word_mapping, char_mapping,
+        timer=timer, glyph_cache=glyph_cache, font_files=(base_font_file, anno_font_file),
+        word_weights=word_weights, extra_schemes=extra_schemes
+    )
+    write_outputs(fonts, output_prefix)
 
-def set_family_names(font, name_map):
-    table = font["name"]
-    name_ids = (1, 4, 6, 16) 
-    
-    for (plat_id, enc_id, lang_id), new_family_name in name_map.items():
-        if new_family_name is None:
-            continue
-            
-        for name_id in name_ids:
-            old_name_rec = table.getName(
-                nameID=name_id,
-                platformID=plat_id,
-                platEncID=enc_id,
-                langID=lang_id,
-            )
-            
-            lang_str = f"P:{plat_id}/E:{enc_id}/L:{hex(lang_id)}"
-            old_name = old_name_rec.toUnicode() if old_name_rec else "N/A"
-            print(f"[{lang_str}] Changing NameID {name_id} from '{old_name}' to '{new_family_name}'")
-
-            table.setName(
-                new_family_name,
-                nameID=name_id,
-                platformID=plat_id,
-                platEncID=enc_id,
-                langID=lang_id,
-            )
+    if not (size_report or size_budget or update_size_baseline):
+        return
+    report = table_size_report({flavor: data for flavor, data in fonts.items() if flavor in FLAVORS})
+    baseline = load_size_baseline(size_baseline)
+    if size_report:
+        print_size_report(report, baseline)
+    violations = check_size_budget(report, load_size_budget(size_budget), baseline) if size_budget else []
+    if update_size_baseline:
+        save_size_baseline(size_baseline, report)
+    elif violations:
+        raise SizeBudgetError(violations)
 
 
 def main(
@@ -74,43 +94,131 @@ def main(
     auto_width=False,
     auto_height=False,
     top_padding_percent=None,
-    bottom_padding_percent=None
+    bottom_padding_percent=None,
+    dry_run=False,
+    profile_log=None,
+    calibrate_params=False,
+    target_ascender=None,
+    target_descender=None,
+    min_gap=0.02,
+    calibrate_output=None,
+    prune_word_rules=PRUNE_SAFE,
+    jobs=1,
+    cu2qu_max_err=DEFAULT_CU2QU_MAX_ERR,
+    simplify_tolerance=None,
+    mark_attachment=False,
+    group_variants=False,
+    glyph_source_size=GLYPH_SOURCE_SIZE,
+    scheme_mappings=(),
+    max_word_rules=None,
+    max_word_rule_bytes=None,
+    top_chars=None,
+    shard_queue=None,
+    shard_size=SHARD_SIZE,
+    checkpoint_dir=None,
+    qa=False,
+    qa_report=None,
+    variant_index=False,
+    flavors=("ttf", "woff"),
+    size_report=True,
+    size_budget=None,
+    size_baseline=SIZE_BASELINE,
+    update_size_baseline=False,
+    watch_mode=False,
+    params_file=None,
+    watch_interval=WATCH_INTERVAL
 ):
+    timer = PhaseTimer()
+    word_weights = {}
+
+    # 映射的檢查點 (見 checkpoint.py)
+    mapping_state = None
+    if checkpoint_dir:
+        mapping_checkpoint = mapping_key(base_font_file, mapping, top_chars)
+        mapping_state = load_checkpoint(checkpoint_dir, "mapping", mapping_checkpoint)
+
     # Load the fonts and mapping
-    base_font = TTFont(base_font_file)
-    anno_font = TTFont(anno_font_file)
-    output_font = TTFont(base_font_file)
-    word_mapping, char_mapping = load_mapping(base_font, mapping)
+    if mapping_state is not None:
+        build_log.info(f"Resuming from the mapping checkpoint in {checkpoint_dir}.")
+        with timer.phase("load_fonts"):
+            base_font = load_font(base_font_file, cu2qu_max_err, jobs)
+            anno_font = load_font(anno_font_file, cu2qu_max_err, jobs)
+        word_mapping, char_mapping = mapping_state["word_mapping"], mapping_state["char_mapping"]
+        word_weights.update(mapping_state["word_weights"])
+    elif jobs > 1:
+        # 載入字體的同時讀取映射 CSV
+        with timer.phase("load_mapping"):
+            base_font, anno_font, word_mapping, char_mapping = load_inputs(base_font_file, anno_font_file, mapping, cu2qu_max_err, jobs,
+                                                                           word_weights=word_weights, top_chars=top_chars)
+    else:
+        with timer.phase("load_fonts"):
+            base_font = load_font(base_font_file, cu2qu_max_err)
+            anno_font = load_font(anno_font_file, cu2qu_max_err)
+        with timer.phase("load_mapping"):
+            word_mapping, char_mapping = load_mapping(base_font, mapping, word_weights=word_weights, top_chars=top_chars)
+    if checkpoint_dir and mapping_state is None:
+        save_checkpoint(checkpoint_dir, "mapping", mapping_checkpoint, {
+            "word_mapping": word_mapping, "char_mapping": char_mapping, "word_weights": word_weights
+        })
 
-    # 創建名稱映射字典
-    name_map = {}
-    
-    if en_name is not None:
-        name_map[WINDOWS_ENGLISH_IDS] = en_name
-        name_map[MAC_ROMAN_IDS] = en_name 
-    if cn_name is not None:
-        name_map[WINDOWS_CHINESE_SIMPLIFIED_IDS] = cn_name
-    if tw_name is not None:
-        name_map[WINDOWS_CHINESE_TAIWAN_IDS] = tw_name
-    if hk_name is not None:
-        name_map[WINDOWS_CHINESE_HONGKONG_IDS] = hk_name
-    
-    if name_map:
-        set_family_names(output_font, name_map)
-
-    # Combine the glyphs and save the new font
-    generate_glyphs(
-        base_font, 
-        anno_font, 
-        output_font, 
-        char_mapping, 
-        base_scale=base_scale, 
-        anno_scale=anno_scale, 
+    # 附加的映射方案 (ss02..)，主映射為 ss01
+    extra_schemes = [(scheme_label(path),) + load_mapping(base_font, path, top_chars=top_chars) for path in scheme_mappings]
+
+    # 只搜尋排版參數，不建置字體
+    if calibrate_params:
+        params = calibrate_layout(
+            base_font, anno_font, char_mapping, base_font_file, anno_font_file,
+            base_scale=base_scale,
+            base_rotate=base_rotate,
+            anno_rotate=anno_rotate,
+            invert=invert,
+            fit_padding=fit_padding,
+            anno_spacing=anno_spacing,
+            target_ascender=target_ascender,
+            target_descender=target_descender,
+            min_gap=min_gap
+        )
+        if params is not None:
+            print(f"Calibrated parameters: {format_cli_args(params)}")
+            if calibrate_output:
+                with open(calibrate_output, 'w', encoding='utf-8') as f:
+                    json.dump(params, f, indent=2)
+                print(f"Parameters saved as {calibrate_output}")
+        base_font.close()
+        anno_font.close()
+        return params
+
+    # 計數 (不繪製字形)，用於 --dry-run 和建置記錄
+    counts = count_build(base_font, anno_font, word_mapping, char_mapping, optimize=optimize or bool(top_chars),
+                         max_word_rules=max_word_rules, max_word_rule_bytes=max_word_rule_bytes,
+                         prune_word_rules=prune_word_rules, mark_attachment=mark_attachment,
+                         extra_schemes=extra_schemes)
+    counts["mapping_rows"] = count_mapping_rows(mapping)
+    counts["jobs"] = jobs
+    counts["predicted"] = predict_sizes(base_font, anno_font, counts)
+
+    if dry_run:
+        calibration = calibrate(load_profiles(profile_log), base_font_file)
+        result = estimate(counts, counts["predicted"], calibration)
+        print_dry_run_report(counts, result, calibration)
+        base_font.close()
+        anno_font.close()
+        return result
+
+    build_options = dict(
+        en_name=en_name,
+        cn_name=cn_name,
+        tw_name=tw_name,
+        hk_name=hk_name,
+        base_scale=base_scale,
+        anno_scale=anno_scale,
         anno_y_offset=anno_y_offset,
         base_y_offset=base_y_offset,
         base_rotate=base_rotate,
         anno_rotate=anno_rotate,
         min_lsb=min_lsb,
+        optimize=optimize,
+        clear_layout=clear_layout,
         invert=invert,
         fit=fit,
         fit_padding=fit_padding,
@@ -118,56 +226,74 @@ def main(
         auto_width=auto_width,
         auto_height=auto_height,
         top_padding_percent=top_padding_percent,
-        bottom_padding_percent=bottom_padding_percent
+        bottom_padding_percent=bottom_padding_percent,
+        prune_word_rules=prune_word_rules,
+        jobs=jobs,
+        cu2qu_max_err=cu2qu_max_err,
+        simplify_tolerance=simplify_tolerance,
+        mark_attachment=mark_attachment,
+        group_variants=group_variants,
+        glyph_source_size=glyph_source_size,
+        max_word_rules=max_word_rules,
+        max_word_rule_bytes=max_word_rule_bytes,
+        scheme_label=scheme_label(mapping) if scheme_mappings else None,
+        top_chars=top_chars,
+        shard_queue=shard_queue,
+        shard_size=shard_size,
+        checkpoint_dir=checkpoint_dir,
+        qa=qa,
+        qa_report=qa_report,
+        variant_index=variant_index,
+        flavors=tuple(flavors)
+    )
+    size_options = dict(
+        size_report=size_report,
+        size_budget=size_budget,
+        size_baseline=size_baseline,
+        update_size_baseline=update_size_baseline
     )
 
-    # Build Chain Contextual Substitution
-    buildChainSub(output_font, word_mapping, char_mapping)
-    
-    # Replace glyph by new glyph using liga
-    buildLiga(output_font, char_mapping)
-
-    # if size optimization is required
-    if optimize:
-        print("Optimizing font size by subsetting...")
-        glyphs_to_be_kept = [get_glyph_name_by_char(base_font, str(i)) for i in range(0, 10)]
-        
-        for value in char_mapping.values():
-            for glyph_name, idx in value.values():
-                glyphs_to_be_kept.append(glyph_name)
-        
-        chars_to_keep_additionally = string.punctuation + string.ascii_letters + '丅，。！？《》（）「」『』｛｝〖〗【】［］、……——＠＃￥％＆＊+-/“”：；‘’／０１２３４５６７８９ａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ'
-
-        print(f"Keeping additional {len(chars_to_keep_additionally)} punctuation and letter glyphs...")
-        for char in chars_to_keep_additionally:
-            glyph_name = get_glyph_name_by_char(base_font, char)
-            if glyph_name:
-                glyphs_to_be_kept.append(glyph_name)
-        
-        options = subset.Options()
-        
-        if clear_layout:
-            print("WARNING: Clearing layout features to resolve potential FeatureParams error.")
-            options.layout_features = [] 
-        
-        subsetter = subset.Subsetter(options=options)
-        
-        valid_glyphs_to_keep = list(set(g for g in glyphs_to_be_kept if g is not None))
-        print(f"Total unique glyphs to keep: {len(valid_glyphs_to_keep)}")
-        
-        subsetter.populate(glyphs=valid_glyphs_to_keep)
-        subsetter.subset(output_font)
-
-    # Save the new font
-    output_font.save(str(output_prefix)+".ttf")
-    print(f"New font saved as {output_prefix}.ttf")
-    output_font.flavor = 'woff'
-    output_font.save(str(output_prefix+".woff"))
-    print(f"New font saved as {output_prefix}.woff")
+    if watch_mode:
+        # 字體常駐記憶體，映射或參數檔改變時重建
+        if jobs > 1:
+            build_log.info("Watch mode draws outlines in this process and reuses unchanged ones; -j only applies to CFF conversion.")
+        watch(
+            mapping, params_file, build_options, word_mapping, char_mapping,
+            load_mapping=lambda: load_mapping(base_font, mapping, word_weights=word_weights, top_chars=top_chars),
+            rebuild=lambda word_mapping, char_mapping, options, glyph_cache: build_font(
+                base_font, anno_font, base_font_file, anno_font_file, output_prefix,
+                word_mapping, char_mapping, PhaseTimer(), glyph_cache=glyph_cache,
+                word_weights=word_weights, extra_schemes=extra_schemes, **size_options, **options
+            ),
+            interval=watch_interval
+        )
+        base_font.close()
+        anno_font.close()
+        return
+
+    budget_error = None
+    try:
+        build_font(
+            base_font, anno_font, base_font_file, anno_font_file, output_prefix,
+            word_mapping, char_mapping, timer, word_weights=word_weights, extra_schemes=extra_schemes,
+            **size_options, **build_options
+        )
+    except SizeBudgetError as e:
+        budget_error = e
+
+    # 從檢查點繼續的建置缺少部分階段，不用於校準
+    if profile_log and mapping_state is None and "resume" not in timer.phases:
+        record_profile(profile_log, base_font_file, mapping, counts, timer, {
+            flavor: f"{output_prefix}.{flavor}" for flavor in flavors
+        })
     
     base_font.close()
     anno_font.close()
-    output_font.close()
+
+    if budget_error is not None:
+        for violation in budget_error.args[0]:
+            build_log.error(f"Size budget exceeded: {violation}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog=sys.argv[0])
@@ -175,6 +301,7 @@ if __name__ == "__main__":
     parser.add_argument('-a', '--anno-font_file', help="Annotation font in .ttf fomrat", required=True)
     parser.add_argument('-o', '--output-prefix', help="Output prefix for .ttf and .woff file", required=True)
     parser.add_argument('-m', '--mapping', help="CSV file for the mapping between base font and annotation font", required=True)
+    parser.add_argument('--schemes', nargs='+', metavar='CSV', default=None, help="Extra mapping CSVs built into the same font (e.g. other romanizations). The base glyphs are shared; stylistic sets ss01 (the -m mapping, default), ss02, ... switch between the schemes. Not available with --marks.")
     parser.add_argument('-ay', '--anno-y-offset', type=float, default=0.7, help="Y offset in (percentage) for annotation string")
     parser.add_argument('-by', '--base-y-offset', type=float, default=0.0, help="Y offset in (percentage) for base font string (default: 0.0)")
     parser.add_argument('-bs', '--base-scale', type=float, default=0.60, help="The scaling factor for the base font")
@@ -196,13 +323,48 @@ if __name__ == "__main__":
     parser.add_argument('-fhk', help="Replace with the new Traditional Chinese family name (Hongkong)")
     parser.add_argument('-tp', '--top-padding', type=float, default=None, help="Top padding percentage (e.g., 0.1, -0.60). Overrides auto-height default behavior.")
     parser.add_argument('-bp', '--bottom-padding', type=float, default=None, help="Bottom padding percentage (e.g., -0.60, 0.1). Overrides auto-height default behavior.")
+    parser.add_argument('--dry-run', action='store_true', help="Only load the mapping and estimate glyph count, GSUB size, output size and build time.")
+    parser.add_argument('--calibrate', action='store_true', help="Search anno scale, y offsets and spacing that satisfy the layout goals using cached glyph bounds, print them as CLI arguments and exit.")
+    parser.add_argument('--target-ascender', type=float, default=None, help="Calibration goal: highest allowed point (percentage of UPM). (default: hhea ascent)")
+    parser.add_argument('--target-descender', type=float, default=None, help="Calibration goal: lowest allowed point (percentage of UPM, negative below baseline). (default: hhea descent)")
+    parser.add_argument('--min-gap', type=float, default=0.02, help="Calibration goal: minimum vertical gap (percentage of UPM) between base glyph and annotation. (default: 0.02)")
+    parser.add_argument('--calibrate-output', default=None, help="Also write the calibrated parameters to this JSON file.")
+    parser.add_argument('--prune-word-rules', choices=PRUNE_MODES, default=PRUNE_SAFE, help="Remove word rules that cannot change shaping: duplicates, unreachable rules, default-only words and words covered by a shorter word with the same substitutions. 'all' also removes default-only words that block overlapping words. (default: safe)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of processes drawing outlines. Above 1, the mapping is read while fonts load and GSUB is built in parallel with the outlines. (default: 1)")
+    parser.add_argument('--cu2qu-max-err', type=float, default=DEFAULT_CU2QU_MAX_ERR, help=f"Maximum error (percentage of UPM) when converting CFF/OTF outlines to quadratic curves. Converted outlines are cached per font. (default: {DEFAULT_CU2QU_MAX_ERR})")
+    parser.add_argument('--simplify', type=float, default=None, metavar='TOLERANCE', help="Remove outline points that do not change a glyph by more than TOLERANCE font units after scaling: duplicate points after rounding, collinear points and nearly flat curves. (default: off)")
+    parser.add_argument('--marks', action='store_true', help="Mark attachment mode: one scaled glyph per character and one zero-width mark per reading, combined by GSUB multiple substitution and positioned by GPOS mark-to-base anchors, instead of one merged glyph per character and reading.")
+    parser.add_argument('--group-variants', action='store_true', help="Place each character's variant glyphs right after its base glyph (one contiguous GID block per character) instead of appending them at the end of the glyph order.")
+    parser.add_argument('--glyph-source-size', type=int, default=GLYPH_SOURCE_SIZE, help=f"Keep at most N decompiled input glyphs in memory while drawing (LRU; default: {GLYPH_SOURCE_SIZE}). Processed glyphs are released right away.")
+    parser.add_argument('--max-word-rules', type=int, default=None, help="Keep at most N word rules (after pruning), ranked by the word's weight in the mapping CSV and then by how many characters the rule changes; the cut rules are reported.")
+    parser.add_argument('--max-word-rule-bytes', type=int, default=None, help="Like --max-word-rules, but limit the approximate size of the kept word rules in bytes.")
+    parser.add_argument('--top-chars', type=int, default=None, metavar='N', help="Quick/lite build: only the N characters with the highest total weight in the mapping CSV and the words made only of them. Only the glyphs kept for them are drawn and the font is subset as with -opt.")
+    parser.add_argument('--debug', action='store_true', help="Same as --log-level debug: also lists every word rule written to GSUB (word, readings and the substituted positions).")
+    parser.add_argument('--shard-queue', default=None, metavar='DIR', help="Split outline drawing into shard jobs in the shared directory DIR. This process and -j local workers draw them; more workers (also on other machines sharing DIR) can join with 'python3 shard_queue.py DIR'. GSUB is built once and the shards are merged in order.")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help=f"Glyphs (including variants) per shard for --shard-queue. (default: {SHARD_SIZE})")
+    parser.add_argument('--checkpoint-dir', nargs='?', const=CHECKPOINT_DIR, default=None, metavar='DIR', help=f"Save the parsed mapping, the drawn glyphs and the font after GSUB in DIR (default: {CHECKPOINT_DIR}) and resume from the latest checkpoint whose inputs (fonts, mapping, options and code) still match, e.g. to only rebuild GSUB or redo subsetting and saving.")
+    parser.add_argument('--qa', action='store_true', help="After drawing, check every glyph for base/annotation overlap, overflow of the advance width (and how much --fit compresses or would compress each annotation) and glyphs outside the vertical metrics, and print the worst cases of each kind.")
+    parser.add_argument('--qa-report', default=None, metavar='FILE', help="Like --qa, and write all found issues ranked by severity to FILE (CSV).")
+    parser.add_argument('--variant-index', action='store_true', help="Also write which digit (or 丅 + Chinese numeral) selects which reading of each character, as a compact binary index (.variants.bin: sorted code points with offsets into a reading string table) and a JSON fallback (.variants.json), for editors and input methods.")
+    parser.add_argument('--flavors', default="ttf,woff", help=f"Comma-separated output formats, some of {','.join(FLAVORS)}. (default: ttf,woff)")
+    parser.add_argument('--no-size-report', action='store_true', help="Do not print the per-table size report (TTF, WOFF, WOFF2 and GSUB by lookup type) after saving.")
+    parser.add_argument('--size-budget', default=None, help="JSON file of size budgets, e.g. {\"*:total\": \"5%%\", \"woff:GSUB\": \"20%%\", \"ttf:glyf\": 8000000}. Percentages limit growth over the size baseline, numbers cap the size in bytes. The build fails (exit code 1) when a budget is exceeded.")
+    parser.add_argument('--size-baseline', default=SIZE_BASELINE, help=f"JSON file with the table sizes that --size-budget percentages compare against. (default: {SIZE_BASELINE})")
+    parser.add_argument('--update-size-baseline', action='store_true', help="Save this build's table sizes as the new size baseline (budgets are reported but do not fail the build).")
+    parser.add_argument('--params', default=None, help="JSON file with parameters overriding the command line (keys as in main(), e.g. the --calibrate-output file). Watched in --watch mode.")
+    parser.add_argument('--watch', action='store_true', help="Keep fonts, mapping and outlines loaded and rebuild the .ttf/.woff whenever the mapping CSV or --params file changes. Only outlines of new or changed readings are redrawn.")
+    parser.add_argument('--watch-interval', type=float, default=WATCH_INTERVAL, help=f"Polling interval in seconds for --watch. (default: {WATCH_INTERVAL})")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only print warnings and errors (same as --log-level warning); also skips the size report.")
+    parser.add_argument('--log-level', choices=tuple(build_log.LEVELS), default="info", help="Lowest level of messages to print. Per-row and per-glyph events (e.g. skipped mapping rows) are only counted and summarized unless the level is debug. (default: info)")
+    parser.add_argument('--log-detail', default=None, metavar='FILE', help="Write every message and every counted event (e.g. each skipped mapping row) to FILE as JSON Lines.")
+    parser.add_argument('--profile-log', default=PROFILE_LOG, help=f"JSON Lines file recording each build's timings and table sizes, used to calibrate --dry-run. Empty to disable. (default: {PROFILE_LOG})")
 
     try:
         options = parser.parse_args()
     except:
         parser.print_help()
         exit()
-    main(
+    main_args = dict(
         base_font_file = options.base_font_file, 
         anno_font_file = options.anno_font_file, 
         output_prefix = options.output_prefix, 
@@ -227,5 +389,45 @@ if __name__ == "__main__":
         auto_width = options.auto_width,
         auto_height = options.auto_height,
         top_padding_percent=options.top_padding,
-        bottom_padding_percent=options.bottom_padding
-    )
\ No newline at end of file
+        bottom_padding_percent=options.bottom_padding,
+        dry_run=options.dry_run,
+        profile_log=options.profile_log,
+        calibrate_params=options.calibrate,
+        target_ascender=options.target_ascender,
+        target_descender=options.target_descender,
+        min_gap=options.min_gap,
+        calibrate_output=options.calibrate_output,
+        prune_word_rules=options.prune_word_rules,
+        jobs=options.jobs,
+        cu2qu_max_err=options.cu2qu_max_err,
+        simplify_tolerance=options.simplify,
+        mark_attachment=options.marks,
+        group_variants=options.group_variants,
+        glyph_source_size=options.glyph_source_size,
+        scheme_mappings=options.schemes or (),
+        max_word_rules=options.max_word_rules,
+        max_word_rule_bytes=options.max_word_rule_bytes,
+        top_chars=options.top_chars,
+        shard_queue=options.shard_queue,
+        shard_size=options.shard_size,
+        checkpoint_dir=options.checkpoint_dir,
+        qa=options.qa,
+        qa_report=options.qa_report,
+        variant_index=options.variant_index,
+        flavors=tuple(f.strip() for f in options.flavors.split(",") if f.strip()),
+        size_report=not (options.no_size_report or options.quiet),
+        size_budget=options.size_budget,
+        size_baseline=options.size_baseline,
+        update_size_baseline=options.update_size_baseline,
+        watch_mode=options.watch,
+        params_file=options.params,
+        watch_interval=options.watch_interval
+    )
+    # 參數檔中的值覆蓋命令列參數 (例如 --calibrate-output 的輸出)
+    if options.params:
+        main_args.update(load_params_file(options.params, main_args))
+    build_log.configure("debug" if options.debug else "warning" if options.quiet else options.log_level, options.log_detail)
+    try:
+        main(**main_args)
+    finally:
+        build_log.close()